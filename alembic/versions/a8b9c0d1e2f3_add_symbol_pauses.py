@@ -0,0 +1,35 @@
+"""add durable symbol-scope circuit breaker pauses
+
+Revision ID: a8b9c0d1e2f3
+Revises: f6a7b8c9d0e1
+Create Date: 2025-10-06 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8b9c0d1e2f3'
+down_revision: Union[str, Sequence[str], None] = 'f6a7b8c9d0e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create the (user, symbol) pause table, indexed by expiry for purging."""
+    op.create_table(
+        'symbol_pauses',
+        sa.Column('user_telegram_id', sa.BigInteger(), primary_key=True),
+        sa.Column('symbol', sa.String(length=30), primary_key=True),
+        sa.Column('paused_until', sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index('ix_symbol_pauses_paused_until', 'symbol_pauses', ['paused_until'])
+
+
+def downgrade() -> None:
+    """Drop the symbol pause table."""
+    op.drop_index('ix_symbol_pauses_paused_until', table_name='symbol_pauses')
+    op.drop_table('symbol_pauses')
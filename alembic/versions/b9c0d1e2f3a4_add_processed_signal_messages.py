@@ -0,0 +1,36 @@
+"""add persistent dedupe of processed signal messages
+
+Revision ID: b9c0d1e2f3a4
+Revises: a8b9c0d1e2f3
+Create Date: 2025-10-08 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b9c0d1e2f3a4'
+down_revision: Union[str, Sequence[str], None] = 'a8b9c0d1e2f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create the (chat, message, content hash) dedupe table, indexed by age for TTL eviction."""
+    op.create_table(
+        'processed_signal_messages',
+        sa.Column('chat_id', sa.BigInteger(), primary_key=True),
+        sa.Column('message_id', sa.BigInteger(), primary_key=True),
+        sa.Column('content_hash', sa.String(length=64), primary_key=True),
+        sa.Column('processed_at', sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index('ix_processed_signal_messages_processed_at', 'processed_signal_messages', ['processed_at'])
+
+
+def downgrade() -> None:
+    """Drop the signal dedupe table."""
+    op.drop_index('ix_processed_signal_messages_processed_at', table_name='processed_signal_messages')
+    op.drop_table('processed_signal_messages')
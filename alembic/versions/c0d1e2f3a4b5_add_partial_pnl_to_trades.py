@@ -0,0 +1,30 @@
+"""add realized partial pnl of the day to trades
+
+Revision ID: c0d1e2f3a4b5
+Revises: b9c0d1e2f3a4
+Create Date: 2025-10-09 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c0d1e2f3a4b5'
+down_revision: Union[str, Sequence[str], None] = 'b9c0d1e2f3a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Persist realized partial P/L (and its day) so the daily ledger can be re-seeded after a restart."""
+    op.add_column('trades', sa.Column('partial_pnl', sa.Float(), nullable=True))
+    op.add_column('trades', sa.Column('partial_pnl_day', sa.Date(), nullable=True))
+
+
+def downgrade() -> None:
+    """Remove the partial P/L columns."""
+    op.drop_column('trades', 'partial_pnl_day')
+    op.drop_column('trades', 'partial_pnl')
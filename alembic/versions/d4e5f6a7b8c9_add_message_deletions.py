@@ -0,0 +1,40 @@
+"""add message deletion schedule
+
+Revision ID: d4e5f6a7b8c9
+Revises: c12345d6789a
+Create Date: 2025-10-01 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4e5f6a7b8c9'
+down_revision: Union[str, Sequence[str], None] = 'c12345d6789a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create the indexed schedule used by the message cleanup worker."""
+    op.create_table(
+        'message_deletions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('chat_id', sa.BigInteger(), nullable=False),
+        sa.Column('message_id', sa.BigInteger(), nullable=False),
+        sa.Column('delete_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False, server_default='alert'),
+        sa.Column('trade_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.UniqueConstraint('chat_id', 'message_id', name='_deletion_chat_message_uc'),
+    )
+    op.create_index('ix_message_deletions_delete_at', 'message_deletions', ['delete_at'])
+
+
+def downgrade() -> None:
+    """Drop the message deletion schedule."""
+    op.drop_index('ix_message_deletions_delete_at', table_name='message_deletions')
+    op.drop_table('message_deletions')
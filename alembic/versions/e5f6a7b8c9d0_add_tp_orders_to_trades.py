@@ -0,0 +1,28 @@
+"""add exchange take-profit ladder to trades
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2025-10-03 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f6a7b8c9d0'
+down_revision: Union[str, Sequence[str], None] = 'd4e5f6a7b8c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Store the reduce-only TP orders placed at entry."""
+    op.add_column('trades', sa.Column('tp_orders', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Remove the TP ladder column."""
+    op.drop_column('trades', 'tp_orders')
@@ -0,0 +1,28 @@
+"""add materialized exit plan to trades
+
+Revision ID: f6a7b8c9d0e1
+Revises: e5f6a7b8c9d0
+Create Date: 2025-10-04 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6a7b8c9d0e1'
+down_revision: Union[str, Sequence[str], None] = 'e5f6a7b8c9d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Store the per-TP exit plan computed at entry."""
+    op.add_column('trades', sa.Column('exit_plan', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Remove the exit plan column."""
+    op.drop_column('trades', 'exit_plan')
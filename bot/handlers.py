@@ -27,7 +27,7 @@ from .keyboards import (
     initial_stop_menu_keyboard,
     tp_presets_keyboard,
 )
-from utils.security import encrypt_data, decrypt_data
+from utils.security import encrypt_data, get_user_credentials, invalidate_user_credentials
 from services.bybit_service import (
     get_account_info, 
     close_partial_position, 
@@ -38,7 +38,13 @@ from utils.config import ADMIN_ID
 from database.crud import get_user_by_id
 from core.trade_manager import _execute_trade, _execute_limit_order_for_user
 from core.performance_service import generate_performance_report
+from core.message_cleanup import schedule_trade_card_deletion
+from core.breaker_counters import forget_trade
+from core.daily_pnl_ledger import record_partial_close
+from core.position_tracker import forget_trade_state
 from services.currency_service import get_usd_to_brl_rate
+from services.wallet_cache import get_cached_account_info, invalidate_wallet
+from utils.tracing import latency_summary, recent_traces_count
 from sqlalchemy.sql import func
 
 # Estados para as conversas
@@ -816,9 +822,8 @@ async def start_bankroll_wizard_handler(update: Update, context: ContextTypes.DE
         user = db.query(User).filter(User.telegram_id == query.from_user.id).first()
         if user and user.api_key_encrypted and user.api_secret_encrypted:
             try:
-                api_key = decrypt_data(user.api_key_encrypted)
-                api_secret = decrypt_data(user.api_secret_encrypted)
-                account = await get_account_info(api_key, api_secret)
+                api_key, api_secret = get_user_credentials(user)
+                account = await get_cached_account_info(user.telegram_id, api_key, api_secret)
                 if account.get('success'):
                     detected_equity = float(account.get('data', {}).get('total_equity', 0.0) or 0.0)
             except Exception as e:
@@ -1247,6 +1252,8 @@ async def receive_api_secret(update: Update, context: ContextTypes.DEFAULT_TYPE)
         # Bot inicia pausado após conectar a Bybit
         user_to_update.is_active = False
         db.commit()
+        invalidate_user_credentials(telegram_id)
+        invalidate_wallet(telegram_id)
 
         await context.bot.edit_message_text(
             chat_id=update.effective_chat.id,
@@ -1631,6 +1638,8 @@ async def remove_api_action(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 user_to_update.api_key_encrypted = None
                 user_to_update.api_secret_encrypted = None
                 db.commit()
+                invalidate_user_credentials(telegram_id)
+                invalidate_wallet(telegram_id)
             await query.edit_message_text("✅ Suas chaves de API foram removidas.")
         finally:
             db.close()
@@ -1666,8 +1675,7 @@ async def my_positions_handler(update: Update, context: ContextTypes.DEFAULT_TYP
             await query.edit_message_text("Você ainda não configurou suas chaves de API.")
             return
 
-        api_key = decrypt_data(user.api_key_encrypted)
-        api_secret = decrypt_data(user.api_secret_encrypted)
+        api_key, api_secret = get_user_credentials(user)
 
         active_trades = db.query(Trade).filter(
             Trade.user_telegram_id == user_id,
@@ -1809,8 +1817,7 @@ async def pending_positions_handler(update: Update, context: ContextTypes.DEFAUL
             await query.edit_message_text("Você ainda não configurou suas chaves de API.")
             return
 
-        api_key = decrypt_data(user.api_key_encrypted)
-        api_secret = decrypt_data(user.api_secret_encrypted)
+        api_key, api_secret = get_user_credentials(user)
 
         pendentes = db.query(PendingSignal).filter_by(user_telegram_id=user_id).order_by(PendingSignal.id.desc()).all()
 
@@ -1954,8 +1961,7 @@ async def execute_cancel_pending_handler(update: Update, context: ContextTypes.D
             return
 
         user = db.query(User).filter_by(telegram_id=user_id).first()
-        api_key = decrypt_data(user.api_key_encrypted)
-        api_secret = decrypt_data(user.api_secret_encrypted)
+        api_key, api_secret = get_user_credentials(user)
 
         resp = await cancel_order(api_key, api_secret, p.order_id, p.symbol)
         if not resp.get("success"):
@@ -2001,11 +2007,10 @@ async def user_dashboard_handler(update: Update, context: ContextTypes.DEFAULT_T
             await query.edit_message_text("Você precisa configurar sua API primeiro.", reply_markup=main_menu_keyboard(telegram_id=user_id))
             return
 
-        api_key = decrypt_data(user.api_key_encrypted)
-        api_secret = decrypt_data(user.api_secret_encrypted)
+        api_key, api_secret = get_user_credentials(user)
 
         # Busca o saldo e a cotação em paralelo para mais eficiência
-        account_info_task = get_account_info(api_key, api_secret)
+        account_info_task = get_cached_account_info(user.telegram_id, api_key, api_secret)
         brl_rate_task = get_usd_to_brl_rate()
         account_info, brl_rate = await asyncio.gather(account_info_task, brl_rate_task)
 
@@ -2098,6 +2103,32 @@ async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     context.user_data['last_menu_msg_id'] = getattr(msg, 'message_id', None)
 
+async def admin_latency_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/latency [N]: p50/p95 por etapa dos últimos N sinais (somente ADMIN)."""
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("Você não tem permissão para usar este comando.")
+        return
+    try:
+        last_n = max(1, int(context.args[0])) if context.args else 50
+    except (ValueError, IndexError):
+        last_n = 50
+
+    summary = latency_summary(last_n)
+    if not summary:
+        await update.message.reply_text("Nenhum sinal rastreado ainda.")
+        return
+
+    order = ["telegram", "parse", "queue", "eligibility", "prewarm", "fanout",
+             "filters", "sizing", "set_leverage", "place_order", "fill_confirm", "total"]
+    names = [n for n in order if n in summary] + sorted(n for n in summary if n not in order)
+    lines = [f"{'etapa':<13}{'n':>5}{'p50':>9}{'p95':>9}{'máx':>9}"]
+    for name in names:
+        st = summary[name]
+        lines.append(f"{name:<13}{st['n']:>5}{st['p50'] * 1000:>7.0f}ms{st['p95'] * 1000:>7.0f}ms{st['max'] * 1000:>7.0f}ms")
+    text = (f"⏱️ <b>Latência de sinais</b> (últimos {min(last_n, recent_traces_count())})\n"
+            f"<pre>{html.escape(chr(10).join(lines))}</pre>")
+    await update.message.reply_text(text, parse_mode='HTML')
+
 async def admin_create_invite_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Gera e mostra um novo código de convite (somente ADMIN)."""
     query = update.callback_query
@@ -2247,6 +2278,8 @@ async def select_topic_to_monitor(update: Update, context: ContextTypes.DEFAULT_
     finally:
         db.close()
 
+    # O listener do Telethon mantém os alvos em memória: pede a recarga
+    await comm_queue.put({"action": "refresh_targets"})
     request_data = {
         "action": "list_topics",
         "chat_id": query.message.chat_id,
@@ -2471,8 +2504,7 @@ async def execute_manual_close_handler(update: Update, context: ContextTypes.DEF
             return
 
         user = db.query(User).filter_by(telegram_id=user_id).first()
-        api_key = decrypt_data(user.api_key_encrypted)
-        api_secret = decrypt_data(user.api_secret_encrypted)
+        api_key, api_secret = get_user_credentials(user)
 
         price_result = await get_market_price(trade_to_close.symbol)
         current_price = price_result["price"] if price_result.get("success") else trade_to_close.entry_price
@@ -2496,8 +2528,13 @@ async def execute_manual_close_handler(update: Update, context: ContextTypes.DEF
             pnl = (current_price - trade_to_close.entry_price) * pnl_qty if trade_to_close.side == 'LONG' else (trade_to_close.entry_price - current_price) * pnl_qty
 
             trade_to_close.status = 'CLOSED_MANUAL'
+            forget_trade(trade_to_close.id)
+            forget_trade_state(trade_to_close.id)
             trade_to_close.closed_at = func.now()
             trade_to_close.closed_pnl = pnl
+            # closed_pnl aqui cobre só o restante; parciais anteriores já estão no ledger
+            record_partial_close(db, trade_to_close, current_price, pnl_qty)
+            schedule_trade_card_deletion(db, user, trade_to_close)
             db.commit()
 
             resultado_str = "LUCRO" if pnl >= 0 else "PREJUÍZO"
@@ -3195,8 +3232,7 @@ async def toggle_bot_status_handler(update: Update, context: ContextTypes.DEFAUL
             alert_message = "Bot PAUSADO."
 
             # Mantém a lógica de cancelar ordens pendentes ao pausar
-            api_key = decrypt_data(user.api_key_encrypted)
-            api_secret = decrypt_data(user.api_secret_encrypted)
+            api_key, api_secret = get_user_credentials(user)
             pendentes = db.query(PendingSignal).filter_by(user_telegram_id=user_id).all()
             canceladas = 0
             for p in pendentes:
@@ -0,0 +1,153 @@
+"""
+Contadores em memória de trades ativos no prejuízo, para o disjuntor.
+
+O disjuntor perguntava ao banco, por usuário e sinal, quantos trades ativos têm
+unrealized_pnl_pct < 0 (no lado, no símbolo ou no total). O rastreador já
+atualiza esse P/L a cada ciclo; aqui ele também mantém, por usuário, o conjunto
+de trades perdedores e as contagens por lado, por símbolo e global. A checagem
+do disjuntor vira leitura O(1).
+
+Atualização:
+  - observe_trade(): a cada P/L novo (muda de sinal -> entra/sai do conjunto);
+  - sync_user_trades(): no início do ciclo do usuário, descarta trades que não
+    estão mais ativos e registra os novos;
+  - forget_trade(): ao confirmar fechamento/ghost.
+Na partida do rastreador (ou na primeira consulta, o que vier antes) os
+contadores são semeados com uma única consulta ao banco.
+"""
+import logging
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from database.models import Trade
+
+logger = logging.getLogger(__name__)
+
+
+class _UserLosses:
+    __slots__ = ("trades", "by_side", "by_symbol")
+
+    def __init__(self):
+        self.trades: Dict[int, Tuple[str, str]] = {}  # trade_id -> (side, symbol)
+        self.by_side: Dict[str, int] = {}
+        self.by_symbol: Dict[str, int] = {}
+
+    def add(self, trade_id: int, side: str, symbol: str) -> None:
+        if trade_id in self.trades:
+            if self.trades[trade_id] == (side, symbol):
+                return
+            self.remove(trade_id)
+        self.trades[trade_id] = (side, symbol)
+        self.by_side[side] = self.by_side.get(side, 0) + 1
+        self.by_symbol[symbol] = self.by_symbol.get(symbol, 0) + 1
+
+    def remove(self, trade_id: int) -> None:
+        key = self.trades.pop(trade_id, None)
+        if key is None:
+            return
+        side, symbol = key
+        for counter, k in ((self.by_side, side), (self.by_symbol, symbol)):
+            left = counter.get(k, 0) - 1
+            if left > 0:
+                counter[k] = left
+            else:
+                counter.pop(k, None)
+
+
+_USERS: Dict[int, _UserLosses] = {}
+_OWNER: Dict[int, int] = {}  # trade_id -> user_id
+_LOCK = threading.Lock()
+_seeded = False
+
+
+def _is_losing(trade) -> bool:
+    # Mesmo critério da consulta antiga: status exatamente ACTIVE
+    pnl = getattr(trade, "unrealized_pnl_pct", None)
+    return getattr(trade, "status", None) == 'ACTIVE' and pnl is not None and float(pnl) < 0
+
+
+def _apply(user_id: int, trade_id: int, side: str, symbol: str, losing: bool) -> None:
+    if losing:
+        _USERS.setdefault(user_id, _UserLosses()).add(trade_id, side, symbol)
+        _OWNER[trade_id] = user_id
+    else:
+        _drop(trade_id)
+
+
+def _drop(trade_id: int) -> None:
+    user_id = _OWNER.pop(trade_id, None)
+    if user_id is None:
+        return
+    losses = _USERS.get(user_id)
+    if losses is not None:
+        losses.remove(trade_id)
+        if not losses.trades:
+            del _USERS[user_id]
+
+
+def observe_trade(trade) -> None:
+    """Registra o P/L atual de um trade (entra/sai do conjunto de perdedores)."""
+    if getattr(trade, "id", None) is None:
+        return
+    with _LOCK:
+        _apply(trade.user_telegram_id, trade.id, (trade.side or "").upper(), trade.symbol, _is_losing(trade))
+
+
+def sync_user_trades(user_id: int, active_trades: Iterable) -> None:
+    """Alinha o usuário com a lista de trades ativos do ciclo (remove os que saíram)."""
+    active_trades = list(active_trades)
+    active_ids = {t.id for t in active_trades}
+    with _LOCK:
+        losses = _USERS.get(user_id)
+        if losses is not None:
+            for trade_id in [tid for tid in losses.trades if tid not in active_ids]:
+                _drop(trade_id)
+        for t in active_trades:
+            _apply(user_id, t.id, (t.side or "").upper(), t.symbol, _is_losing(t))
+
+
+def forget_trade(trade_id: Optional[int]) -> None:
+    if trade_id is None:
+        return
+    with _LOCK:
+        _drop(trade_id)
+
+
+def ensure_seeded(db) -> None:
+    """Semeia os contadores a partir do banco (uma vez por processo)."""
+    global _seeded
+    if _seeded:
+        return
+    rows = db.query(Trade.id, Trade.user_telegram_id, Trade.side, Trade.symbol).filter(
+        Trade.status == 'ACTIVE',
+        Trade.unrealized_pnl_pct < 0,
+    ).all()
+    with _LOCK:
+        if _seeded:
+            return
+        for trade_id, user_id, side, symbol in rows:
+            _apply(user_id, trade_id, (side or "").upper(), symbol, True)
+        _seeded = True
+    logger.info("[breaker] contadores semeados: %d trade(s) no prejuízo", len(rows))
+
+
+def losing_count(db, user_id: int, scope: str, side: Optional[str] = None, symbol: Optional[str] = None) -> int:
+    """Trades ativos no prejuízo do usuário no escopo do disjuntor (GLOBAL | SYMBOL | SIDE)."""
+    ensure_seeded(db)
+    with _LOCK:
+        losses = _USERS.get(user_id)
+        if losses is None:
+            return 0
+        if scope == "GLOBAL":
+            return len(losses.trades)
+        if scope == "SYMBOL":
+            return losses.by_symbol.get(symbol, 0)
+        return losses.by_side.get((side or "").upper(), 0)
+
+
+def reset() -> None:
+    global _seeded
+    with _LOCK:
+        _USERS.clear()
+        _OWNER.clear()
+        _seeded = False
@@ -0,0 +1,122 @@
+"""
+Fila de confirmação de fechamento.
+
+O rastreador só enfileira trades "suspeitos de fechados" (ausentes da corretora
+por N ciclos). Este worker confirma cada um em segundo plano, com agenda própria
+de novas tentativas e limite de concorrência, sem travar o ciclo de 15s:
+  - tentativa imediata e depois após cada atraso de TF_CLOSE_CONFIRM_RETRY_SECONDS;
+  - se a posição reaparecer (missing_cycles zerado) ou o trade já estiver fechado, desiste;
+  - sem dados após a última tentativa → CLOSED_GHOST.
+"""
+import asyncio
+import logging
+import os
+from typing import List, Set, Tuple
+
+from database.session import SessionLocal
+from database.models import Trade, User
+from utils.security import get_user_credentials
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_delays(raw: str) -> List[float]:
+    try:
+        delays = [max(0.0, float(x)) for x in raw.split(",") if x.strip()]
+    except Exception:
+        delays = []
+    return delays or [6.0, 12.0, 24.0]
+
+
+_RETRY_DELAYS = _parse_delays(os.getenv("TF_CLOSE_CONFIRM_RETRY_SECONDS", "6,12,24") or "")
+try:
+    _CONCURRENCY = max(1, int(os.getenv("TF_CLOSE_CONFIRM_CONCURRENCY", "4") or "4"))
+except Exception:
+    _CONCURRENCY = 4
+
+_QUEUE: "asyncio.Queue[Tuple[int, int]]" = asyncio.Queue()
+_INFLIGHT: Set[int] = set()
+# Referências fortes das tarefas em andamento (o loop só guarda referências fracas)
+_JOBS: Set["asyncio.Task[None]"] = set()
+
+
+def enqueue_close_confirmation(user_id: int, trade_id: int) -> bool:
+    """Enfileira a confirmação. Retorna False se o trade já está na fila/em andamento."""
+    if trade_id in _INFLIGHT:
+        return False
+    _INFLIGHT.add(trade_id)
+    _QUEUE.put_nowait((user_id, trade_id))
+    return True
+
+
+def pending_confirmations() -> int:
+    return len(_INFLIGHT)
+
+
+async def _attempt(application, user_id: int, trade_id: int, *, last: bool) -> bool:
+    """Uma tentativa em sessão própria. Retorna True quando o job terminou (confirmado, desistiu ou ghost)."""
+    from core import position_tracker as pt
+
+    db = SessionLocal()
+    try:
+        trade = db.query(Trade).filter(Trade.id == trade_id).first()
+        if trade is None or "CLOSED" in (trade.status or "").upper():
+            return True
+        if int(trade.missing_cycles or 0) == 0:
+            logger.info("[close-confirm] %s reapareceu na corretora; confirmação cancelada.", trade.symbol)
+            return True
+        user = db.query(User).filter(User.telegram_id == user_id).first()
+        if user is None or not user.api_key_encrypted:
+            return True
+
+        fetch_fallback = pt._closed_info_fetcher(*get_user_credentials(user))
+        info = await pt._fetch_close_info(user, trade, fetch_fallback)
+        if not info and not last:
+            return False
+
+        final_text = pt._build_close_summary_text(trade, info)
+        if info:
+            if not pt._persist_confirmed_close(db, user, trade, info):
+                return last
+        else:
+            pt.mark_trade_as_ghost(db, user, trade)
+            db.commit()
+
+        if trade.notification_message_id:
+            pt.get_dispatcher(application).edit(user.telegram_id, trade.notification_message_id, final_text, parse_mode="HTML")
+        pt.clear_sync_flag(trade_id)
+        pt.forget_trade_state(trade_id)
+        logger.info("[close-confirm] job concluído trade_id=%s status=%s", trade_id, trade.status)
+        return True
+    except Exception:
+        db.rollback()
+        logger.exception("[close-confirm] falha na tentativa para trade_id=%s", trade_id)
+        return last
+    finally:
+        db.close()
+
+
+async def _run_job(application, user_id: int, trade_id: int, semaphore: asyncio.Semaphore) -> None:
+    schedule = [0.0] + list(_RETRY_DELAYS)
+    try:
+        for i, delay in enumerate(schedule):
+            if delay:
+                await asyncio.sleep(delay)
+            async with semaphore:
+                done = await _attempt(application, user_id, trade_id, last=(i == len(schedule) - 1))
+            if done:
+                return
+    finally:
+        _INFLIGHT.discard(trade_id)
+
+
+async def run_close_confirmation_worker(application) -> None:
+    """Consome a fila; cada trade vira uma tarefa, com no máximo _CONCURRENCY tentativas simultâneas."""
+    logger.info("Iniciando worker de confirmação de fechamento (concorrência=%d, agenda=%s)...",
+                _CONCURRENCY, ",".join(f"{d:g}" for d in _RETRY_DELAYS))
+    semaphore = asyncio.Semaphore(_CONCURRENCY)
+    while True:
+        user_id, trade_id = await _QUEUE.get()
+        job = asyncio.create_task(_run_job(application, user_id, trade_id, semaphore))
+        _JOBS.add(job)
+        job.add_done_callback(_JOBS.discard)
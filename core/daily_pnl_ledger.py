@@ -0,0 +1,144 @@
+"""
+P/L realizado do dia por usuário, mantido localmente para o guard-rail diário.
+
+Antes, a meta de lucro/limite de perda consultava get_daily_pnl na corretora
+(cache de 60s), decidindo com até um minuto de atraso numa sequência de perdas.
+Aqui cada usuário tem uma soma corrente do dia (America/Sao_Paulo), atualizada
+pelos eventos do rastreador:
+  - record_partial_close(): TP parcial/redução executada (estimativa preço × qtd),
+    também acumulada no próprio trade (partial_pnl/partial_pnl_day);
+  - record_trade_close(): fechamento confirmado — o closed_pnl do trade substitui
+    as estimativas parciais dele (idempotente por trade_id).
+A virada do dia zera a soma; na primeira leitura do dia (ou após reiniciar) ela
+é semeada do banco: closed_pnl dos trades fechados hoje e, para trades ainda
+abertos ou cujo closed_pnl não cobre o trade inteiro (manual/ghost), as
+parciais realizadas hoje. Nenhuma chamada à API.
+"""
+import logging
+import threading
+from datetime import date, datetime
+from typing import Dict, Optional
+
+import pytz
+from sqlalchemy import and_, or_
+
+from database.models import Trade
+
+logger = logging.getLogger(__name__)
+
+BR_TZ = pytz.timezone("America/Sao_Paulo")
+
+# closed_pnl desses fechamentos cobre só o restante (manual) ou é zerado (ghost)
+_PARTIAL_ONLY_STATUSES = ("CLOSED_MANUAL", "CLOSED_GHOST")
+
+
+class _DayLedger:
+    __slots__ = ("day", "total", "by_trade")
+
+    def __init__(self, day: date):
+        self.day = day
+        self.total = 0.0
+        self.by_trade: Dict[int, float] = {}
+
+    def set(self, trade_id: int, amount: float) -> None:
+        self.total += amount - self.by_trade.get(trade_id, 0.0)
+        self.by_trade[trade_id] = amount
+
+    def add(self, trade_id: int, amount: float) -> None:
+        self.set(trade_id, self.by_trade.get(trade_id, 0.0) + amount)
+
+
+_LEDGERS: Dict[int, _DayLedger] = {}
+_LOCK = threading.Lock()
+
+
+def _today() -> date:
+    return datetime.now(BR_TZ).date()
+
+
+def _day_of(ts: Optional[datetime]) -> date:
+    if not isinstance(ts, datetime):
+        return _today()
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=pytz.utc)
+    return ts.astimezone(BR_TZ).date()
+
+
+def _day_start_utc(day: date) -> datetime:
+    return BR_TZ.localize(datetime(day.year, day.month, day.day)).astimezone(pytz.utc)
+
+
+def _ledger(db, user_id: int) -> _DayLedger:
+    """Ledger de hoje do usuário; semeia do banco na primeira vez do dia."""
+    today = _today()
+    with _LOCK:
+        ledger = _LEDGERS.get(user_id)
+        if ledger is not None and ledger.day == today:
+            return ledger
+    day_start = _day_start_utc(today)
+    rows = db.query(
+        Trade.id, Trade.status, Trade.closed_pnl, Trade.closed_at, Trade.partial_pnl, Trade.partial_pnl_day,
+    ).filter(
+        Trade.user_telegram_id == user_id,
+        or_(
+            and_(Trade.closed_at >= day_start, Trade.closed_pnl.isnot(None)),
+            Trade.partial_pnl_day == today,
+        ),
+    ).all()
+    fresh = _DayLedger(today)
+    for trade_id, status, closed_pnl, closed_at, partial, partial_day in rows:
+        partial = float(partial or 0.0) if partial_day == today else None
+        closed_today = closed_pnl is not None and closed_at is not None and _day_of(closed_at) == today
+        if closed_today and (partial is None or status not in _PARTIAL_ONLY_STATUSES):
+            fresh.set(trade_id, float(closed_pnl))
+        elif partial is not None:
+            fresh.set(trade_id, partial)
+    with _LOCK:
+        ledger = _LEDGERS.get(user_id)
+        if ledger is not None and ledger.day == today:
+            return ledger  # outro caminho semeou enquanto consultávamos
+        _LEDGERS[user_id] = fresh
+    return fresh
+
+
+def record_partial_close(db, trade, exit_price: float, qty: float) -> None:
+    """Redução parcial executada: soma a estimativa (saída − entrada) × qtd ao dia."""
+    try:
+        entry = float(trade.entry_price or 0.0)
+        if entry <= 0 or qty <= 0 or exit_price <= 0:
+            return
+        sign = 1.0 if (trade.side or "").upper() == "LONG" else -1.0
+        amount = sign * (float(exit_price) - entry) * float(qty)
+        ledger = _ledger(db, trade.user_telegram_id)
+        with _LOCK:
+            ledger.add(trade.id, amount)
+        # Persistido no trade (o chamador faz o commit) para semear após reiniciar
+        if trade.partial_pnl_day != ledger.day:
+            trade.partial_pnl, trade.partial_pnl_day = 0.0, ledger.day
+        trade.partial_pnl = float(trade.partial_pnl or 0.0) + amount
+    except Exception:
+        logger.exception("[daily-pnl] falha ao registrar parcial de %s", getattr(trade, "symbol", "?"))
+
+
+def record_trade_close(db, trade) -> None:
+    """Fechamento confirmado: o closed_pnl do trade passa a ser a contribuição dele no dia."""
+    try:
+        if trade.closed_pnl is None or _day_of(trade.closed_at) != _today():
+            return
+        ledger = _ledger(db, trade.user_telegram_id)
+        with _LOCK:
+            ledger.set(trade.id, float(trade.closed_pnl))
+    except Exception:
+        logger.exception("[daily-pnl] falha ao registrar fechamento de %s", getattr(trade, "symbol", "?"))
+
+
+def daily_realized_pnl(db, user_id: int) -> float:
+    """P/L realizado de hoje (America/Sao_Paulo) do usuário."""
+    ledger = _ledger(db, user_id)
+    with _LOCK:
+        return ledger.total
+
+
+def reset() -> None:
+    with _LOCK:
+        _LEDGERS.clear()
@@ -0,0 +1,229 @@
+"""
+Plano de saída do trade, calculado uma vez na entrada.
+
+Para cada TP guardamos preço, quantidade (já no qtyStep do instrumento) e o SL
+que a execução libera quando o break-even já está ativo. O plano é persistido
+em Trade.exit_plan de forma compacta e avança por índice conforme os TPs
+executam; o rastreador só consulta, sem recalcular a distribuição a cada
+ciclo. Mudar a distribuição nas configurações no meio do trade não altera o
+plano já gravado.
+
+Formato: {"v": 1, "i": índices < i já executados, "x": executados fora de ordem (>= i),
+          "o": TPs já executados antes do plano, "n": total de TPs do sinal,
+          "tp": [[preço, qtd, sl_após], ...]}
+Um TP inferior que falhou (ou cuja perna foi cancelada) continua pendente mesmo
+que um TP superior execute no mesmo ciclo.
+"""
+import logging
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from services.bybit_service import INSTRUMENT_INFO_CACHE, get_instrument_info
+
+logger = logging.getLogger(__name__)
+
+PLAN_VERSION = 1
+
+
+def _compute_tp_distribution(strategy: str, total_tps: int) -> list[float]:
+    """Gera uma distribuição de percentuais (soma 100) para N TPs.
+    Suporta:
+      - 'EQUAL'          → igualitária
+      - 'FRONT_HEAVY'    → mais pesado nos primeiros TPs (decay exponencial leve)
+      - 'BACK_HEAVY'     → mais pesado nos últimos TPs (crescente linear)
+      - 'EXP_FRONT'      → mais pesado cedo (decay exponencial forte)
+      - Lista 'a,b,c,...'→ âncoras personalizadas (interpretação original)
+    """
+    if total_tps <= 0:
+        return []
+
+    sraw = (strategy or '').strip()
+    token = sraw.upper()
+
+    # Igualitária
+    if token == 'EQUAL' or token == '':
+        return [100.0 / total_tps] * total_tps
+
+    # Presets
+    if ',' not in sraw:
+        if token == 'FRONT_HEAVY':
+            r = 0.75  # decay moderado
+            weights = [r ** i for i in range(total_tps)]
+            s = sum(weights) or 1.0
+            return [w * (100.0 / s) for w in weights]
+        if token == 'EXP_FRONT':
+            r = 0.6  # decay mais agressivo (primeiros TPs mais pesados)
+            weights = [r ** i for i in range(total_tps)]
+            s = sum(weights) or 1.0
+            return [w * (100.0 / s) for w in weights]
+        if token == 'BACK_HEAVY':
+            # Crescente linear: 1,2,3,...,N (últimos TPs mais pesados)
+            weights = [i + 1 for i in range(total_tps)]
+            s = sum(weights) or 1.0
+            return [w * (100.0 / s) for w in weights]
+
+    # Custom anchors "50,30,20" (compatível com comportamento anterior)
+    try:
+        anchors = [max(0.0, float(x)) for x in sraw.replace('%', '').split(',') if x.strip()]
+    except Exception:
+        return [100.0 / total_tps] * total_tps
+    if not anchors:
+        return [100.0 / total_tps] * total_tps
+
+    # Normaliza âncoras (permite perfil arbitrário; mantém ordem e decai a cauda por estabilidade)
+    if len(anchors) >= 2 and anchors[-2] > 0:
+        decay = min(0.95, max(0.3, anchors[-1] / anchors[-2]))
+    else:
+        decay = 0.66
+
+    base = []
+    for i in range(total_tps):
+        if i < len(anchors):
+            base.append(anchors[i])
+        else:
+            nxt = base[-1] * decay if base else 1.0
+            if nxt < 1e-6:
+                nxt = 1e-6
+            base.append(nxt)
+
+    s = sum(base)
+    if s <= 0:
+        return [100.0 / total_tps] * total_tps
+    dist = [x * (100.0 / s) for x in base]
+    total = sum(dist)
+    if total != 100.0:
+        dist[-1] += (100.0 - total)
+    return dist
+
+
+def _floor_step(value: float, step: Optional[Decimal]) -> float:
+    if not step or step <= 0:
+        return float(value)
+    d = Decimal(str(value))
+    return float((d // step) * step)
+
+
+def build_exit_plan(
+    strategy: str,
+    base_qty: float,
+    remaining_qty: float,
+    targets: List[float],
+    *,
+    qty_step: Optional[Decimal] = None,
+    offset: int = 0,
+    total_targets: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Monta o plano para os alvos restantes.
+    base_qty: tamanho inicial (a distribuição é sobre ele); remaining_qty: o que ainda está aberto.
+    offset: quantos TPs do sinal já executaram (trades legados). O último TP leva o restante.
+    """
+    targets = [float(t) for t in (targets or [])]
+    if not targets:
+        return None
+    n = int(total_targets or (offset + len(targets)))
+    dist = _compute_tp_distribution(strategy, n)
+    remaining = max(0.0, float(remaining_qty or 0.0))
+
+    rows: List[List[Any]] = []
+    allocated = 0.0
+    for k, price in enumerate(targets):
+        if k == len(targets) - 1:
+            qty = max(0.0, remaining - allocated)
+        else:
+            try:
+                pct = float(dist[offset + k])
+            except IndexError:
+                pct = 100.0 / float(n)
+            qty = _floor_step(float(base_qty or 0.0) * pct / 100.0, qty_step)
+            qty = min(qty, max(0.0, remaining - allocated))
+            allocated += qty
+        # SL liberado pelo TP (com BE ativo): o próprio preço do alvo
+        rows.append([price, qty, price])
+
+    return {"v": PLAN_VERSION, "i": 0, "o": int(offset), "n": n, "tp": rows}
+
+
+async def _qty_step(symbol: str) -> Optional[Decimal]:
+    rules = INSTRUMENT_INFO_CACHE.get(symbol)
+    if rules is None:
+        rules = await get_instrument_info(symbol)
+    if rules and rules.get("success"):
+        return rules.get("qtyStep")
+    return None
+
+
+async def plan_trade_exits(trade, user) -> Optional[Dict[str, Any]]:
+    """Calcula o plano na abertura do trade (não faz commit)."""
+    targets = list(getattr(trade, "initial_targets", None) or [])
+    total = trade.remaining_qty if trade.remaining_qty is not None else trade.qty
+    plan = build_exit_plan(
+        getattr(user, "tp_distribution", "EQUAL"), trade.qty, total, targets,
+        qty_step=await _qty_step(trade.symbol),
+    )
+    trade.exit_plan = plan
+    return plan
+
+
+async def ensure_exit_plan(trade, user) -> Optional[Dict[str, Any]]:
+    """Plano do trade; trades legados (sem plano) ganham um a partir dos alvos restantes."""
+    plan = getattr(trade, "exit_plan", None)
+    if plan and plan.get("v") == PLAN_VERSION:
+        return plan
+    targets = list(getattr(trade, "initial_targets", None) or [])
+    if not targets:
+        return None
+    total_targets = int(getattr(trade, "total_initial_targets", 0) or 0) or len(targets)
+    remaining = trade.remaining_qty if trade.remaining_qty is not None else trade.qty
+    plan = build_exit_plan(
+        getattr(user, "tp_distribution", "EQUAL"), trade.qty, remaining, targets,
+        qty_step=await _qty_step(trade.symbol),
+        offset=max(0, total_targets - len(targets)), total_targets=total_targets,
+    )
+    trade.exit_plan = plan
+    logger.info("[exit-plan] plano criado para trade legado %s (%s TPs restantes)", trade.symbol, len(targets))
+    return plan
+
+
+def executed_tps(plan: Optional[Dict[str, Any]]) -> Set[int]:
+    """Índices do plano já executados (prefixo contíguo + fora de ordem)."""
+    if not plan:
+        return set()
+    return set(range(int(plan.get("i", 0)))) | {int(k) for k in plan.get("x", ())}
+
+
+def pending_tps(plan: Optional[Dict[str, Any]]) -> List[Tuple[int, float, float, float]]:
+    """[(índice, preço, qtd, sl_após)] dos TPs ainda não executados."""
+    if not plan:
+        return []
+    done = executed_tps(plan)
+    return [(k, row[0], row[1], row[2]) for k, row in enumerate(plan["tp"]) if k not in done]
+
+
+def tp_number(plan: Dict[str, Any], k: int) -> int:
+    """Número do TP no sinal (1-based), considerando os executados antes do plano."""
+    return int(plan.get("o", 0)) + k + 1
+
+
+def is_last_tp(plan: Dict[str, Any], k: int) -> bool:
+    return k == len(plan["tp"]) - 1
+
+
+def advance_exit_plan(trade, executed: Iterable[int]) -> Optional[Dict[str, Any]]:
+    """
+    Marca os TPs executados e sincroniza initial_targets (exibição) com os alvos
+    restantes. O índice só avança sobre o prefixo contíguo de executados.
+    """
+    plan = getattr(trade, "exit_plan", None)
+    executed = list(executed)
+    if not plan or not executed:
+        return plan
+    done = executed_tps(plan) | {int(k) for k in executed}
+    i = 0
+    while i in done:
+        i += 1
+    new_plan = dict(plan, i=i, x=sorted(k for k in done if k > i))
+    # Reatribui para o SQLAlchemy detectar a mudança nas colunas JSON
+    trade.exit_plan = new_plan
+    trade.initial_targets = [row[0] for k, row in enumerate(new_plan["tp"]) if k not in done]
+    return new_plan
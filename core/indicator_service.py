@@ -0,0 +1,205 @@
+"""
+Indicadores técnicos compartilhados por sinal.
+
+Os filtros de MA/RSI (e a confirmação de reversão do disjuntor) dependem só de
+(símbolo, timeframe, indicador, período) — a maioria dos usuários compartilha
+os mesmos valores. Para cada sinal:
+  1. required_indicators() levanta o conjunto distinto a partir das
+     configurações dos usuários elegíveis;
+  2. IndicatorSnapshot.prefetch() busca cada timeframe uma vez (cache de
+     k-lines com TTL) e calcula cada indicador uma vez;
+  3. o filtro de cada usuário vira uma comparação contra o resultado comum.
+
+Os valores vêm de core/indicators.py: o estado incremental de cada
+(símbolo, tf, indicador, período) avança só pelos candles fechados novos e o
+candle em formação entra via peek(), então um sinal com k-lines já vistas custa O(1).
+
+O snapshot do sinal fica num ContextVar: as tarefas do fan-out herdam o
+contexto, então _avaliar_sinal o encontra sem mudar assinaturas. Sem snapshot
+ativo (chamadas avulsas), um snapshot temporário é usado com o mesmo cache.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+from services.bybit_service import get_historical_klines
+from core.indicators import new_state
+
+logger = logging.getLogger(__name__)
+
+RSI_PERIOD = 14
+KLINE_LIMIT = 200
+
+try:
+    _KLINE_TTL = float(os.getenv("TF_KLINE_CACHE_SECONDS", "15") or "15")
+except Exception:
+    _KLINE_TTL = 15.0
+
+_MAX_STATES = 4096
+
+# (symbol, tf) -> (expira_em, Klines)
+_KLINE_CACHE: Dict[Tuple[str, str], Tuple[float, "Klines"]] = {}
+_KLINE_INFLIGHT: Dict[Tuple[str, str], "asyncio.Future"] = {}
+# (symbol, tf, indicador, período) -> [estado, startTime do último candle fechado aplicado]
+_STATES: Dict[Tuple[str, str, str, int], list] = {}
+_STATS: Dict[str, int] = {"kline_fetches": 0, "kline_hits": 0, "computed": 0, "candles_applied": 0}
+
+# Chave de indicador: (timeframe, "SMA" | "RSI", período)
+IndicatorKey = Tuple[str, str, int]
+
+
+class Klines:
+    """Candles em ordem cronológica crescente (o último é o candle em formação)."""
+
+    __slots__ = ("start", "high", "low", "close")
+
+    def __init__(self, rows):
+        arr = np.array([[float(r[0]), float(r[2]), float(r[3]), float(r[4])] for r in rows], dtype=float).reshape(-1, 4)
+        arr = arr[~np.isnan(arr).any(axis=1)]
+        arr = arr[np.argsort(arr[:, 0], kind="stable")]
+        self.start, self.high, self.low, self.close = arr[:, 0], arr[:, 1], arr[:, 2], arr[:, 3]
+
+    def __len__(self) -> int:
+        return len(self.close)
+
+
+async def get_klines(symbol: str, tf: str) -> Optional[Klines]:
+    """k-lines em ordem cronológica crescente, com cache TTL e uma única busca em voo por (símbolo, tf)."""
+    key = (symbol, str(tf))
+    cached = _KLINE_CACHE.get(key)
+    if cached and cached[0] > time.monotonic():
+        _STATS["kline_hits"] += 1
+        return cached[1]
+
+    pending = _KLINE_INFLIGHT.get(key)
+    if pending is not None:
+        _STATS["kline_hits"] += 1
+        return await pending
+
+    fut = asyncio.get_running_loop().create_future()
+    _KLINE_INFLIGHT[key] = fut
+    kl: Optional[Klines] = None
+    try:
+        _STATS["kline_fetches"] += 1
+        res = await get_historical_klines(symbol=symbol, interval=str(tf), limit=KLINE_LIMIT)
+        if res.get("success"):
+            kl = Klines(res["data"])
+            _KLINE_CACHE[key] = (time.monotonic() + _KLINE_TTL, kl)
+        else:
+            logger.warning(f"Não foi possível obter dados históricos para {symbol} no timeframe {tf}.")
+    except Exception:
+        logger.exception("[indicators] falha ao buscar k-lines %s/%s", symbol, tf)
+    finally:
+        _KLINE_INFLIGHT.pop(key, None)
+        fut.set_result(kl)
+    return kl
+
+
+def required_indicators(users: Iterable[Any]) -> Set[IndicatorKey]:
+    """Conjunto distinto de indicadores exigido pelos filtros (e pela reversão do disjuntor) dos usuários."""
+    keys: Set[IndicatorKey] = set()
+    for u in users:
+        if getattr(u, 'is_ma_filter_enabled', False):
+            keys.add((str(u.ma_timeframe), "SMA", int(u.ma_period)))
+        if getattr(u, 'is_rsi_filter_enabled', False):
+            keys.add((str(u.rsi_timeframe), "RSI", RSI_PERIOD))
+        if getattr(u, 'reversal_override_enabled', False):
+            tf = str(getattr(u, 'ma_timeframe', '60') or '60')
+            keys.add((tf, "SMA", int(getattr(u, 'ma_period', 50) or 50)))
+            keys.add((tf, "RSI", RSI_PERIOD))
+    return keys
+
+
+def _advance(symbol: str, tf: str, kind: str, period: int, kl: Klines) -> Optional[float]:
+    """Avança o estado incremental pelos candles fechados novos e espia o candle em formação."""
+    closed = len(kl) - 1
+    if closed < 1:
+        return None
+    key = (symbol, tf, kind, period)
+    entry = _STATES.get(key)
+    pos = 0
+    if entry is not None:
+        j = int(np.searchsorted(kl.start[:closed], entry[1]))
+        if j < closed and kl.start[j] == entry[1]:
+            pos = j + 1
+        else:
+            entry = None  # lacuna maior que a janela buscada: recomeça
+    if entry is None:
+        if len(_STATES) >= _MAX_STATES:
+            _STATES.clear()
+        entry = [new_state(kind, period), None]
+        _STATES[key] = entry
+    state = entry[0]
+    for i in range(pos, closed):
+        state.update(kl.close[i], kl.high[i], kl.low[i])
+    _STATS["candles_applied"] += closed - pos
+    entry[1] = kl.start[closed - 1]
+    return state.peek(kl.close[-1], kl.high[-1], kl.low[-1])
+
+
+class IndicatorSnapshot:
+    """Valores de indicadores de um símbolo para um sinal: cada chave é calculada uma vez."""
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self._values: Dict[IndicatorKey, Optional[Dict[str, float]]] = {}
+        self._klines: Dict[str, Optional[Klines]] = {}
+
+    async def _load(self, tf: str) -> Optional[Klines]:
+        if tf not in self._klines:
+            self._klines[tf] = await get_klines(self.symbol, tf)
+        return self._klines[tf]
+
+    def _compute(self, kl: Klines, tf: str, kind: str, period: int) -> Optional[Dict[str, float]]:
+        _STATS["computed"] += 1
+        value = _advance(self.symbol, tf, kind, period, kl)
+        if value is None:
+            return None
+        return {"close": float(kl.close[-1]), "value": float(value)}
+
+    async def prefetch(self, keys: Iterable[IndicatorKey]) -> None:
+        keys = [k for k in set(keys) if k not in self._values]
+        tfs = sorted({tf for tf, _, _ in keys})
+        await asyncio.gather(*(self._load(tf) for tf in tfs))
+        for key in keys:
+            await self.get(*key)
+
+    async def get(self, tf: str, kind: str, period: int) -> Optional[Dict[str, float]]:
+        """{"close", "value"} no candle mais recente, ou None sem dados suficientes."""
+        key = (str(tf), kind, int(period))
+        if key not in self._values:
+            kl = await self._load(key[0])
+            self._values[key] = self._compute(kl, *key) if kl is not None else None
+        return self._values[key]
+
+
+_CURRENT: "contextvars.ContextVar[Optional[IndicatorSnapshot]]" = contextvars.ContextVar("tf_indicator_snapshot", default=None)
+
+
+def activate_snapshot(snapshot: Optional[IndicatorSnapshot]) -> contextvars.Token:
+    return _CURRENT.set(snapshot)
+
+
+def reset_snapshot(token: contextvars.Token) -> None:
+    _CURRENT.reset(token)
+
+
+def snapshot_for(symbol: str) -> IndicatorSnapshot:
+    """Snapshot ativo do sinal (se for do mesmo símbolo) ou um novo, avulso."""
+    snap = _CURRENT.get()
+    if snap is not None and snap.symbol == symbol:
+        return snap
+    return IndicatorSnapshot(symbol)
+
+
+def indicator_stats(reset: bool = False) -> Dict[str, int]:
+    snapshot = dict(_STATS)
+    if reset:
+        for k in _STATS:
+            _STATS[k] = 0
+    return snapshot
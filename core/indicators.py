@@ -0,0 +1,197 @@
+"""
+Indicadores técnicos em NumPy (SMA, EMA, RSI de Wilder, ATR).
+
+Mesmos resultados do pandas_ta com os parâmetros padrão:
+  - sma: média simples, primeiro valor no candle `n`;
+  - ema: semente = SMA dos `n` primeiros, depois alpha = 2/(n+1) (presma do pandas_ta);
+  - rsi/atr: RMA = ewm(alpha=1/n, adjust=True, min_periods=n), como o rma do pandas_ta.
+
+Cada indicador tem um estado incremental: update() avança um candle fechado em
+O(1) e peek() devolve o valor com um candle ainda em formação, sem alterar o
+estado. EMA/RSI/ATR em lote alimentam o próprio estado incremental; a SMA em
+lote usa soma acumulada.
+"""
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+NAN = float("nan")
+
+
+class _RMA:
+    """ewm(alpha, adjust=True) com min_periods: numerador/denominador acumulados."""
+
+    __slots__ = ("decay", "min_periods", "num", "den", "count")
+
+    def __init__(self, length: int):
+        self.decay = 1.0 - 1.0 / length
+        self.min_periods = length
+        self.num = 0.0
+        self.den = 0.0
+        self.count = 0
+
+    def _next(self, x: float):
+        return x + self.decay * self.num, 1.0 + self.decay * self.den, self.count + 1
+
+    def update(self, x: float) -> Optional[float]:
+        self.num, self.den, self.count = self._next(x)
+        return self.num / self.den if self.count >= self.min_periods else None
+
+    def peek(self, x: float) -> Optional[float]:
+        num, den, count = self._next(x)
+        return num / den if count >= self.min_periods else None
+
+
+class SMAState:
+    __slots__ = ("length", "window", "total", "steps")
+
+    def __init__(self, length: int):
+        self.length = int(length)
+        self.window: deque = deque(maxlen=self.length)
+        self.total = 0.0
+        self.steps = 0
+
+    def update(self, close: float, high: float = None, low: float = None) -> Optional[float]:
+        if len(self.window) == self.length:
+            self.total -= self.window[0]
+        self.window.append(close)
+        self.total += close
+        self.steps += 1
+        if self.steps % self.length == 0:
+            self.total = sum(self.window)  # evita acumular erro de arredondamento (custo amortizado O(1))
+        return self.total / self.length if len(self.window) == self.length else None
+
+    def peek(self, close: float, high: float = None, low: float = None) -> Optional[float]:
+        size = len(self.window) + 1
+        total = self.total + close
+        if size > self.length:
+            total -= self.window[0]
+            size = self.length
+        return total / self.length if size == self.length else None
+
+
+class EMAState:
+    __slots__ = ("length", "alpha", "seed", "value")
+
+    def __init__(self, length: int):
+        self.length = int(length)
+        self.alpha = 2.0 / (self.length + 1)
+        self.seed: list = []
+        self.value: Optional[float] = None
+
+    def _next(self, close: float) -> Optional[float]:
+        if self.value is not None:
+            return self.alpha * close + (1.0 - self.alpha) * self.value
+        if len(self.seed) + 1 == self.length:
+            return (sum(self.seed) + close) / self.length
+        return None
+
+    def update(self, close: float, high: float = None, low: float = None) -> Optional[float]:
+        nxt = self._next(close)
+        if nxt is None:
+            self.seed.append(close)
+        else:
+            self.value, self.seed = nxt, []
+        return nxt
+
+    def peek(self, close: float, high: float = None, low: float = None) -> Optional[float]:
+        return self._next(close)
+
+
+class RSIState:
+    __slots__ = ("prev", "gain", "loss")
+
+    def __init__(self, length: int = 14):
+        self.prev: Optional[float] = None
+        self.gain = _RMA(int(length))
+        self.loss = _RMA(int(length))
+
+    @staticmethod
+    def _rsi(gain: Optional[float], loss: Optional[float]) -> Optional[float]:
+        if gain is None or loss is None or gain + loss == 0:
+            return None
+        return 100.0 * gain / (gain + loss)
+
+    def update(self, close: float, high: float = None, low: float = None) -> Optional[float]:
+        if self.prev is None:
+            self.prev = close
+            return None
+        diff, self.prev = close - self.prev, close
+        return self._rsi(self.gain.update(max(diff, 0.0)), self.loss.update(max(-diff, 0.0)))
+
+    def peek(self, close: float, high: float = None, low: float = None) -> Optional[float]:
+        if self.prev is None:
+            return None
+        diff = close - self.prev
+        return self._rsi(self.gain.peek(max(diff, 0.0)), self.loss.peek(max(-diff, 0.0)))
+
+
+class ATRState:
+    __slots__ = ("prev_close", "rma")
+
+    def __init__(self, length: int = 14):
+        self.prev_close: Optional[float] = None
+        self.rma = _RMA(int(length))
+
+    def _true_range(self, close: float, high: float, low: float) -> float:
+        return max(high - low, abs(high - self.prev_close), abs(self.prev_close - low))
+
+    def update(self, close: float, high: float = None, low: float = None) -> Optional[float]:
+        if self.prev_close is None:
+            self.prev_close = close
+            return None
+        tr = self._true_range(close, high, low)
+        self.prev_close = close
+        return self.rma.update(tr)
+
+    def peek(self, close: float, high: float = None, low: float = None) -> Optional[float]:
+        if self.prev_close is None:
+            return None
+        return self.rma.peek(self._true_range(close, high, low))
+
+
+STATES = {"SMA": SMAState, "EMA": EMAState, "RSI": RSIState, "ATR": ATRState}
+
+
+def new_state(kind: str, length: int):
+    return STATES[kind.upper()](length)
+
+
+def _run(state, close: np.ndarray, high: np.ndarray = None, low: np.ndarray = None) -> np.ndarray:
+    out = np.full(len(close), NAN)
+    for i in range(len(close)):
+        v = state.update(float(close[i]),
+                         float(high[i]) if high is not None else None,
+                         float(low[i]) if low is not None else None)
+        if v is not None:
+            out[i] = v
+    return out
+
+
+def sma(close: np.ndarray, length: int) -> np.ndarray:
+    close = np.asarray(close, dtype=float)
+    out = np.full(len(close), NAN)
+    if len(close) >= length:
+        csum = np.cumsum(np.insert(close, 0, 0.0))
+        out[length - 1:] = (csum[length:] - csum[:-length]) / length
+    return out
+
+
+def ema(close: np.ndarray, length: int) -> np.ndarray:
+    return _run(EMAState(length), np.asarray(close, dtype=float))
+
+
+def rsi(close: np.ndarray, length: int = 14) -> np.ndarray:
+    return _run(RSIState(length), np.asarray(close, dtype=float))
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, length: int = 14) -> np.ndarray:
+    return _run(ATRState(length), np.asarray(close, dtype=float),
+                np.asarray(high, dtype=float), np.asarray(low, dtype=float))
+
+
+def last_valid(values: np.ndarray) -> Optional[int]:
+    """Índice do último valor não-NaN (ou None)."""
+    idx = np.flatnonzero(~np.isnan(values))
+    return int(idx[-1]) if idx.size else None
@@ -0,0 +1,212 @@
+"""
+Limpeza agendada de mensagens no Telegram.
+
+Quando um alerta é enviado ou um trade fecha, calculamos o delete_at conforme a
+política do usuário (OFF/AFTER/EOD) e gravamos uma linha em message_deletions
+(indexada por delete_at). Um único worker retira os vencidos em lotes e
+enfileira as remoções no despachante de saída — sem varrer trades/alertas de
+todos os usuários a cada ciclo.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+import pytz
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from database.session import SessionLocal
+from database.models import AlertMessage, MessageDeletion, Trade, User
+from services.telegram_dispatcher import get_dispatcher
+
+logger = logging.getLogger(__name__)
+
+BR_TZ = pytz.timezone('America/Sao_Paulo')
+
+try:
+    _BATCH_SIZE = int(os.getenv("TF_CLEANUP_BATCH_SIZE", "100") or "100")
+except Exception:
+    _BATCH_SIZE = 100
+try:
+    _INTERVAL_SECONDS = float(os.getenv("TF_CLEANUP_INTERVAL_SECONDS", "30") or "30")
+except Exception:
+    _INTERVAL_SECONDS = 30.0
+
+
+def _as_utc(value) -> datetime:
+    """Normaliza datetime (naive = UTC); qualquer outro valor (ex.: func.now()) vira 'agora'."""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return value.replace(tzinfo=pytz.utc)
+        return value.astimezone(pytz.utc)
+    return datetime.now(pytz.utc)
+
+
+def compute_delete_at(mode: Optional[str], delay_minutes: Optional[int], reference) -> Optional[datetime]:
+    """
+    Calcula quando a mensagem deve ser removida:
+      - OFF: None (não agenda)
+      - AFTER: reference + delay_minutes
+      - EOD: 00:00 (America/Sao_Paulo) do dia seguinte ao da referência
+    """
+    mode = (mode or 'OFF').upper()
+    ref = _as_utc(reference)
+    if mode == 'AFTER':
+        return ref + timedelta(minutes=int(delay_minutes or 30))
+    if mode == 'EOD':
+        ref_br = ref.astimezone(BR_TZ)
+        next_day = ref_br.date() + timedelta(days=1)
+        midnight_br = BR_TZ.localize(datetime(next_day.year, next_day.month, next_day.day))
+        return midnight_br.astimezone(pytz.utc)
+    return None
+
+
+def schedule_message_deletion(db, chat_id: int, message_id: int, delete_at: datetime,
+                              kind: str = 'alert', trade_id: Optional[int] = None) -> None:
+    """Agenda (ou reagenda) a remoção; não faz commit."""
+    stmt = pg_insert(MessageDeletion.__table__).values(
+        chat_id=chat_id, message_id=message_id, delete_at=delete_at, kind=kind, trade_id=trade_id,
+    ).on_conflict_do_update(
+        constraint='_deletion_chat_message_uc',
+        set_={"delete_at": delete_at, "kind": kind, "trade_id": trade_id},
+    )
+    db.execute(stmt)
+
+
+def schedule_trade_card_deletion(db, user: User, trade: Trade) -> None:
+    """Chamado quando o trade fecha: agenda a remoção do card conforme msg_cleanup_*."""
+    message_id = getattr(trade, 'notification_message_id', None)
+    if not message_id:
+        return
+    delete_at = compute_delete_at(
+        getattr(user, 'msg_cleanup_mode', 'OFF'),
+        getattr(user, 'msg_cleanup_delay_minutes', 30),
+        getattr(trade, 'closed_at', None),
+    )
+    if delete_at is None:
+        return
+    schedule_message_deletion(db, user.telegram_id, message_id, delete_at, kind='trade', trade_id=trade.id)
+
+
+def schedule_alert_deletion(user_id: int, message_id: int) -> None:
+    """Chamado quando um alerta sai: agenda a remoção conforme alert_cleanup_* (sessão própria)."""
+    db = SessionLocal()
+    try:
+        row = db.query(User.alert_cleanup_mode, User.alert_cleanup_delay_minutes).filter(
+            User.telegram_id == user_id
+        ).first()
+        if not row:
+            return
+        delete_at = compute_delete_at(row[0], row[1], datetime.now(pytz.utc))
+        if delete_at is None:
+            return
+        schedule_message_deletion(db, user_id, message_id, delete_at, kind='alert')
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("[cleanup] falha ao agendar remoção do alerta %s/%s", user_id, message_id)
+    finally:
+        db.close()
+
+
+def _backfill_legacy(db) -> int:
+    """Agenda uma única vez o que a varredura antiga cuidava (alert_messages e cards fechados)."""
+    scheduled = 0
+    users = {u.telegram_id: u for u in db.query(User).filter(
+        (User.msg_cleanup_mode != 'OFF') | (User.alert_cleanup_mode != 'OFF')
+    ).all()}
+    if not users:
+        return 0
+
+    for a in db.query(AlertMessage).filter(AlertMessage.user_telegram_id.in_(list(users))).all():
+        u = users[a.user_telegram_id]
+        delete_at = compute_delete_at(u.alert_cleanup_mode, u.alert_cleanup_delay_minutes, a.created_at)
+        if delete_at is not None:
+            schedule_message_deletion(db, a.user_telegram_id, a.message_id, delete_at, kind='alert')
+            scheduled += 1
+        db.delete(a)
+
+    already = {tid for (tid,) in db.query(MessageDeletion.trade_id).filter(MessageDeletion.trade_id.isnot(None)).all()}
+    closed = db.query(Trade).filter(
+        Trade.user_telegram_id.in_(list(users)),
+        Trade.status.like('%CLOSED%'),
+        Trade.notification_message_id.isnot(None),
+        Trade.closed_at.isnot(None),
+    ).all()
+    for t in closed:
+        if t.id in already:
+            continue
+        u = users[t.user_telegram_id]
+        delete_at = compute_delete_at(u.msg_cleanup_mode, u.msg_cleanup_delay_minutes, t.closed_at)
+        if delete_at is not None:
+            schedule_message_deletion(db, t.user_telegram_id, t.notification_message_id, delete_at,
+                                      kind='trade', trade_id=t.id)
+            scheduled += 1
+    db.commit()
+    return scheduled
+
+
+def _pop_due_batch(application, limit: int) -> int:
+    """Retira até `limit` remoções vencidas e as enfileira no despachante. Retorna quantas."""
+    db = SessionLocal()
+    try:
+        now = datetime.now(pytz.utc)
+        due = db.query(MessageDeletion).filter(
+            MessageDeletion.delete_at <= now
+        ).order_by(MessageDeletion.delete_at.asc()).limit(limit).with_for_update(skip_locked=True).all()
+        if not due:
+            db.rollback()
+            return 0
+
+        dispatcher = get_dispatcher(application)
+        trade_ids = []
+        for row in due:
+            dispatcher.delete(row.chat_id, row.message_id)
+            if row.trade_id is not None:
+                trade_ids.append(row.trade_id)
+
+        if trade_ids:
+            db.query(Trade).filter(Trade.id.in_(trade_ids)).update(
+                {Trade.notification_message_id: None}, synchronize_session=False
+            )
+        db.query(MessageDeletion).filter(MessageDeletion.id.in_([r.id for r in due])).delete(
+            synchronize_session=False
+        )
+        db.commit()
+        return len(due)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def run_message_cleanup_worker(application) -> None:
+    """Worker único: remove mensagens vencidas em lotes limitados."""
+    logger.info("Iniciando worker de limpeza de mensagens (lote=%d, intervalo=%.0fs)...", _BATCH_SIZE, _INTERVAL_SECONDS)
+    db = SessionLocal()
+    try:
+        n = _backfill_legacy(db)
+        if n:
+            logger.info("[cleanup] %d remoção(ões) legadas agendadas.", n)
+    except Exception:
+        db.rollback()
+        logger.exception("[cleanup] falha no backfill da agenda de remoções")
+    finally:
+        db.close()
+
+    while True:
+        try:
+            dispatcher = get_dispatcher(application)
+            # Não empilha remoções se o despachante ainda está drenando o lote anterior
+            if dispatcher.pending() < _BATCH_SIZE:
+                n = _pop_due_batch(application, _BATCH_SIZE)
+                if n:
+                    logger.info("[cleanup] %d mensagem(ns) enfileirada(s) para remoção.", n)
+                if n >= _BATCH_SIZE:
+                    await asyncio.sleep(1)
+                    continue
+        except Exception:
+            logger.exception("[cleanup] falha no worker de limpeza")
+        await asyncio.sleep(_INTERVAL_SECONDS)
@@ -1,6 +1,7 @@
-from services.bybit_service import get_closed_pnl_breakdown, get_account_info
+from services.bybit_service import get_closed_pnl_breakdown
+from services.wallet_cache import get_cached_account_info
 from services.currency_service import get_usd_to_brl_rate
-from utils.security import decrypt_data
+from utils.security import get_user_credentials
 from database.session import SessionLocal
 from database.models import Trade, User
 from datetime import datetime
@@ -30,10 +31,9 @@ async def generate_performance_report(user_id: int, start_dt: datetime, end_dt:
         if not user or not user.api_key_encrypted:
             return "Você precisa ter uma chave de API configurada para ver o desempenho."
 
-        api_key = decrypt_data(user.api_key_encrypted)
-        api_secret = decrypt_data(user.api_secret_encrypted)
+        api_key, api_secret = get_user_credentials(user)
 
-        account_task = asyncio.create_task(get_account_info(api_key, api_secret))
+        account_task = asyncio.create_task(get_cached_account_info(user_id, api_key, api_secret))
         fx_task = asyncio.create_task(get_usd_to_brl_rate())
 
         # Primeiro tenta usar os trades consolidados do banco (agregados por posição).
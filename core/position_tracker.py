@@ -3,6 +3,7 @@ import os
 import logging
 import time
 import math
+import hashlib
 from telegram.ext import Application
 from sqlalchemy.orm import Session
 from database.session import SessionLocal
@@ -12,13 +13,24 @@ from services.bybit_service import (
     modify_position_stop_loss, get_order_status,
     get_specific_position_size, modify_position_take_profit,
     get_last_closed_trade_info, get_open_positions_with_pnl,
-    get_historical_klines,
-    cancel_order
+    get_historical_klines, get_open_orders,
+    cancel_order, set_native_trailing_stop
 )
-from services.notification_service import send_notification, send_user_alert
-from utils.security import decrypt_data
+from services.notification_service import send_notification, send_user_alert, send_error_report
+from services.wallet_cache import invalidate_wallet
+from core.breaker_counters import ensure_seeded, forget_trade, observe_trade, sync_user_trades
+from core.daily_pnl_ledger import record_partial_close, record_trade_close
+from database.write_behind import WriteBehindBuffer, commit_deferred, commit_durable
+from database.crud import set_message_id
+from services.telegram_dispatcher import get_dispatcher
+from core.message_cleanup import schedule_trade_card_deletion
+from core.close_confirmation import enqueue_close_confirmation
+from core.exit_plan import (
+    advance_exit_plan, ensure_exit_plan, is_last_tp, pending_tps, plan_trade_exits, tp_number,
+)
+from core.tp_ladder import covered_indices, open_legs, place_ladder_for_trade, reconcile_tp_orders
+from utils.security import get_user_credentials, credential_cache_stats
 from sqlalchemy.sql import func
-from telegram.error import BadRequest
 from typing import Optional, Callable, Awaitable, Dict, Any, Set, Tuple, List
 import pytz
 
@@ -28,90 +40,56 @@ logger = logging.getLogger(__name__)
 # chave: trade.id, valor: {"sync_notified": bool}
 _SYNC_CACHE = {}
 
+# estado do card por trade (pula edições com o mesmo conteúdo, adia as do intervalo mínimo)
+# chave: trade.id, valor: {"message_id": int, "hash": entregue, "queued": enfileirado,
+#   "edited_at": float, "sending": envio novo na fila, "pending": texto adiado, "timer": flush}
+_CARD_CACHE: Dict[int, Dict[str, Any]] = {}
+# hits = edição evitada (conteúdo igual), misses = edição enviada, throttled = adiada (intervalo mínimo/envio na fila)
+_CARD_STATS = {"hits": 0, "misses": 0, "throttled": 0}
+# Trailing na corretora (trailingStop/activePrice) para quem usa TRAILING_STOP
+_NATIVE_TRAILING = (os.getenv("TF_EXCHANGE_TRAILING", "0") or "0").strip().lower() in ("1", "true", "yes", "on")
+_NATIVE_TRAIL_FAILED: Set[int] = set()
+
+try:
+    _CARD_MIN_EDIT_SECONDS = float(os.getenv("TF_CARD_MIN_EDIT_SECONDS", "30") or "0")
+except Exception:
+    _CARD_MIN_EDIT_SECONDS = 0.0
+
+
+def _card_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _forget_card(trade_id: Optional[int]) -> None:
+    """Descarta o estado do card quando o trade fecha (o cache não cresce indefinidamente)."""
+    if trade_id is not None:
+        state = _CARD_CACHE.pop(trade_id, None)
+        if state is not None:
+            _cancel_pending_card(state)
+
+
+def forget_trade_state(trade_id: Optional[int]) -> None:
+    """Trade fechado: limpa o estado em memória dele (card e falha do trailing nativo)."""
+    _forget_card(trade_id)
+    _NATIVE_TRAIL_FAILED.discard(trade_id)
+
 
 async def _safe_delete_message(application: Application, chat_id: int, message_id: Optional[int]) -> None:
+    """Enfileira a remoção no despachante (mensagem já removida é tratada lá)."""
     if not message_id:
         return
-    try:
-        await application.bot.delete_message(chat_id=chat_id, message_id=message_id)
-    except BadRequest as e:
-        msg = str(e).lower()
-        if "message to delete not found" in msg or "message can't be deleted" in msg:
-            logger.debug("[pending:delete] mensagem já removida (chat=%s id=%s)", chat_id, message_id)
-        else:
-            logger.warning("[pending:delete] falha ao remover mensagem %s/%s: %s", chat_id, message_id, e)
-    except Exception:
-        logger.exception("[pending:delete] erro inesperado ao remover mensagem %s/%s", chat_id, message_id)
-
-def _compute_tp_distribution(strategy: str, total_tps: int) -> list[float]:
-    """Gera uma distribuição de percentuais (soma 100) para N TPs.
-    Suporta:
-      - 'EQUAL'          → igualitária
-      - 'FRONT_HEAVY'    → mais pesado nos primeiros TPs (decay exponencial leve)
-      - 'BACK_HEAVY'     → mais pesado nos últimos TPs (crescente linear)
-      - 'EXP_FRONT'      → mais pesado cedo (decay exponencial forte)
-      - Lista 'a,b,c,...'→ âncoras personalizadas (interpretação original)
-    """
-    if total_tps <= 0:
-        return []
-
-    sraw = (strategy or '').strip()
-    token = sraw.upper()
-
-    # Igualitária
-    if token == 'EQUAL' or token == '':
-        return [100.0 / total_tps] * total_tps
-
-    # Presets
-    if ',' not in sraw:
-        if token == 'FRONT_HEAVY':
-            r = 0.75  # decay moderado
-            weights = [r ** i for i in range(total_tps)]
-            s = sum(weights) or 1.0
-            return [w * (100.0 / s) for w in weights]
-        if token == 'EXP_FRONT':
-            r = 0.6  # decay mais agressivo (primeiros TPs mais pesados)
-            weights = [r ** i for i in range(total_tps)]
-            s = sum(weights) or 1.0
-            return [w * (100.0 / s) for w in weights]
-        if token == 'BACK_HEAVY':
-            # Crescente linear: 1,2,3,...,N (últimos TPs mais pesados)
-            weights = [i + 1 for i in range(total_tps)]
-            s = sum(weights) or 1.0
-            return [w * (100.0 / s) for w in weights]
-
-    # Custom anchors "50,30,20" (compatível com comportamento anterior)
-    try:
-        anchors = [max(0.0, float(x)) for x in sraw.replace('%', '').split(',') if x.strip()]
-    except Exception:
-        return [100.0 / total_tps] * total_tps
-    if not anchors:
-        return [100.0 / total_tps] * total_tps
+    get_dispatcher(application).delete(chat_id, message_id)
 
-    # Normaliza âncoras (permite perfil arbitrário; mantém ordem e decai a cauda por estabilidade)
-    if len(anchors) >= 2 and anchors[-2] > 0:
-        decay = min(0.95, max(0.3, anchors[-1] / anchors[-2]))
-    else:
-        decay = 0.66
 
-    base = []
-    for i in range(total_tps):
-        if i < len(anchors):
-            base.append(anchors[i])
-        else:
-            nxt = base[-1] * decay if base else 1.0
-            if nxt < 1e-6:
-                nxt = 1e-6
-            base.append(nxt)
-
-    s = sum(base)
-    if s <= 0:
-        return [100.0 / total_tps] * total_tps
-    dist = [x * (100.0 / s) for x in base]
-    total = sum(dist)
-    if total != 100.0:
-        dist[-1] += (100.0 - total)
-    return dist
+def _persist_trade_message_id(trade_id: Optional[int]) -> Callable[[Any], None]:
+    """Callback on_sent: grava o message_id do card recém-enviado no Trade."""
+    def _cb(msg) -> None:
+        message_id = getattr(msg, "message_id", None)
+        if trade_id is None or message_id is None:
+            return
+        set_message_id(Trade, trade_id, message_id)
+        logger.info("[msg:new] trade_id=%s nova_msg_id=%s", trade_id, message_id)
+    return _cb
 
 def _generate_trade_status_message(trade: Trade, status_title: str, pnl_data: dict = None, current_price: float = None) -> str:
     """Dashboard compacto e rico para a mensagem de status do trade (HTML)."""
@@ -206,8 +184,7 @@ async def check_pending_orders_for_user(application: Application, user: User, db
         return
 
     # 🔑 DECRIPTA UMA ÚNICA VEZ (antes do branch ON/OFF)
-    api_key = decrypt_data(user.api_key_encrypted)
-    api_secret = decrypt_data(user.api_secret_encrypted)
+    api_key, api_secret = get_user_credentials(user)
 
     # Se o bot estiver OFF, cancela todas as pendentes e sai
     if not user.is_active:
@@ -218,7 +195,7 @@ async def check_pending_orders_for_user(application: Application, user: User, db
                 logger.error(f"[tracker:OFF] Exceção ao cancelar {order.order_id} ({order.symbol}): {e}", exc_info=True)
             await _safe_delete_message(application, user.telegram_id, getattr(order, 'notification_message_id', None))
             db.delete(order)
-        db.commit()
+        commit_durable(db, "pending:off")
         logger.info(f"[tracker:OFF] PendingSignals do usuário {user.telegram_id} cancelados/limpos.")
         return
 
@@ -269,6 +246,7 @@ async def check_pending_orders_for_user(application: Application, user: User, db
                             logger.exception(f"[pending:expire] Falha ao cancelar {order.order_id} ({order.symbol})")
                         await _safe_delete_message(application, user.telegram_id, getattr(order, 'notification_message_id', None))
                         db.delete(order)
+                        commit_durable(db, "pending:expire")
                         await send_user_alert(application, user.telegram_id,
                                               f"⌛ Sua ordem limite para <b>{order.symbol}</b> foi expirada após {int(age_min)} min.")
                         continue
@@ -312,22 +290,6 @@ async def check_pending_orders_for_user(application: Application, user: User, db
             )
 
             message_id_to_update = order.notification_message_id
-            sent_message = None
-            
-            if message_id_to_update:
-                try:
-                    sent_message = await application.bot.edit_message_text(
-                        chat_id=user.telegram_id,
-                        message_id=message_id_to_update,
-                        text=message,
-                        parse_mode='HTML'
-                    )
-                except BadRequest as e:
-                    logger.warning(f"Não foi possível editar a mensagem {message_id_to_update}. Enviando uma nova. Erro: {e}")
-                    sent_message = await application.bot.send_message(chat_id=user.telegram_id, text=message, parse_mode='HTML')
-            else:
-                # Fallback para ordens antigas que não tinham o ID da mensagem salvo.
-                sent_message = await application.bot.send_message(chat_id=user.telegram_id, text=message, parse_mode='HTML')
 
             # --- DEDUPE: se já existir trade ativo para este símbolo, atualiza-o; caso contrário cria um novo ---
             existing = db.query(Trade).filter(
@@ -347,8 +309,9 @@ async def check_pending_orders_for_user(application: Application, user: User, db
                 existing.current_stop_loss = stop_loss
                 existing.initial_targets = all_targets
                 existing.total_initial_targets = num_targets
-                # Prioriza a mensagem recém-enviada para manter o histórico coerente
-                existing.notification_message_id = sent_message.message_id
+                # Prioriza a mensagem da ordem executada para manter o histórico coerente
+                existing.notification_message_id = message_id_to_update
+                card_trade = existing
                 logger.info(
                     "[order->trade:merge] %s %s qty=%.6f entry=%.6f -> trade_id=%s",
                     existing.symbol, existing.side, existing.qty, existing.entry_price, str(existing.id)
@@ -356,7 +319,7 @@ async def check_pending_orders_for_user(application: Application, user: User, db
             else:
                 new_trade = Trade(
                     user_telegram_id=order.user_telegram_id, order_id=order.order_id,
-                    notification_message_id=sent_message.message_id, # Passa o ID correto para o trade
+                    notification_message_id=message_id_to_update, # Passa o ID correto para o trade
                     symbol=order.symbol, side=side, qty=qty, entry_price=entry_price,
                     stop_loss=stop_loss, current_stop_loss=stop_loss,
                     initial_targets=all_targets,
@@ -364,14 +327,94 @@ async def check_pending_orders_for_user(application: Application, user: User, db
                     status='ACTIVE', remaining_qty=qty
                 )
                 db.add(new_trade)
+                card_trade = new_trade
                 logger.info(
                     "[order->trade:new] %s %s qty=%.6f entry=%.6f msg_id=%s",
                     new_trade.symbol, new_trade.side, new_trade.qty, new_trade.entry_price,
                     str(getattr(new_trade, "notification_message_id", None))
                 )
 
+            # Plano de saída fixado na entrada (quantidades por TP no qtyStep)
+            try:
+                await plan_trade_exits(card_trade, user)
+            except Exception:
+                logger.exception("[exit-plan] falha ao montar plano para %s; será criado no próximo ciclo.", card_trade.symbol)
+
             # Em qualquer dos casos, remove o PendingSignal correspondente
             db.delete(order)
+            # Execução confirmada na corretora: grava já, sem esperar o lote do ciclo
+            commit_durable(db, "order->trade")
+            invalidate_wallet(user.telegram_id)
+
+            # Escada de TPs reduce-only na corretora (2+ alvos)
+            try:
+                if await place_ladder_for_trade(card_trade, user, api_key, api_secret):
+                    commit_durable(db, "tp:ladder")
+            except Exception:
+                logger.exception("[tp:ladder] falha ao colocar escada para %s; alvos seguem por preço.", card_trade.symbol)
+
+            # Só então avisa o usuário (edita a mensagem da ordem ou envia uma nova)
+            dispatcher = get_dispatcher(application)
+            on_new_card = _persist_trade_message_id(card_trade.id)
+            if message_id_to_update:
+                def _resend(exc, _text=message, _cb=on_new_card, _mid=message_id_to_update):
+                    logger.warning(f"Não foi possível editar a mensagem {_mid}. Enviando uma nova. Erro: {exc}")
+                    dispatcher.send(user.telegram_id, _text, parse_mode='HTML', on_sent=_cb)
+                dispatcher.edit(user.telegram_id, message_id_to_update, message, parse_mode='HTML', on_error=_resend)
+            else:
+                # Fallback para ordens antigas que não tinham o ID da mensagem salvo.
+                dispatcher.send(user.telegram_id, message, parse_mode='HTML', on_sent=on_new_card)
+
+
+async def _sync_native_trailing(
+    api_key: str,
+    api_secret: str,
+    trade: Trade,
+    position_data: Optional[Dict[str, Any]],
+    effective_entry: float,
+    trail_distance: float,
+    log_prefix: str,
+    message_was_edited: bool,
+    status_title_update: Optional[str],
+) -> Tuple[bool, bool, Optional[str]]:
+    """
+    Trailing na corretora: com TF_EXCHANGE_TRAILING entrega o trailing à Bybit uma
+    vez por trade (falha → trailing local até o trade fechar); com trailing ativo
+    lá, só espelha no trade o SL que ela moveu.
+    Retorna (nativo_ativo, message_was_edited, status_title_update).
+    """
+    native_active = bool(position_data and position_data.get("trailing_stop"))
+
+    if _NATIVE_TRAILING and not native_active and trade.id not in _NATIVE_TRAIL_FAILED:
+        # Ativa quando o pico levaria o SL além do BE, exatamente onde a conta
+        # local (pico - distância) começaria a mover o stop
+        active_price = effective_entry + trail_distance if trade.side == 'LONG' else effective_entry - trail_distance
+        pos_idx = int(position_data.get("position_idx") or 0) if position_data else 0
+        native_result = await set_native_trailing_stop(
+            api_key, api_secret, trade.symbol, trade.side, trail_distance,
+            active_price=active_price, position_idx=pos_idx or None,
+        )
+        if native_result.get("success"):
+            native_active = True
+            message_was_edited = True
+            status_title_update = "📈 Trailing Stop na Corretora"
+            logger.info(f"{log_prefix} trailing nativo: distância={native_result.get('distance')} ativação={native_result.get('active_price')}")
+        else:
+            _NATIVE_TRAIL_FAILED.add(trade.id)
+            logger.error(f"{log_prefix} Falha no trailing nativo ({native_result.get('error', 'desconhecido')}); seguindo com o trailing local.")
+
+    if native_active:
+        # A corretora move o stop; aqui só espelhamos para o card
+        exchange_sl = position_data.get("stop_loss") if position_data else None
+        if exchange_sl and abs(float(exchange_sl) - float(trade.current_stop_loss or 0.0)) > 1e-12:
+            improved = (trade.side == 'LONG' and exchange_sl > (trade.current_stop_loss or float('-inf'))) or \
+                       (trade.side == 'SHORT' and exchange_sl < (trade.current_stop_loss or float('inf')))
+            trade.current_stop_loss = float(exchange_sl)
+            trade.trail_high_water_mark = exchange_sl + trail_distance if trade.side == 'LONG' else exchange_sl - trail_distance
+            message_was_edited = True
+            if improved and not status_title_update:
+                status_title_update = "📈 Trailing Stop Ajustado"
+    return native_active, message_was_edited, status_title_update
 
 
 async def check_active_trades_for_user(application: Application, user: User, db: Session):
@@ -382,11 +425,12 @@ async def check_active_trades_for_user(application: Application, user: User, db:
         Trade.user_telegram_id == user.telegram_id,
         ~Trade.status.like('%CLOSED%')
     ).all()
+    # Contadores do disjuntor: trades que saíram da lista ativa deixam de contar
+    sync_user_trades(user.telegram_id, active_trades)
     if not active_trades:
         return
 
-    api_key = decrypt_data(user.api_key_encrypted)
-    api_secret = decrypt_data(user.api_secret_encrypted)
+    api_key, api_secret = get_user_credentials(user)
 
     live_pnl_result = await get_open_positions_with_pnl(api_key, api_secret)
     if not live_pnl_result.get("success"):
@@ -395,6 +439,16 @@ async def check_active_trades_for_user(application: Application, user: User, db:
 
     live_pnl_map = {p['symbol']: p for p in (live_pnl_result.get('data') or [])}
 
+    # Uma listagem de ordens abertas por usuário basta para reconciliar todas as escadas de TP
+    ladder_open_ids: Optional[Set[str]] = None
+    if any(open_legs(t) for t in active_trades):
+        open_orders_result = await get_open_orders(api_key, api_secret)
+        if open_orders_result.get("success"):
+            ladder_open_ids = {o.get("orderId") for o in (open_orders_result.get("data") or [])}
+        else:
+            logger.warning("[tp:ladder] falha ao listar ordens abertas de %s; reconciliação fica para o próximo ciclo.",
+                           user.telegram_id)
+
     klines_cache: Dict[str, List[float]] = {}
 
     async def _get_recent_closes(symbol: str) -> Optional[List[float]]:
@@ -515,9 +569,15 @@ async def check_active_trades_for_user(application: Application, user: User, db:
                 return False, None
             position_idx = 1 if trade.side == 'LONG' else 2
             close_result = await close_partial_position(api_key, api_secret, trade.symbol, qty_to_close, trade.side, position_idx)
+            if close_result.get('skipped'):
+                logger.warning("[adaptive-sl] fechamento de %s ignorado pela corretora: %s", trade.symbol, close_result.get('reason'))
+                return False, None
             if close_result.get('success'):
                 remaining = trade.remaining_qty if trade.remaining_qty is not None else trade.qty
                 trade.remaining_qty = max(0.0, (remaining or 0.0) - qty_to_close)
+                record_partial_close(db, trade, current_price, qty_to_close)
+                commit_durable(db, "adaptive-sl:close")
+                invalidate_wallet(user.telegram_id)
                 await send_user_alert(
                     application,
                     user.telegram_id,
@@ -564,6 +624,7 @@ async def check_active_trades_for_user(application: Application, user: User, db:
 
         if position_data:
             trade.unrealized_pnl_pct = position_data.get("unrealized_pnl_frac", 0.0)
+            observe_trade(trade)
             # Mantém a entrada do trade sincronizada com a Bybit para evitar BE incorreto
             try:
                 bybit_entry = float(position_data.get("entry") or 0.0)
@@ -641,85 +702,94 @@ async def check_active_trades_for_user(application: Application, user: User, db:
                         else:
                             logger.error(f"{log_prefix} Falha ao mover SL (lock): {sl_result.get('error', 'desconhecido')}")
 
-            # --- TAKE PROFIT (Lógica Refatorada) ---
-            targets_executados_este_ciclo = []
-            if trade.initial_targets:
-                # Acessa a quantidade restante uma vez para evitar acessos repetidos no loop
-                remaining_qty = trade.remaining_qty if trade.remaining_qty is not None else trade.qty
+            # --- TAKE PROFIT (plano de saída calculado na entrada) ---
+            plan = await ensure_exit_plan(trade, user)
+            executed_idx: List[int] = []
+            # Acessa a quantidade restante uma vez para evitar acessos repetidos no loop
+            remaining_qty = trade.remaining_qty if trade.remaining_qty is not None else trade.qty
+            ladder_changed = False
+
+            # Escada na corretora: só reconcilia o que já executou lá
+            if plan and trade.tp_orders and ladder_open_ids is not None:
+                for ev in await reconcile_tp_orders(trade, api_key, api_secret, ladder_open_ids):
+                    ladder_changed = True
+                    if ev["qty"] > 0:
+                        remaining_qty = max(0.0, (remaining_qty or 0.0) - ev["qty"])
+                        record_partial_close(db, trade, float(ev["target"]), ev["qty"])
+                    if ev["status"] == "filled":
+                        # A perna pode ter absorvido alvos abaixo do mínimo: todos executaram juntos
+                        executed_idx.extend(ev["covers"])
+                        is_final = is_last_tp(plan, int(ev["i"])) and not open_legs(trade)
+                        status_title_update = "🎯 TP Final Executado!" if is_final else \
+                            f"🎯 TP {tp_number(plan, int(ev['i']))}/{plan['n']} Executado!"
+                        logger.info("[tp:filled] %s %s TP=%.4f closed=%.6f remaining=%.6f",
+                                    trade.symbol, trade.side, float(ev["target"]), float(ev["qty"]), remaining_qty)
+                    else:
+                        logger.warning("[tp:ladder] %s %s perna TP=%.4f %s (executado=%.6f); alvo volta ao acompanhamento por preço",
+                                       trade.symbol, trade.side, float(ev["target"]), ev["status"], float(ev["qty"]))
 
-                for target_price in list(trade.initial_targets):
-                    hit = (trade.side == 'LONG' and current_price >= target_price) or \
-                          (trade.side == 'SHORT' and current_price <= target_price)
-                    
-                    if not hit:
-                        continue
+            skip_idx = covered_indices(trade) | set(executed_idx)
+            for k, target_price, planned_qty, _sl_after in pending_tps(plan):
+                if k in skip_idx:
+                    continue
+                hit = (trade.side == 'LONG' and current_price >= target_price) or \
+                      (trade.side == 'SHORT' and current_price <= target_price)
+                if not hit:
+                    continue
 
-                    # Lógica de decisão da quantidade a fechar:
-                    # 1. Se for o último alvo, fecha 100% do que sobrou para evitar "poeira".
-                    # 2. Se não, calcula a fração com base no tamanho inicial do trade.
-                    
-                    is_last_target = len(trade.initial_targets) == len(targets_executados_este_ciclo) + 1
-                    qty_to_close = 0.0
+                # Último TP do plano fecha 100% do que sobrou (evita "poeira");
+                # os demais usam a quantidade do plano, nunca mais que o restante.
+                is_last_target = is_last_tp(plan, k)
+                qty_to_close = remaining_qty if is_last_target else min(planned_qty, remaining_qty)
+                if is_last_target:
+                    logger.info(f"[TP Final] {trade.symbol}: Último alvo atingido. Fechando {qty_to_close:.8f} restante.")
+                else:
+                    logger.info(f"[TP Parcial] {trade.symbol}: TP#{tp_number(plan, k)} planejado={planned_qty:.8f}. Restante={remaining_qty:.8f}. Fechando={qty_to_close:.8f}")
 
-                    if is_last_target:
-                        qty_to_close = remaining_qty
-                        logger.info(f"[TP Final] {trade.symbol}: Último alvo atingido. Fechando {qty_to_close:.8f} restante.")
-                    else:
-                        if not trade.total_initial_targets or trade.total_initial_targets <= 0:
-                            logger.warning(f"{trade.symbol}: total_initial_targets inválido ({trade.total_initial_targets}). Pulando alvo.")
-                            continue
-
-                        strategy = getattr(user, 'tp_distribution', 'EQUAL')
-                        dist = _compute_tp_distribution(strategy, int(trade.total_initial_targets))
-                        target_index = trade.total_initial_targets - len(trade.initial_targets) + len(targets_executados_este_ciclo)
-                        
-                        try:
-                            current_tp_percent = float(dist[target_index])
-                        except IndexError:
-                            logger.warning(f"Índice de alvo fora do range para {trade.symbol}. Usando fallback.")
-                            current_tp_percent = 100.0 / float(trade.total_initial_targets)
-
-                        partial_qty = trade.qty * (current_tp_percent / 100.0)
-                        
-                        # SALVAGUARDA: Nunca fechar mais do que a quantidade restante.
-                        # Isso corrige o bug de fechamento prematuro e lida com imprecisões.
-                        qty_to_close = min(partial_qty, remaining_qty)
-                        
-                        logger.info(f"[TP Parcial] {trade.symbol}: TP#{target_index + 1}={current_tp_percent:.2f}%%. Calculado={partial_qty:.8f}. Restante={remaining_qty:.8f}. Fechando={qty_to_close:.8f}")
-
-                    if qty_to_close <= 0:
-                        logger.info(f"[TP Skip] {trade.symbol}: Quantidade a fechar é zero ou negativa. Pulando alvo.")
-                        continue
-                        
-                    position_idx_to_close = 1 if trade.side == 'LONG' else 2
+                if qty_to_close <= 0:
+                    logger.info(f"[TP Skip] {trade.symbol}: Quantidade a fechar é zero ou negativa. Pulando alvo.")
+                    continue
 
-                    logger.info("[tp:crossed] %s %s TP=%.4f last=%.4f -> tentando reduzir %.6f",
-                                trade.symbol, trade.side, float(target_price), float(current_price), qty_to_close)
+                position_idx_to_close = 1 if trade.side == 'LONG' else 2
 
-                    close_result = await close_partial_position(
-                        api_key, api_secret, trade.symbol, qty_to_close, trade.side, position_idx_to_close
-                    )
-                    
-                    if close_result.get("success"):
-                        targets_executados_este_ciclo.append(target_price)
-                        remaining_qty = max(0.0, remaining_qty - qty_to_close)
-                        message_was_edited = True
-                        status_title_update = f"🎯 TP Final Executado!" if is_last_target else f"🎯 TP {target_index + 1}/{trade.total_initial_targets} Executado!"
+                logger.info("[tp:crossed] %s %s TP=%.4f last=%.4f -> tentando reduzir %.6f",
+                            trade.symbol, trade.side, float(target_price), float(current_price), qty_to_close)
 
-                        logger.info("[tp:executed] %s %s TP=%.4f closed=%.6f remaining=%.6f",
-                                    trade.symbol, trade.side, float(target_price),
-                                    float(qty_to_close), remaining_qty)
-                    else:
-                        logger.error("[tp:failed] %s %s TP=%.4f reason=%s",
-                                     trade.symbol, trade.side, float(target_price),
-                                     close_result.get("error", "desconhecido"))
+                close_result = await close_partial_position(
+                    api_key, api_secret, trade.symbol, qty_to_close, trade.side, position_idx_to_close
+                )
+
+                if close_result.get("skipped"):
+                    # Nada foi reduzido na corretora (abaixo do mínimo ou sem posição): alvo segue pendente
+                    logger.info("[tp:skipped] %s %s TP=%.4f reason=%s",
+                                trade.symbol, trade.side, float(target_price), close_result.get("reason"))
+                elif close_result.get("success"):
+                    executed_idx.append(k)
+                    remaining_qty = max(0.0, remaining_qty - qty_to_close)
+                    record_partial_close(db, trade, current_price, qty_to_close)
+                    message_was_edited = True
+                    status_title_update = f"🎯 TP Final Executado!" if is_last_target else f"🎯 TP {tp_number(plan, k)}/{plan['n']} Executado!"
+
+                    logger.info("[tp:executed] %s %s TP=%.4f closed=%.6f remaining=%.6f",
+                                trade.symbol, trade.side, float(target_price),
+                                float(qty_to_close), remaining_qty)
+                else:
+                    logger.error("[tp:failed] %s %s TP=%.4f reason=%s",
+                                 trade.symbol, trade.side, float(target_price),
+                                 close_result.get("error", "desconhecido"))
+
+            # SL liberado pelo TP mais avançado executado neste ciclo (usado pelo break-even)
+            sl_unlocked = plan["tp"][max(executed_idx)][2] if executed_idx else None
 
             # Após o loop, atualiza o estado do trade no banco de dados com a quantidade final restante
-            if targets_executados_este_ciclo:
+            if executed_idx or ladder_changed:
                 trade.remaining_qty = remaining_qty
-                trade.initial_targets = [t for t in trade.initial_targets if t not in targets_executados_este_ciclo]
+                advance_exit_plan(trade, executed_idx)
                 message_was_edited = True
-                if not status_title_update:
+                # Reduções já executadas na corretora: persistir antes de avisar o usuário
+                commit_durable(db, "tp:executed")
+                invalidate_wallet(user.telegram_id)
+                if not status_title_update and executed_idx:
                     status_title_update = "🎯 Take Profit EXECUTADO!"
 
             # --- BREAK-EVEN ---
@@ -731,9 +801,9 @@ async def check_active_trades_for_user(application: Application, user: User, db:
                     be_trigger_hit = True
             
             if user.stop_strategy == 'BREAK_EVEN':
-                if targets_executados_este_ciclo or be_trigger_hit:
-                    if targets_executados_este_ciclo:
-                        tp_ref = max(targets_executados_este_ciclo) if trade.side == 'LONG' else min(targets_executados_este_ciclo)
+                if sl_unlocked is not None or be_trigger_hit:
+                    if sl_unlocked is not None:
+                        tp_ref = sl_unlocked
                         if trade.is_breakeven:
                             desired_sl = float(tp_ref)
                             reason = f"Break-Even Avançado (TP {tp_ref:.4f})"
@@ -783,54 +853,117 @@ async def check_active_trades_for_user(application: Application, user: User, db:
                         else:
                             logger.error(f"{log_prefix} Falha ao mover SL para BE: {sl_result.get('error', 'desconhecido')}")
                     else:
-                        if trade.trail_high_water_mark is None:
-                            trade.trail_high_water_mark = effective_entry
-                        new_hwm = trade.trail_high_water_mark
-                        if trade.side == 'LONG' and current_price > new_hwm:
-                            new_hwm = current_price
-                        elif trade.side == 'SHORT' and current_price < new_hwm:
-                            new_hwm = current_price
-
-                        if new_hwm != trade.trail_high_water_mark:
-                            logger.info(f"{log_prefix} Novo pico: ${new_hwm:.4f}")
-                            trade.trail_high_water_mark = new_hwm
-
                         trail_distance = abs(effective_entry - (trade.stop_loss or effective_entry * 0.98)) \
                                          if trade.stop_loss is not None else effective_entry * 0.02
-                        potential_new_sl = new_hwm - trail_distance if trade.side == 'LONG' else new_hwm + trail_distance
-
-                        is_improvement = (trade.side == 'LONG' and potential_new_sl > (trade.current_stop_loss or float('-inf'))) or \
-                                         (trade.side == 'SHORT' and potential_new_sl < (trade.current_stop_loss or float('inf')))
-                        if is_improvement:
-                            is_valid_to_set = (trade.side == 'LONG' and potential_new_sl < current_price) or \
-                                               (trade.side == 'SHORT' and potential_new_sl > current_price)
-                            if is_valid_to_set:
-                                sl_result = await modify_position_stop_loss(api_key, api_secret, trade.symbol, potential_new_sl, reason="ts")
-                                if sl_result.get("success"):
-                                    trade.current_stop_loss = potential_new_sl
-                                    message_was_edited = True
-                                    status_title_update = "📈 Trailing Stop Ajustado"
-                                else:
-                                    logger.error(f"{log_prefix} Falha ao mover Trailing SL: {sl_result.get('error', 'desconhecido')}")
+                        native_active, message_was_edited, status_title_update = await _sync_native_trailing(
+                            api_key, api_secret, trade, position_data, effective_entry, trail_distance,
+                            log_prefix, message_was_edited, status_title_update,
+                        )
+
+                        if not native_active:
+                            if trade.trail_high_water_mark is None:
+                                trade.trail_high_water_mark = effective_entry
+                            new_hwm = trade.trail_high_water_mark
+                            if trade.side == 'LONG' and current_price > new_hwm:
+                                new_hwm = current_price
+                            elif trade.side == 'SHORT' and current_price < new_hwm:
+                                new_hwm = current_price
+
+                            if new_hwm != trade.trail_high_water_mark:
+                                logger.info(f"{log_prefix} Novo pico: ${new_hwm:.4f}")
+                                trade.trail_high_water_mark = new_hwm
+
+                            potential_new_sl = new_hwm - trail_distance if trade.side == 'LONG' else new_hwm + trail_distance
+
+                            is_improvement = (trade.side == 'LONG' and potential_new_sl > (trade.current_stop_loss or float('-inf'))) or \
+                                             (trade.side == 'SHORT' and potential_new_sl < (trade.current_stop_loss or float('inf')))
+                            if is_improvement:
+                                is_valid_to_set = (trade.side == 'LONG' and potential_new_sl < current_price) or \
+                                                   (trade.side == 'SHORT' and potential_new_sl > current_price)
+                                if is_valid_to_set:
+                                    sl_result = await modify_position_stop_loss(api_key, api_secret, trade.symbol, potential_new_sl, reason="ts")
+                                    if sl_result.get("success"):
+                                        trade.current_stop_loss = potential_new_sl
+                                        message_was_edited = True
+                                        status_title_update = "📈 Trailing Stop Ajustado"
+                                    else:
+                                        logger.error(f"{log_prefix} Falha ao mover Trailing SL: {sl_result.get('error', 'desconhecido')}")
             
             if message_was_edited:
                 pnl_data_for_msg = live_pnl_map.get(trade.symbol)
                 msg_text = _generate_trade_status_message(trade, status_title_update, pnl_data_for_msg, current_price)
-                await _send_or_edit_trade_message(application, user, trade, db, msg_text)
+                # Atualizações sem título (ex.: resync de entrada) respeitam o intervalo mínimo
+                await _send_or_edit_trade_message(application, user, trade, db, msg_text,
+                                                  throttle=not status_title_update)
 
                 
+def _adopt_position(db, user, symbol: str, pos: Dict[str, Any]) -> Trade:
+    """
+    Trade ACTIVE_SYNCED para uma posição órfã da corretora: SL atual dela
+    (stop_loss de get_open_positions_with_pnl) e, se houver sinal pendente do
+    símbolo, os alvos (e o SL, quando a corretora não tem) recuperados dele.
+    """
+    side = pos.get("side")
+    entry = float(pos.get("entry", 0) or 0)
+    size = float(pos.get("size", 0) or 0)
+    curr_sl = pos.get("stop_loss") or None
+
+    new_trade = Trade(
+        user_telegram_id=user.telegram_id,
+        order_id=f"sync_{symbol}_{int(time.time())}",
+        symbol=symbol,
+        side=side,
+        qty=size,
+        remaining_qty=size,
+        entry_price=entry,
+        status='ACTIVE_SYNCED',
+        stop_loss=curr_sl,
+        current_stop_loss=curr_sl,
+        initial_targets=[],
+        total_initial_targets=0
+    )
+
+    cand = db.query(PendingSignal).filter_by(
+        user_telegram_id=user.telegram_id, symbol=symbol
+    ).order_by(PendingSignal.id.desc()).first()
+    if cand and cand.signal_data:
+        try:
+            tps = cand.signal_data.get('targets') or []
+            new_trade.initial_targets = tps
+            new_trade.total_initial_targets = len(tps)
+            if not curr_sl and cand.signal_data.get('stop_loss'):
+                new_trade.stop_loss = cand.signal_data['stop_loss']
+                new_trade.current_stop_loss = new_trade.stop_loss
+            db.delete(cand)
+            logger.info("[sync:recover-signal] %s: recuperados %d TP(s) e SL.", symbol, len(tps))
+        except Exception:
+            logger.exception("[sync:recover-signal] falhou ao mapear sinal para %s", symbol)
+
+    db.add(new_trade)
+    return new_trade
+
+
 async def run_tracker(application: Application):
     """Função principal do verificador: primeiro consolida o estado interno (ordens/trades),
     depois sincroniza/adota órfãs. Essa ordem evita mensagens de "Posição Sincronizada"
     logo após abrirmos nós mesmos a posição.
     """
     logger.info("Iniciando Rastreador de Posições e Ordens (Modo Multiusuário)...")
+    db = SessionLocal()
+    try:
+        ensure_seeded(db)
+    except Exception:
+        logger.exception("[breaker] falha ao semear contadores; serão semeados na primeira consulta.")
+    finally:
+        db.close()
     while True:
         cycle_started = time.perf_counter()
         total_users = 0
         adopted_count = 0
 
         db = SessionLocal()
+        # Uma passada por usuário = um commit (ver database/write_behind.py)
+        write_buffer = WriteBehindBuffer(db).attach()
         try:
             # 1) Etapa NORMAL: primeiro consolida ordens e atualiza trades
             all_users = db.query(User).filter(User.api_key_encrypted.isnot(None)).all()
@@ -839,9 +972,7 @@ async def run_tracker(application: Application):
                 for user in all_users:
                     await check_pending_orders_for_user(application, user, db)
                     await check_active_trades_for_user(application, user, db)
-                    await cleanup_closed_trade_messages(application, user, db)
-                    await cleanup_alert_messages(application, user, db)
-                db.commit()
+                    write_buffer.flush()
             else:
                 logger.info("Rastreador: Nenhum usuário com API para verificar.")
 
@@ -849,21 +980,7 @@ async def run_tracker(application: Application):
             all_api_users_for_sync = all_users  # reaproveita lista já obtida acima
             for user in all_api_users_for_sync:
                 total_users += 1
-                sync_api_key = decrypt_data(user.api_key_encrypted)
-                sync_api_secret = decrypt_data(user.api_secret_encrypted)
-
-                # Wrapper para o detetive: usa suas credenciais e adapta o formato
-                async def _fetch_closed_info(symbol: str) -> Optional[Dict[str, Any]]:
-                    res = await get_last_closed_trade_info(sync_api_key, sync_api_secret, symbol)
-                    if not res or not res.get("success"):
-                        return None
-                    d = res.get("data") or {}
-                    return {
-                        "pnl": float(d.get("closedPnl", 0.0)) if d.get("closedPnl") is not None else None,
-                        "exit_type": d.get("exitType"),
-                        "exit_price": d.get("exitPrice"),
-                        "closed_at": d.get("closedAt"),
-                    }
+                sync_api_key, sync_api_secret = get_user_credentials(user)
 
                 bybit_positions_result = await get_open_positions_with_pnl(sync_api_key, sync_api_secret)
                 if not bybit_positions_result.get("success"):
@@ -918,43 +1035,8 @@ async def run_tracker(application: Application):
                         logger.info("[sync:safe-skip] %s já tem trade ativo (id=%s).", symbol, str(exists_active.id))
                         continue
 
-                    side = pos.get("side")
-                    entry = float(pos.get("entry", 0) or 0)
-                    size = float(pos.get("size", 0) or 0)
-                    curr_sl = pos.get("stop_loss") or None
-
-                    new_trade = Trade(
-                        user_telegram_id=user.telegram_id,
-                        order_id=f"sync_{symbol}_{int(time.time())}",
-                        symbol=symbol,
-                        side=side,
-                        qty=size,
-                        remaining_qty=size,
-                        entry_price=entry,
-                        status='ACTIVE_SYNCED',
-                        stop_loss=curr_sl,
-                        current_stop_loss=curr_sl,
-                        initial_targets=[],
-                        total_initial_targets=0
-                    )
-
-                    cand = db.query(PendingSignal).filter_by(
-                        user_telegram_id=user.telegram_id, symbol=symbol
-                    ).order_by(PendingSignal.id.desc()).first()
-                    if cand and cand.signal_data:
-                        try:
-                            tps = cand.signal_data.get('targets') or []
-                            new_trade.initial_targets = tps
-                            new_trade.total_initial_targets = len(tps)
-                            if not curr_sl and cand.signal_data.get('stop_loss'):
-                                new_trade.stop_loss = cand.signal_data['stop_loss']
-                                new_trade.current_stop_loss = new_trade.stop_loss
-                            db.delete(cand)
-                            logger.info("[sync:recover-signal] %s: recuperados %d TP(s) e SL.", symbol, len(tps))
-                        except Exception:
-                            logger.exception("[sync:recover-signal] falhou ao mapear sinal para %s", symbol)
-
-                    db.add(new_trade)
+                    new_trade = _adopt_position(db, user, symbol, pos)
+                    side = new_trade.side
 
                     msg = (
                         f"⚠️ <b>Posição Sincronizada</b>\n"
@@ -972,14 +1054,22 @@ async def run_tracker(application: Application):
                     db_active_trades=db_active_trades,
                     bybit_keys=bybit_keys,
                     threshold=3,
-                    get_last_closed_trade_info=_fetch_closed_info,
                 )
+                write_buffer.flush()
 
+            write_buffer.flush()
             duration = time.perf_counter() - cycle_started
-            logger.info("[cycle] resumo: usuarios=%d, adotadas=%d, duracao=%.2fs",
-                        total_users, adopted_count, duration)
-
-            db.commit()
+            logger.info("[cycle] resumo: usuarios=%d, adotadas=%d, duracao=%.2fs, commits=%d (duráveis=%d, adiados=%d)",
+                        total_users, adopted_count, duration,
+                        write_buffer.flushes + write_buffer.durable_commits,
+                        write_buffer.durable_commits, write_buffer.deferred)
+            logger.info("[cycle] cards: editados=%d, iguais=%d, adiados=%d",
+                        _CARD_STATS["misses"], _CARD_STATS["hits"], _CARD_STATS["throttled"])
+            for k in _CARD_STATS:
+                _CARD_STATS[k] = 0
+            cred = credential_cache_stats(reset=True)
+            logger.info("[cycle] credenciais: decrypts_evitados=%d, decrypts=%d, em_cache=%d",
+                        cred["hits"], cred["misses"], cred["size"])
 
         except Exception as e:
             logger.critical(f"Erro crítico no loop do rastreador: {e}", exc_info=True)
@@ -993,131 +1083,13 @@ async def run_tracker(application: Application):
                 ))
             except Exception:
                 pass
-            db.rollback()
+            write_buffer.rollback()
         finally:
+            write_buffer.detach()
             db.close()
 
         await asyncio.sleep(15)
 
-async def cleanup_closed_trade_messages(application: Application, user: User, db: Session) -> None:
-    """
-    Exclui mensagens no Telegram de trades já fechados, conforme a política do usuário:
-      - OFF: não faz nada
-      - AFTER: exclui se (now - closed_at) >= delay_minutes
-      - EOD: exclui se o trade fechou em um dia anterior ao dia atual (America/Sao_Paulo)
-    Após excluir, zera notification_message_id para evitar repetição.
-    """
-    mode = (getattr(user, 'msg_cleanup_mode', 'OFF') or 'OFF').upper()
-    if mode == 'OFF':
-        return
-
-    delay_minutes = int(getattr(user, 'msg_cleanup_delay_minutes', 30) or 30)
-    br_tz = pytz.timezone('America/Sao_Paulo')
-    from datetime import datetime
-
-    # Busca trades fechados que ainda têm mensagem
-    closed_with_msg: List[Trade] = db.query(Trade).filter(
-        Trade.user_telegram_id == user.telegram_id,
-        Trade.status.like('%CLOSED%'),
-        Trade.notification_message_id.isnot(None)
-    ).order_by(Trade.closed_at.desc()).all()
-
-    for t in closed_with_msg:
-        try:
-            if not getattr(t, 'closed_at', None):
-                continue
-            closed_at = t.closed_at
-            try:
-                if getattr(closed_at, 'tzinfo', None) is None:
-                    # assume UTC se naive
-                    from datetime import timezone
-                    closed_at = closed_at.replace(tzinfo=pytz.utc)
-            except Exception:
-                pass
-
-            should_delete = False
-            if mode == 'AFTER':
-                try:
-                    delta = datetime.utcnow().replace(tzinfo=pytz.utc) - closed_at.astimezone(pytz.utc)
-                    if delta.total_seconds() >= delay_minutes * 60:
-                        should_delete = True
-                except Exception:
-                    pass
-            elif mode == 'EOD':
-                try:
-                    closed_br = closed_at.astimezone(br_tz).date()
-                    now_br = datetime.utcnow().replace(tzinfo=pytz.utc).astimezone(br_tz).date()
-                    if closed_br < now_br:
-                        should_delete = True
-                except Exception:
-                    pass
-
-            if should_delete and getattr(t, 'notification_message_id', None):
-                try:
-                    await application.bot.delete_message(chat_id=user.telegram_id, message_id=t.notification_message_id)
-                except BadRequest:
-                    pass
-                except Exception:
-                    pass
-                t.notification_message_id = None
-        except Exception:
-            logger.exception('[cleanup] falha ao avaliar trade_id=%s', getattr(t, 'id', None))
-
-async def cleanup_alert_messages(application: Application, user: User, db: Session) -> None:
-    """
-    Limpa mensagens de ALERTA (erros/avisos) conforme política do usuário:
-      - OFF: não faz nada
-      - AFTER: exclui após N minutos
-      - EOD: exclui se enviada em dia anterior (America/Sao_Paulo)
-    """
-    from database.models import AlertMessage
-    mode = (getattr(user, 'alert_cleanup_mode', 'OFF') or 'OFF').upper()
-    if mode == 'OFF':
-        return
-
-    delay_minutes = int(getattr(user, 'alert_cleanup_delay_minutes', 30) or 30)
-    br_tz = pytz.timezone('America/Sao_Paulo')
-    from datetime import datetime
-
-    alerts = db.query(AlertMessage).filter(AlertMessage.user_telegram_id == user.telegram_id).order_by(AlertMessage.created_at.asc()).all()
-    for a in alerts:
-        try:
-            created_at = a.created_at
-            if created_at is None:
-                should_delete = True
-            else:
-                try:
-                    if getattr(created_at, 'tzinfo', None) is None:
-                        created_at = created_at.replace(tzinfo=pytz.utc)
-                except Exception:
-                    pass
-
-                should_delete = False
-                if mode == 'AFTER':
-                    delta = datetime.utcnow().replace(tzinfo=pytz.utc) - created_at.astimezone(pytz.utc)
-                    if delta.total_seconds() >= delay_minutes * 60:
-                        should_delete = True
-                elif mode == 'EOD':
-                    now_br = datetime.utcnow().replace(tzinfo=pytz.utc).astimezone(br_tz)
-                    created_br = created_at.astimezone(br_tz)
-                    if created_br.date() < now_br.date():
-                        should_delete = True
-
-            if should_delete:
-                try:
-                    await application.bot.delete_message(chat_id=user.telegram_id, message_id=a.message_id)
-                except BadRequest:
-                    # mensagem já inexistente – prosseguir removendo do log
-                    pass
-                except Exception:
-                    # algo inesperado – não remover do log para tentar novamente
-                    continue
-                db.delete(a)
-                db.commit()
-        except Exception:
-            db.rollback()
-            logger.exception('[cleanup-alerts] falha ao avaliar alerta id=%s', getattr(a, 'id', None))
-
 async def notify_sync_status(application, user, trade, text: Optional[str] = None) -> None:
     """
     Edita o card para estado 'sincronizando' no 2º ciclo ausente.
@@ -1135,12 +1107,7 @@ async def notify_sync_status(application, user, trade, text: Optional[str] = Non
         "Estamos confirmando o status desta posição. O card será atualizado automaticamente."
     )
     try:
-        await application.bot.edit_message_text(
-            chat_id=user.telegram_id,
-            message_id=trade.notification_message_id,
-            text=sync_text,
-            parse_mode="HTML",
-        )
+        get_dispatcher(application).edit(user.telegram_id, trade.notification_message_id, sync_text, parse_mode="HTML")
         cache["sync_notified"] = True
         logger.info("[sync] %s/%s marcado como 'sincronizando' (2º ciclo ausente).",
                     trade.symbol, trade.side)
@@ -1153,69 +1120,73 @@ def clear_sync_flag(trade_id: int) -> None:
     if state:
         state["sync_notified"] = False
 
-async def confirm_and_close_trade(
-    *,
-    application,
+async def _fetch_close_info(
     user,
     trade,
-    db,  # sessão do banco
     get_last_closed_trade_info: Optional[Callable[[str], Awaitable[Optional[Dict[str, Any]]]]] = None,
-    attempts: int = 3,
-    delay_seconds: float = 6.0,
-    fallback_text: Optional[str] = None,
-) -> bool:
-    """
-    Antes de marcar CLOSED_GHOST, tenta confirmar fechamento real.
-    Se encontrar dados, edita o card com resumo e FECHA/PERSISTE no DB.
-    Retorna True se persistiu fechamento com dados; False caso contrário.
-    """
-    info = None
+) -> Optional[Dict[str, Any]]:
+    """Uma tentativa de confirmar o fechamento: PnL agregado por símbolo+lado; depois o detetive simples."""
     # 1) Tenta calcular PnL do trade por símbolo+lado dentro da janela
     try:
         from services.bybit_service import get_closed_pnl_for_trade
-        api_key = decrypt_data(user.api_key_encrypted)
-        api_secret = decrypt_data(user.api_secret_encrypted)
+        api_key, api_secret = get_user_credentials(user)
         start_ts = getattr(trade, "created_at", None)
         if start_ts is None:
             from datetime import datetime, timedelta
             # Use timezone-aware UTC to avoid naive/aware comparison issues downstream
             start_ts = datetime.now(pytz.utc) - timedelta(hours=6)
-        for i in range(1, attempts + 1):
-            agg = await get_closed_pnl_for_trade(
-                api_key, api_secret, trade.symbol, trade.side, start_ts
-            )
-            if agg.get("success"):
-                # Se não achou itens, gross/fees/funding devem ser 0 e exit_type Unknown — considera sem dados
-                gross = float(agg.get("gross_pnl", 0) or 0)
-                fees = float(agg.get("fees", 0) or 0)
-                funding = float(agg.get("funding", 0) or 0)
-                etype = agg.get("exit_type") or ""
-                if gross != 0 or fees != 0 or funding != 0 or (etype and etype.lower() != "unknown"):
-                    info = {
-                        "pnl": float(agg.get("net_pnl", 0) or 0),
-                        "exit_type": agg.get("exit_type"),
-                        "exit_price": None,
-                        "closed_at": None,
-                    }
-                    logger.debug("[close-confirm] agg info obtida para %s: %s", trade.symbol, str(info))
-                    break
-            await asyncio.sleep(delay_seconds)
+        agg = await get_closed_pnl_for_trade(
+            api_key, api_secret, trade.symbol, trade.side, start_ts
+        )
+        if agg.get("success"):
+            # Se não achou itens, gross/fees/funding devem ser 0 e exit_type Unknown — considera sem dados
+            gross = float(agg.get("gross_pnl", 0) or 0)
+            fees = float(agg.get("fees", 0) or 0)
+            funding = float(agg.get("funding", 0) or 0)
+            etype = agg.get("exit_type") or ""
+            if gross != 0 or fees != 0 or funding != 0 or (etype and etype.lower() != "unknown"):
+                info = {
+                    "pnl": float(agg.get("net_pnl", 0) or 0),
+                    "exit_type": agg.get("exit_type"),
+                    "exit_price": None,
+                    "closed_at": None,
+                }
+                logger.debug("[close-confirm] agg info obtida para %s: %s", trade.symbol, str(info))
+                return info
     except Exception:
         logger.exception("[close-confirm] falha no cálculo agregado do PnL para %s. Usando fallback.", trade.symbol)
 
     # 2) Fallback: usa detetive simples (último closedPnL do símbolo)
-    if not info and get_last_closed_trade_info:
-        for i in range(1, attempts + 1):
-            try:
-                info = await get_last_closed_trade_info(trade.symbol)
-                if info:
-                    logger.debug("[close-confirm:fallback] info obtida para %s na tentativa %d: %s", trade.symbol, i, str(info))
-                    break
-                logger.debug("[close-confirm:fallback] sem info para %s na tentativa %d.", trade.symbol, i)
-            except Exception:
-                logger.exception("[close-confirm:fallback] tentativa %d falhou para %s", i, trade.symbol)
-            await asyncio.sleep(delay_seconds)
-
+    if get_last_closed_trade_info:
+        try:
+            info = await get_last_closed_trade_info(trade.symbol)
+            if info:
+                logger.debug("[close-confirm:fallback] info obtida para %s: %s", trade.symbol, str(info))
+                return info
+            logger.debug("[close-confirm:fallback] sem info para %s.", trade.symbol)
+        except Exception:
+            logger.exception("[close-confirm:fallback] tentativa falhou para %s", trade.symbol)
+    return None
+
+
+def _closed_info_fetcher(api_key: str, api_secret: str) -> Callable[[str], Awaitable[Optional[Dict[str, Any]]]]:
+    """Wrapper para o detetive: usa as credenciais do usuário e adapta o formato."""
+    async def _fetch_closed_info(symbol: str) -> Optional[Dict[str, Any]]:
+        res = await get_last_closed_trade_info(api_key, api_secret, symbol)
+        if not res or not res.get("success"):
+            return None
+        d = res.get("data") or {}
+        return {
+            "pnl": float(d.get("closedPnl", 0.0)) if d.get("closedPnl") is not None else None,
+            "exit_type": d.get("exitType"),
+            "exit_price": d.get("exitPrice"),
+            "closed_at": d.get("closedAt"),
+        }
+    return _fetch_closed_info
+
+
+def _build_close_summary_text(trade, info: Optional[Dict[str, Any]]) -> str:
+    """Texto final do card: resumo com PnL quando há info, ou aviso de encerramento sem detalhes."""
     def _fmt_money(v):
         try:
             return f"${float(v):,.2f}"
@@ -1322,74 +1293,116 @@ async def confirm_and_close_trade(
         lines.append("• Detalhes de saída/PnL não disponíveis no momento.")
         lines.append("• O resumo pode aparecer nas próximas sincronizações.")
         final_text = "\n".join(lines)
+    return final_text
 
-    # Edita a mensagem no Telegram
-    try:
-        if getattr(trade, "notification_message_id", None):
-            await application.bot.edit_message_text(
-                chat_id=user.telegram_id,
-                message_id=trade.notification_message_id,
-                text=final_text,
-                parse_mode="HTML",
-            )
-    except Exception:
-        logger.exception("[close-confirm] Falha ao editar mensagem final para %s.", trade.symbol)
 
-    # --- Persistência no DB quando houver info confirmada ---
-    if info:
-        try:
-            pnl = info.get("pnl")
-            exit_type = (info.get("exit_type") or "").lower()
-            status = (
-                "CLOSED_PROFIT" if exit_type.startswith("take")
-                else "CLOSED_LOSS" if exit_type.startswith("stop")
-                else ("CLOSED_PROFIT" if (pnl is not None and float(pnl) >= 0) else "CLOSED_LOSS" if pnl is not None else "CLOSED")
-            )
+def _persist_confirmed_close(db, user, trade, info: Dict[str, Any]) -> bool:
+    """Grava status/PnL/closed_at do fechamento confirmado e agenda a remoção do card."""
+    invalidate_wallet(user.telegram_id)
+    side = getattr(trade, "side", "") or ""
+    # SAVEPOINT: uma falha aqui desfaz só este fechamento, não as mutações ainda
+    # adiadas no write-behind da passada (db.rollback() descartaria todas)
+    savepoint = db.begin_nested()
+    try:
+        pnl = info.get("pnl")
+        exit_type = (info.get("exit_type") or "").lower()
+        status = (
+            "CLOSED_PROFIT" if exit_type.startswith("take")
+            else "CLOSED_LOSS" if exit_type.startswith("stop")
+            else ("CLOSED_PROFIT" if (pnl is not None and float(pnl) >= 0) else "CLOSED_LOSS" if pnl is not None else "CLOSED")
+        )
 
-            trade.status = status
-            if pnl is not None:
-                try:
-                    trade.closed_pnl = float(pnl)
-                except Exception:
-                    logger.warning("[close-confirm] PnL inválido para %s: %s", trade.symbol, pnl)
+        trade.status = status
+        if pnl is not None:
+            try:
+                trade.closed_pnl = float(pnl)
+            except Exception:
+                logger.warning("[close-confirm] PnL inválido para %s: %s", trade.symbol, pnl)
 
-            closed_at_val = info.get("closed_at")
-            if closed_at_val:
-                try:
-                    from datetime import datetime
-                    if isinstance(closed_at_val, (int, float)):
-                        ts = float(closed_at_val)
-                        if ts > 10_000_000_000:
-                            ts = ts / 1000.0
-                        # Store timezone-aware UTC timestamps in DB columns configured with timezone=True
-                        trade.closed_at = datetime.utcfromtimestamp(ts).replace(tzinfo=pytz.utc)
-                    elif isinstance(closed_at_val, str):
-                        trade.closed_at = datetime.fromisoformat(closed_at_val.replace("Z", "+00:00"))
-                    else:
-                        trade.closed_at = func.now()
-                except Exception:
-                    logger.debug("[close-confirm] Falha ao parsear closed_at (%s) para %s; usando now().",
-                                 str(closed_at_val), trade.symbol, exc_info=True)
+        closed_at_val = info.get("closed_at")
+        if closed_at_val:
+            try:
+                from datetime import datetime
+                if isinstance(closed_at_val, (int, float)):
+                    ts = float(closed_at_val)
+                    if ts > 10_000_000_000:
+                        ts = ts / 1000.0
+                    # Store timezone-aware UTC timestamps in DB columns configured with timezone=True
+                    trade.closed_at = datetime.utcfromtimestamp(ts).replace(tzinfo=pytz.utc)
+                elif isinstance(closed_at_val, str):
+                    trade.closed_at = datetime.fromisoformat(closed_at_val.replace("Z", "+00:00"))
+                else:
                     trade.closed_at = func.now()
-            else:
+            except Exception:
+                logger.debug("[close-confirm] Falha ao parsear closed_at (%s) para %s; usando now().",
+                             str(closed_at_val), trade.symbol, exc_info=True)
                 trade.closed_at = func.now()
+        else:
+            trade.closed_at = func.now()
+
+        trade.remaining_qty = 0.0
+        schedule_trade_card_deletion(db, user, trade)
+        savepoint.commit()
+        commit_deferred(db, "close-confirm")
+        record_trade_close(db, trade)
+        # Só depois de persistido: numa falha o trade segue ativo com seus contadores
+        forget_trade(getattr(trade, "id", None))
+        forget_trade_state(getattr(trade, "id", None))
+
+        logger.info(
+            "[close-confirm] fechamento_real_persistido symbol=%s side=%s status=%s pnl=%s exit_type=%s exit_price=%s closed_at=%s",
+            trade.symbol, side, trade.status, str(getattr(trade, "closed_pnl", None)),
+            info.get("exit_type"), str(info.get("exit_price")), str(getattr(trade, "closed_at", None))
+        )
+        return True
+    except Exception:
+        if savepoint.is_active:
+            savepoint.rollback()
+        logger.exception("[close-confirm] Falha ao persistir fechamento real para %s.", trade.symbol)
+        return False
 
-            trade.remaining_qty = 0.0
-            db.commit()
 
-            logger.info(
-                "[close-confirm] fechamento_real_persistido symbol=%s side=%s status=%s pnl=%s exit_type=%s exit_price=%s closed_at=%s",
-                trade.symbol, side, trade.status, str(getattr(trade, "closed_pnl", None)),
-                info.get("exit_type"), str(info.get("exit_price")), str(getattr(trade, "closed_at", None))
-            )
-            return True
-        except Exception:
-            db.rollback()
-            logger.exception("[close-confirm] Falha ao persistir fechamento real para %s.", trade.symbol)
-            return False
+async def confirm_and_close_trade(
+    *,
+    application,
+    user,
+    trade,
+    db,  # sessão do banco
+    get_last_closed_trade_info: Optional[Callable[[str], Awaitable[Optional[Dict[str, Any]]]]] = None,
+    attempts: int = 3,
+    delay_seconds: float = 6.0,
+    fallback_text: Optional[str] = None,
+) -> bool:
+    """
+    Antes de marcar CLOSED_GHOST, tenta confirmar fechamento real.
+    Se encontrar dados, edita o card com resumo e FECHA/PERSISTE no DB.
+    Retorna True se persistiu fechamento com dados; False caso contrário.
+
+    Versão síncrona (espera entre tentativas). O rastreador usa a fila de
+    core/close_confirmation.py, que reaproveita as mesmas etapas sem bloquear o ciclo.
+    """
+    info = None
+    for i in range(1, attempts + 1):
+        info = await _fetch_close_info(user, trade, get_last_closed_trade_info)
+        if info:
+            break
+        if i < attempts:
+            await asyncio.sleep(delay_seconds)
+
+    final_text = _build_close_summary_text(trade, info)
+
+    # Edita a mensagem no Telegram
+    try:
+        if getattr(trade, "notification_message_id", None):
+            get_dispatcher(application).edit(user.telegram_id, trade.notification_message_id, final_text, parse_mode="HTML")
+    except Exception:
+        logger.exception("[close-confirm] Falha ao editar mensagem final para %s.", trade.symbol)
+
+    if info:
+        return _persist_confirmed_close(db, user, trade, info)
 
     # Sem info confirmada
-    logger.info("[close-confirm] sem_dados_confirmados symbol=%s side=%s -> manter fallback", trade.symbol, side)
+    logger.info("[close-confirm] sem_dados_confirmados symbol=%s side=%s -> manter fallback", trade.symbol, getattr(trade, "side", ""))
     return False
 
 # [ATUALIZAÇÃO] política de tolerância + UX etapa 2
@@ -1400,7 +1413,6 @@ async def apply_missing_cycles_policy(
     db_active_trades,
     bybit_keys,
     threshold: int = 3,
-    get_last_closed_trade_info: Optional[Callable[[str], Awaitable[Optional[Dict[str, Any]]]]] = None,
 ):
     bybit_symbols = {k[0] for k in bybit_keys}
 
@@ -1426,86 +1438,149 @@ async def apply_missing_cycles_policy(
             logger.info("[sync] estado_sincronizando symbol=%s side=%s ciclo=2/%d", t.symbol, t.side, threshold)
 
         if t.missing_cycles >= threshold:
-            logger.info("[sync] limiar_fechamento symbol=%s side=%s ciclo=%d/%d iniciando_detetive",
-                        t.symbol, t.side, t.missing_cycles, threshold)
-
-            persisted = await confirm_and_close_trade(
-                application=application,
-                user=user,
-                trade=t,
-                db=db,
-                get_last_closed_trade_info=get_last_closed_trade_info,
-            )
-
-            if persisted:
-                try:
-                    if not getattr(t, "status", None) or not str(t.status).startswith("CLOSED"):
-                        t.status = "CLOSED"
-                    if getattr(t, "remaining_qty", None) is None:
-                        t.remaining_qty = 0.0
-                    db.commit()
-                except Exception:
-                    db.rollback()
-                    logger.exception("[sync] Falha ao consolidar fechamento real de %s.", t.symbol)
-
-                logger.info("[sync] fechamento_real_consolidado symbol=%s side=%s status=%s pnl=%s",
-                            t.symbol, t.side, t.status, str(getattr(t, "closed_pnl", None)))
-                if getattr(t, "id", None) is not None:
-                    clear_sync_flag(t.id)
-                continue
-
-            # Fallback -> CLOSED_GHOST
-            t.status = "CLOSED_GHOST"
-            t.closed_at = func.now()
-            t.closed_pnl = t.closed_pnl or 0.0
-            t.remaining_qty = 0.0
-            logger.info("[sync] fallback_ghost symbol=%s side=%s motivo=no-info", t.symbol, t.side)
-            if getattr(t, "id", None) is not None:
-                clear_sync_flag(t.id)
+            # A confirmação (consulta de PnL com novas tentativas e fallback para
+            # CLOSED_GHOST) roda na fila de core/close_confirmation.py; o ciclo segue.
+            if getattr(t, "id", None) is not None and enqueue_close_confirmation(user.telegram_id, t.id):
+                logger.info("[sync] limiar_fechamento symbol=%s side=%s ciclo=%d/%d confirmacao_enfileirada",
+                            t.symbol, t.side, t.missing_cycles, threshold)
+
+
+def mark_trade_as_ghost(db, user, trade) -> None:
+    """Fallback quando não há dados de fechamento: CLOSED_GHOST com PnL zerado (ou o já conhecido)."""
+    trade.status = "CLOSED_GHOST"
+    forget_trade(getattr(trade, "id", None))
+    trade.closed_at = func.now()
+    trade.closed_pnl = trade.closed_pnl or 0.0
+    trade.remaining_qty = 0.0
+    # Sem record_trade_close: o PnL zerado do ghost apagaria as parciais do dia
+    try:
+        schedule_trade_card_deletion(db, user, trade)
+    except Exception:
+        logger.exception("[sync] falha ao agendar remoção do card de %s", trade.symbol)
+    logger.info("[sync] fallback_ghost symbol=%s side=%s motivo=no-info", trade.symbol, trade.side)
+    if getattr(trade, "id", None) is not None:
+        clear_sync_flag(trade.id)
+        forget_trade_state(trade.id)
 
 async def _send_or_edit_trade_message(
     application: Application,
     user: User,
     trade: Trade,
     db: Session,
-    text: str
+    text: str,
+    *,
+    throttle: bool = False,
 ) -> None:
     """
     Atualiza a 'mensagem viva' do trade de forma resiliente:
-    - Se existe message_id → tenta editar.
+    - Se o conteúdo é igual ao último card entregue/enfileirado → não faz nada.
+    - Se throttle=True e a última edição foi há menos de TF_CARD_MIN_EDIT_SECONDS →
+      guarda o texto como pendente e o envia quando o intervalo acabar.
+    - Se um card novo ainda está na fila de envio → guarda o texto como pendente
+      e o envia como edição assim que o envio sair (nada é descartado).
+    - Se existe message_id → enfileira a edição no despachante.
     - Se a edição falhar (mensagem apagada/não editável) → envia nova
-      e atualiza trade.notification_message_id no banco.
+      e grava o novo notification_message_id quando o envio sair.
+    O hash só é gravado no on_sent do despachante (entrega confirmada).
+    Nunca espera pelo Telegram.
     """
-    # 1) Tenta editar se já temos uma mensagem anterior
-    if getattr(trade, "notification_message_id", None):
-        try:
-            await application.bot.edit_message_text(
-                chat_id=user.telegram_id,
-                message_id=trade.notification_message_id,
-                text=text,
-                parse_mode="HTML",
-            )
-            return  # sucesso, nada mais a fazer
-        except BadRequest:
-            # Qualquer falha típica de edição (apagada, muito antiga, etc.) → recriar
-            pass
-        except Exception:
-            # Falha inesperada → também tenta recriar como fallback
-            pass
-
-    # 2) Não havia mensagem ou edição falhou → envia nova
-    new_msg = await application.bot.send_message(
-        chat_id=user.telegram_id,
-        text=text,
-        parse_mode="HTML",
-    )
-    trade.notification_message_id = new_msg.message_id
-    logger.info("[msg:new] %s/%s nova_msg_id=%s",
-            trade.symbol, trade.side, str(trade.notification_message_id))
+    trade_id = getattr(trade, "id", None)
+    message_id = getattr(trade, "notification_message_id", None)
+    if trade_id is None:
+        state: Dict[str, Any] = {}
+    else:
+        state = _CARD_CACHE.setdefault(trade_id, {})
+    if not state.get("sending") and state.get("message_id") != message_id:
+        # Card trocado por fora (ou primeiro envio): o que sabíamos não vale mais
+        _cancel_pending_card(state)
+        state.clear()
+        state["message_id"] = message_id
+    ctx = (get_dispatcher(application), user.telegram_id, trade_id, f"{trade.symbol}/{trade.side}")
+
+    if state.get("sending"):
+        # Já existe um card novo na fila de envio; o texto mais recente sai como edição depois
+        state["pending"] = text
+        _CARD_STATS["throttled"] += 1
+        return
+    digest = _card_hash(text)
+    if state.get("message_id") and digest == (state.get("queued") or state.get("hash")):
+        _cancel_pending_card(state)
+        _CARD_STATS["hits"] += 1
+        return
+    if throttle and state.get("message_id") and _CARD_MIN_EDIT_SECONDS > 0:
+        wait = _CARD_MIN_EDIT_SECONDS - (time.monotonic() - float(state.get("edited_at") or 0.0))
+        if wait > 0:
+            state["pending"] = text
+            if state.get("timer") is None and trade_id is not None:
+                state["timer"] = asyncio.get_running_loop().call_later(wait, _flush_pending_card, ctx)
+            _CARD_STATS["throttled"] += 1
+            return
+
+    _cancel_pending_card(state)
+    _dispatch_card(ctx, state, text)
+
+
+def _cancel_pending_card(state: Dict[str, Any]) -> None:
+    state.pop("pending", None)
+    timer = state.pop("timer", None)
+    if timer is not None:
+        timer.cancel()
+
+
+def _flush_pending_card(ctx: tuple) -> None:
+    """Fim do intervalo mínimo (ou envio concluído): entrega o texto pendente, se houver."""
+    trade_id = ctx[2]
+    state = _CARD_CACHE.get(trade_id)
+    if state is None:
+        return
+    state.pop("timer", None)
+    text = state.pop("pending", None)
+    if text is None or state.get("sending"):
+        if text is not None:
+            state["pending"] = text
+        return
+    if state.get("message_id") and _card_hash(text) == (state.get("queued") or state.get("hash")):
+        return
+    _dispatch_card(ctx, state, text)
+
+
+def _dispatch_card(ctx: tuple, state: Dict[str, Any], text: str) -> None:
+    """Enfileira a edição (ou o envio de um card novo) e registra o hash no on_sent."""
+    dispatcher, chat_id, trade_id, label = ctx
+    digest = _card_hash(text)
+    message_id = state.get("message_id")
+    _CARD_STATS["misses"] += 1
+
+    def _send_new(_exc=None) -> None:
+        _cancel_pending_card(state)
+        state.update({"sending": True, "hash": None, "queued": None})
+        persist_new_id = _persist_trade_message_id(trade_id)
+
+        def _on_sent(msg) -> None:
+            state.update({"sending": False, "message_id": getattr(msg, "message_id", None),
+                          "hash": digest, "queued": None, "edited_at": time.monotonic()})
+            persist_new_id(msg)
+            _flush_pending_card(ctx)
+
+        def _on_error(exc) -> None:
+            _forget_card(trade_id)
+            logger.warning("[msg:new] falha ao enviar card de %s: %s", label, exc)
+
+        dispatcher.send(chat_id, text, parse_mode="HTML", on_sent=_on_sent, on_error=_on_error)
+
+    # 1) Edita se já temos uma mensagem anterior; se a edição falhar (apagada,
+    #    muito antiga...), o despachante chama _send_new para recriar o card
+    if message_id:
+        def _on_edited(_result) -> None:
+            if state.get("message_id") == message_id:
+                state["hash"] = digest
+                if state.get("queued") == digest:
+                    state["queued"] = None
+
+        state["queued"] = digest
+        state["edited_at"] = time.monotonic()
+        dispatcher.edit(chat_id, message_id, text, parse_mode="HTML", on_sent=_on_edited, on_error=_send_new)
+        return
 
-    # 3) Persiste o novo ID no banco
-    try:
-        db.commit()
-    except Exception:
-        db.rollback()
-        raise
+    # 2) Não havia mensagem → envia nova (o ID é gravado no Trade quando sair)
+    _send_new()
@@ -0,0 +1,179 @@
+"""
+Índice em memória para o roteamento de sinais.
+
+Em vez de carregar todos os usuários com chave a cada sinal e reavaliar
+whitelist (string), modo dormir, pausas do disjuntor e bot ativo, mantemos por
+usuário uma rota pré-compilada e um mapa símbolo -> usuários. O roteamento vira
+uma busca em conjunto; as checagens que dependem de horário (modo dormir,
+expiração de pausas) são comparações simples sobre valores já normalizados.
+
+Atualização: eventos do mapper de User marcam o usuário como sujo e ele é
+recarregado na próxima consulta; uma reconstrução completa acontece a cada
+TF_ROUTING_INDEX_TTL_SECONDS como rede de segurança (ex.: UPDATE em massa).
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+import pytz
+from sqlalchemy import event
+
+from database.models import User
+from core.whitelist_service import compile_whitelist
+
+logger = logging.getLogger(__name__)
+
+BR_TZ = pytz.timezone("America/Sao_Paulo")
+
+try:
+    _TTL_SECONDS = float(os.getenv("TF_ROUTING_INDEX_TTL_SECONDS", "300") or "300")
+except Exception:
+    _TTL_SECONDS = 300.0
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None:
+        return None
+    if getattr(value, "tzinfo", None) is None:
+        return value.replace(tzinfo=pytz.utc)
+    return value
+
+
+class _UserRoute:
+    """Estado de roteamento de um usuário, já normalizado."""
+
+    __slots__ = ("telegram_id", "sleep_mode", "whitelist", "long_until", "short_until", "scope", "reversal_override")
+
+    def __init__(self, user: User):
+        self.telegram_id = user.telegram_id
+        self.sleep_mode = bool(user.is_sleep_mode_enabled)
+        self.whitelist: Optional[FrozenSet[str]] = compile_whitelist(user.coin_whitelist)
+        self.long_until = _as_utc(user.long_trades_paused_until)
+        self.short_until = _as_utc(user.short_trades_paused_until)
+        self.scope = (getattr(user, "circuit_breaker_scope", "SIDE") or "SIDE").upper()
+        self.reversal_override = bool(getattr(user, "reversal_override_enabled", False))
+
+    def paused(self, side: Optional[str], now_utc: datetime) -> bool:
+        long_p = self.long_until is not None and now_utc < self.long_until
+        short_p = self.short_until is not None and now_utc < self.short_until
+        if self.scope == "GLOBAL":
+            return long_p or short_p
+        if self.scope == "SYMBOL":
+            return False  # pausa por símbolo fica em symbol_pauses (core/symbol_breaker.py)
+        return (side == "LONG" and long_p) or (side == "SHORT" and short_p)
+
+    def accepts(self, side: Optional[str], now_utc: datetime, br_hour: int) -> bool:
+        # O bot fica offline das 00:00 (incluso) até 07:00 (excluso)
+        if self.sleep_mode and 0 <= br_hour < 7:
+            return False
+        # Com override de reversão a pausa ainda pode virar probe: decide a checagem por usuário
+        if not self.reversal_override and self.paused(side, now_utc):
+            return False
+        return True
+
+
+class RoutingIndex:
+    def __init__(self, ttl_seconds: float = _TTL_SECONDS):
+        self.ttl = ttl_seconds
+        self._routes: Dict[int, _UserRoute] = {}
+        self._unrestricted: Set[int] = set()
+        self._by_symbol: Dict[str, Set[int]] = {}
+        self._dirty: Set[int] = set()
+        self._lock = threading.Lock()
+        self._built_at = 0.0
+        self.stats = {"rebuilds": 0, "refreshed": 0, "lookups": 0}
+
+    # -------------------------------------------------------------- manutenção
+    @staticmethod
+    def _eligible(user: User) -> bool:
+        return bool(user.api_key_encrypted) and bool(user.is_active)
+
+    def _drop(self, user_id: int) -> None:
+        route = self._routes.pop(user_id, None)
+        if route is None:
+            return
+        if route.whitelist is None:
+            self._unrestricted.discard(user_id)
+        else:
+            for sym in route.whitelist:
+                ids = self._by_symbol.get(sym)
+                if ids is not None:
+                    ids.discard(user_id)
+                    if not ids:
+                        del self._by_symbol[sym]
+
+    def _put(self, user: User) -> None:
+        self._drop(user.telegram_id)
+        if not self._eligible(user):
+            return
+        route = _UserRoute(user)
+        self._routes[user.telegram_id] = route
+        if route.whitelist is None:
+            self._unrestricted.add(user.telegram_id)
+        else:
+            for sym in route.whitelist:
+                self._by_symbol.setdefault(sym, set()).add(user.telegram_id)
+
+    def rebuild(self, db) -> None:
+        users = db.query(User).filter(User.api_key_encrypted.isnot(None)).all()
+        with self._lock:
+            self._routes.clear()
+            self._unrestricted.clear()
+            self._by_symbol.clear()
+            self._dirty.clear()
+            for u in users:
+                self._put(u)
+            self._built_at = time.monotonic()
+            self.stats["rebuilds"] += 1
+        logger.info("[routing] índice reconstruído: %d usuário(s) elegíveis", len(self._routes))
+
+    def mark_dirty(self, user_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._dirty.update(uid for uid in user_ids if uid is not None)
+
+    def _refresh(self, db) -> None:
+        if not self._built_at or time.monotonic() - self._built_at >= self.ttl:
+            self.rebuild(db)
+            return
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        fresh = {u.telegram_id: u for u in db.query(User).filter(User.telegram_id.in_(list(dirty))).all()}
+        with self._lock:
+            for uid in dirty:
+                if uid in fresh:
+                    self._put(fresh[uid])
+                else:
+                    self._drop(uid)
+            self.stats["refreshed"] += len(dirty)
+
+    # ------------------------------------------------------------------ consulta
+    def candidates(self, db, symbol: str, side: Optional[str], now_utc: Optional[datetime] = None) -> List[int]:
+        """Usuários que podem aceitar (symbol, side) agora."""
+        self._refresh(db)
+        now_utc = now_utc or datetime.now(pytz.utc)
+        br_hour = now_utc.astimezone(BR_TZ).hour
+        with self._lock:
+            self.stats["lookups"] += 1
+            ids = self._unrestricted | self._by_symbol.get((symbol or "").upper(), set())
+            return [uid for uid in ids if self._routes[uid].accepts(side, now_utc, br_hour)]
+
+    def route(self, user_id: int) -> Optional[_UserRoute]:
+        return self._routes.get(user_id)
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+
+routing_index = RoutingIndex()
+
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _on_user_change(mapper, connection, target) -> None:
+    routing_index.mark_dirty([getattr(target, "telegram_id", None)])
@@ -0,0 +1,216 @@
+"""
+Pausas do disjuntor por símbolo (escopo SYMBOL), duráveis e compartilhadas.
+
+As pausas ficam na tabela symbol_pauses (PK usuário+símbolo, índice em
+paused_until) e são lidas através de um cache em memória por usuário (LRU
+limitado por TF_SYMBOL_PAUSE_CACHE_USERS). Gravar uma pausa faz um NOTIFY no
+canal tf_symbol_pauses na mesma transação; o listener de cada processo descarta
+o usuário do cache e a próxima leitura vem do banco. Um worker remove as linhas
+vencidas periodicamente. Sobrevivem a deploys e valem para todos os workers.
+"""
+import asyncio
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict
+
+import pytz
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from database.session import SessionLocal, engine
+from database.models import SymbolPause
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "tf_symbol_pauses"
+
+try:
+    _CACHE_USERS = max(1, int(os.getenv("TF_SYMBOL_PAUSE_CACHE_USERS", "5000") or "5000"))
+except Exception:
+    _CACHE_USERS = 5000
+try:
+    _PURGE_SECONDS = float(os.getenv("TF_SYMBOL_PAUSE_PURGE_SECONDS", "600") or "600")
+except Exception:
+    _PURGE_SECONDS = 600.0
+
+# user_id -> {symbol: paused_until (UTC)}; só pausas ainda vigentes
+_CACHE: "OrderedDict[int, Dict[str, datetime]]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=pytz.utc) if value.tzinfo is None else value.astimezone(pytz.utc)
+
+
+def _load_user(user_id: int, now: datetime) -> Dict[str, datetime]:
+    db = SessionLocal()
+    try:
+        rows = db.query(SymbolPause.symbol, SymbolPause.paused_until).filter(
+            SymbolPause.user_telegram_id == user_id,
+            SymbolPause.paused_until > now,
+        ).all()
+    finally:
+        db.close()
+    return {symbol: _as_utc(until) for symbol, until in rows}
+
+
+def _cached_user(user_id: int, now: datetime) -> Dict[str, datetime]:
+    with _LOCK:
+        entry = _CACHE.get(user_id)
+        if entry is not None:
+            _CACHE.move_to_end(user_id)
+            for symbol in [s for s, until in entry.items() if until <= now]:
+                del entry[symbol]
+            return entry
+    entry = _load_user(user_id, now)
+    with _LOCK:
+        _CACHE[user_id] = entry
+        _CACHE.move_to_end(user_id)
+        while len(_CACHE) > _CACHE_USERS:
+            _CACHE.popitem(last=False)
+    return entry
+
+
+def is_symbol_paused(user_id: int, symbol: str) -> bool:
+    now = datetime.now(pytz.utc)
+    until = _cached_user(user_id, now).get(symbol)
+    return until is not None and now < until
+
+
+def pause_symbol(user_id: int, symbol: str, minutes: int) -> datetime:
+    """Grava (upsert) a pausa, avisa os demais processos e atualiza o cache local."""
+    until = datetime.now(pytz.utc) + timedelta(minutes=minutes)
+    db = SessionLocal()
+    try:
+        db.execute(pg_insert(SymbolPause.__table__).values(
+            user_telegram_id=user_id, symbol=symbol, paused_until=until,
+        ).on_conflict_do_update(
+            index_elements=['user_telegram_id', 'symbol'],
+            set_={"paused_until": until},
+        ))
+        # Entregue pelo Postgres no commit, para todos os processos em LISTEN
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": str(user_id)})
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    with _LOCK:
+        entry = _CACHE.get(user_id)
+        if entry is not None:
+            entry[symbol] = until
+    return until
+
+
+def invalidate_user(user_id: int) -> None:
+    with _LOCK:
+        _CACHE.pop(user_id, None)
+
+
+def purge_expired() -> int:
+    """Remove do banco as pausas vencidas. Retorna quantas linhas saíram."""
+    db = SessionLocal()
+    try:
+        deleted = db.query(SymbolPause).filter(
+            SymbolPause.paused_until <= datetime.now(pytz.utc)
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _handle_notifications(conn) -> None:
+    conn.poll()
+    while conn.notifies:
+        note = conn.notifies.pop(0)
+        try:
+            invalidate_user(int(note.payload))
+        except (TypeError, ValueError):
+            logger.warning("[symbol-breaker] payload inválido em %s: %r", CHANNEL, note.payload)
+
+
+def _connect_listener():
+    """
+    Conexão psycopg2 própria, fora do pool do engine: fica presa no LISTEN para
+    sempre e precisa de autocommit, que não deve vazar para conexões do pool.
+    """
+    import psycopg2
+
+    cargs, cparams = engine.dialect.create_connect_args(engine.url)
+    # keepalive TCP: conexão morta sem FIN também acorda o add_reader
+    params = {"keepalives": 1, "keepalives_idle": 60, "keepalives_interval": 10, "keepalives_count": 3}
+    params.update(cparams)
+    conn = psycopg2.connect(*cargs, **params)
+    conn.autocommit = True
+    return conn
+
+
+async def _listen_forever() -> None:
+    """LISTEN no canal via conexão psycopg2 dedicada; reconecta em caso de falha."""
+    loop = asyncio.get_running_loop()
+    while True:
+        conn = None
+        try:
+            conn = await asyncio.to_thread(_connect_listener)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL};")
+            # Pode ter perdido avisos enquanto desconectado: recomeça com cache vazio
+            with _LOCK:
+                _CACHE.clear()
+            logger.info("[symbol-breaker] ouvindo %s", CHANNEL)
+
+            lost = loop.create_future()
+
+            def _on_readable() -> None:
+                try:
+                    _handle_notifications(conn)
+                except Exception as exc:
+                    if not lost.done():
+                        lost.set_exception(exc)
+
+            fd = conn.fileno()
+            loop.add_reader(fd, _on_readable)
+            try:
+                await lost
+            finally:
+                loop.remove_reader(fd)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("[symbol-breaker] listener caiu; reconectando em 5s")
+            await asyncio.sleep(5)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+async def _purge_forever() -> None:
+    while True:
+        await asyncio.sleep(_PURGE_SECONDS)
+        try:
+            removed = await asyncio.to_thread(purge_expired)
+            if removed:
+                logger.info("[symbol-breaker] %d pausa(s) vencida(s) removida(s)", removed)
+        except Exception:
+            logger.exception("[symbol-breaker] falha ao remover pausas vencidas")
+
+
+async def run_symbol_breaker_worker() -> None:
+    """Listener de invalidação (Postgres) + limpeza periódica das pausas vencidas."""
+    jobs = [_purge_forever()]
+    if engine.dialect.name == "postgresql":
+        jobs.append(_listen_forever())
+    else:
+        logger.warning("[symbol-breaker] banco sem LISTEN/NOTIFY; cache local apenas neste processo.")
+    await asyncio.gather(*jobs)
@@ -0,0 +1,105 @@
+"""
+Escada de take profit na corretora.
+
+Ao abrir o trade (mercado ou promoção da limite executada), cada TP do plano de
+saída (core/exit_plan.py) vira uma ordem Limit reduce-only com a quantidade do plano. O TP passa
+a executar na velocidade da corretora; o rastreador só reconcilia as execuções
+(uma listagem de ordens abertas por usuário e ciclo) em vez de perseguir preço.
+
+Alvos sem perna aberta (falha ao colocar, ordem cancelada) seguem pelo
+acompanhamento por preço de sempre. Com a posição zerada a Bybit cancela as
+reduce-only restantes.
+"""
+import logging
+import os
+from typing import Any, Dict, List, Optional, Set
+
+from services.bybit_service import cancel_order, get_order_status, place_tp_ladder
+from core.exit_plan import ensure_exit_plan, pending_tps
+
+logger = logging.getLogger(__name__)
+
+_LADDER_ENABLED = (os.getenv("TF_EXCHANGE_TP_LADDER", "1") or "1").strip().lower() in ("1", "true", "yes", "on")
+
+_DONE_STATUSES = ("CANCELLED", "CANCELED", "REJECTED", "DEACTIVATED", "EXPIRED")
+
+
+def open_legs(trade) -> List[Dict[str, Any]]:
+    return [leg for leg in (getattr(trade, "tp_orders", None) or []) if leg.get("status") == "open"]
+
+
+def leg_indices(leg: Dict[str, Any]) -> List[int]:
+    """Índices do plano cobertos pela perna (os somados por estarem abaixo do mínimo + o próprio)."""
+    return [int(k) for k in (leg.get("covers") or [leg["i"]])]
+
+
+def covered_indices(trade) -> Set[int]:
+    """Índices do plano que já têm ordem na corretora (o acompanhamento por preço os ignora)."""
+    return {k for leg in open_legs(trade) for k in leg_indices(leg)}
+
+
+async def place_ladder_for_trade(trade, user, api_key: str, api_secret: str) -> bool:
+    """Coloca a escada do trade (2+ TPs no plano). Não faz commit; retorna True se alguma perna entrou."""
+    if not _LADDER_ENABLED:
+        return False
+    tps = pending_tps(await ensure_exit_plan(trade, user))
+    if len(tps) < 2:
+        return False
+
+    # Merge com trade existente: a escada antiga não vale mais
+    for leg in open_legs(trade):
+        try:
+            await cancel_order(api_key, api_secret, leg["id"], trade.symbol)
+        except Exception:
+            logger.exception("[tp:ladder] falha ao cancelar perna antiga %s de %s", leg.get("id"), trade.symbol)
+
+    legs = [{"i": k, "target": price, "qty": qty} for k, price, qty, _sl in tps if qty > 0]
+    if not legs:
+        trade.tp_orders = None
+        return False
+
+    result = await place_tp_ladder(api_key, api_secret, trade.symbol, trade.side, legs)
+    orders = result.get("orders") or []
+    trade.tp_orders = orders or None
+    if result.get("errors") or result.get("error"):
+        logger.warning("[tp:ladder] %s %s: %d/%d pernas colocadas; restante segue por preço. erros=%s",
+                       trade.symbol, trade.side, len(orders), len(legs), result.get("errors") or result.get("error"))
+    else:
+        logger.info("[tp:ladder] %s %s: %d pernas reduce-only colocadas", trade.symbol, trade.side, len(orders))
+    return bool(orders)
+
+
+async def reconcile_tp_orders(trade, api_key: str, api_secret: str, open_order_ids: Set[str]) -> List[Dict[str, Any]]:
+    """
+    Confere as pernas abertas contra as ordens abertas da corretora.
+    Retorna as pernas encerradas neste ciclo: [{"i","target","qty","status","covers"}], com qty executada.
+    Não faz commit.
+    """
+    legs = getattr(trade, "tp_orders", None) or []
+    if not legs:
+        return []
+
+    events: List[Dict[str, Any]] = []
+    updated: List[Dict[str, Any]] = []
+    for leg in legs:
+        leg = dict(leg)
+        if leg.get("status") == "open" and leg.get("id") and leg["id"] not in open_order_ids:
+            status_res = await get_order_status(api_key, api_secret, leg["id"], trade.symbol)
+            data: Optional[Dict[str, Any]] = status_res.get("data") if status_res.get("success") else None
+            if data is not None:
+                status = (data.get("orderStatus") or "").strip()
+                exec_qty = float(data.get("cumExecQty") or 0.0)
+                if status.upper() == "FILLED":
+                    leg["status"] = "filled"
+                elif status.upper() in _DONE_STATUSES:
+                    leg["status"] = "cancelled"
+                if leg["status"] != "open":
+                    leg["filled"] = exec_qty
+                    events.append({"i": leg["i"], "target": leg["target"], "qty": exec_qty,
+                                   "status": leg["status"], "covers": leg_indices(leg)})
+        updated.append(leg)
+
+    if events:
+        # Reatribui a lista para o SQLAlchemy detectar a mudança na coluna JSON
+        trade.tp_orders = updated
+    return events
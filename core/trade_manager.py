@@ -2,64 +2,55 @@ import os
 import asyncio
 import logging
 import pytz
-import pandas as pd
-import pandas_ta as ta
-from typing import Tuple
+from typing import Any, Dict, List, Tuple
 from telegram.ext import Application
 from sqlalchemy.orm import Session
-from database.session import SessionLocal
+from database.session import SessionLocal, POOL_SIZE, MAX_OVERFLOW
 from database.models import User, Trade, PendingSignal, SignalForApproval
 from services.bybit_service import (
-    place_order, get_account_info,
+    place_order,
     place_limit_order, cancel_order,
     get_order_history,
-    get_historical_klines,
-    get_daily_pnl,
+    get_instrument_info, get_market_price,
 )
 from services.notification_service import send_notification, send_user_alert
-from utils.security import decrypt_data
+from services.telegram_dispatcher import get_dispatcher
+from services.wallet_cache import get_cached_account_info, invalidate_wallet
+from utils.tracing import span
+from database.crud import set_message_id
+from utils.security import get_user_credentials
 from utils.config import ADMIN_ID
 from bot.keyboards import signal_approval_keyboard
 from services.signal_parser import SignalType
 from core.whitelist_service import is_coin_in_whitelist
+from core.exit_plan import plan_trade_exits
+from core.tp_ladder import place_ladder_for_trade
+from core.position_tracker import _send_or_edit_trade_message
+from core.routing_index import routing_index
+from core.breaker_counters import losing_count
+from core.symbol_breaker import is_symbol_paused, pause_symbol
+from core.daily_pnl_ledger import daily_realized_pnl
+from core.indicator_service import (
+    IndicatorSnapshot, RSI_PERIOD, activate_snapshot, required_indicators, reset_snapshot, snapshot_for,
+)
 from datetime import datetime, timedelta
 import time
 
 logger = logging.getLogger(__name__)
 
-_DAILY_PNL_CACHE: dict[int, tuple[float, float]] = {}
-
-async def _get_daily_pnl_cached(api_key: str, api_secret: str, user_id: int, ttl_seconds: int = 60) -> tuple[bool, float]:
-    """Retorna (success, pnl_realizado_do_dia). Usa cache de curto prazo por usuário para reduzir chamadas."""
-    now = time.time()
-    cached = _DAILY_PNL_CACHE.get(user_id)
-    if cached and (now - cached[0] < ttl_seconds):
-        return True, cached[1]
-    try:
-        res = await get_daily_pnl(api_key, api_secret)
-        if res.get("success"):
-            pnl = float(res.get("pnl", 0.0) or 0.0)
-            _DAILY_PNL_CACHE[user_id] = (now, pnl)
-            return True, pnl
-        return False, 0.0
-    except Exception:
-        logger.exception("[daily-pnl] falha ao obter PnL do dia para user_id=%s", user_id)
-        return False, 0.0
-
-# --- Disjuntor: estado em memória por símbolo (escopo SYMBOL) ---
-_SYMBOL_BREAKER: dict[int, dict[str, datetime]] = {}
+try:
+    _FANOUT_REQUESTED = max(1, int(os.getenv("TF_SIGNAL_FANOUT_CONCURRENCY", "4") or "4"))
+except Exception:
+    _FANOUT_REQUESTED = 4
+# Conexões do pool já ocupadas fora do fan-out: sessão externa do process_new_signal,
+# rastreador, fila de confirmação de fechamento, limpeza de mensagens e handlers do bot.
+_POOL_RESERVED = 6
+# Cada tarefa pode segurar 2 conexões (a sua sessão + leitura em cache miss, ex.: pausas
+# do disjuntor). Passar do que sobra no pool travaria o loop no pool_timeout.
+def _fanout_limit(requested: int, pool_size: int, max_overflow: int, reserved: int = _POOL_RESERVED) -> int:
+    return max(1, min(requested, (pool_size + max_overflow - reserved) // 2))
 
-def _is_symbol_paused(user_id: int, symbol: str) -> bool:
-    d = _SYMBOL_BREAKER.get(user_id) or {}
-    until = d.get(symbol)
-    if not until:
-        return False
-    now = datetime.now(pytz.utc)
-    return now < until
-
-def _pause_symbol(user_id: int, symbol: str, minutes: int) -> None:
-    d = _SYMBOL_BREAKER.setdefault(user_id, {})
-    d[symbol] = datetime.now(pytz.utc) + timedelta(minutes=minutes)
+_FANOUT_CONCURRENCY = _fanout_limit(_FANOUT_REQUESTED, POOL_SIZE, MAX_OVERFLOW)
 
 async def _reversal_confirmed(symbol: str, side: str, user: User) -> bool:
     """Confirma reversão simples via MA/RSI (último candle):
@@ -72,26 +63,17 @@ async def _reversal_confirmed(symbol: str, side: str, user: User) -> bool:
         ob = int(getattr(user, 'rsi_overbought_threshold', 70) or 70)
         os_ = int(getattr(user, 'rsi_oversold_threshold', 30) or 30)
 
-        kl = await get_historical_klines(symbol=symbol, interval=tf, limit=200)
-        if not kl.get('success'):
-            return False
-        df = pd.DataFrame(kl['data'], columns=['startTime','open','high','low','close','volume','turnover'])
-        df['close'] = pd.to_numeric(df['close'], errors='coerce')
-        df = df.sort_values('startTime').reset_index(drop=True)
-        df.ta.sma(length=period, append=True)
-        df.ta.rsi(append=True)
-        sma_col = f'SMA_{period}'
-        rsi_col = 'RSI_14'
-        idx = df[sma_col].last_valid_index()
-        if idx is None:
+        snapshot = snapshot_for(symbol)
+        sma = await snapshot.get(tf, "SMA", period)
+        if sma is None:
             return False
-        close = float(df.loc[idx, 'close'])
-        sma = float(df.loc[idx, sma_col])
-        rsi = float(df.loc[idx, rsi_col]) if rsi_col in df.columns and pd.notna(df.loc[idx, rsi_col]) else None
+        rsi_res = await snapshot.get(tf, "RSI", RSI_PERIOD)
+        close, sma_value = sma["close"], sma["value"]
+        rsi = rsi_res["value"] if rsi_res is not None else None
         if side == 'LONG':
-            return (close > sma) and (rsi is None or rsi < ob)
+            return (close > sma_value) and (rsi is None or rsi < ob)
         else:
-            return (close < sma) and (rsi is None or rsi > os_)
+            return (close < sma_value) and (rsi is None or rsi > os_)
     except Exception:
         logger.exception('[breaker] falha em _reversal_confirmed')
         return False
@@ -100,6 +82,7 @@ async def _reversal_confirmed(symbol: str, side: str, user: User) -> bool:
 async def _avaliar_sinal(signal_data: dict, user_settings: User) -> Tuple[bool, str]:
     """
     Avalia um sinal com base na confiança mínima e nos filtros de análise técnica (MA e RSI), se ativos.
+    Os indicadores vêm do snapshot do sinal (core/indicator_service.py), calculados uma vez para todos.
     """
     # Filtro 1: Confiança Mínima (lógica existente)
     min_confidence = user_settings.min_confidence
@@ -116,70 +99,29 @@ async def _avaliar_sinal(signal_data: dict, user_settings: User) -> Tuple[bool,
 
     symbol = signal_data.get("coin")
     side = signal_data.get("order_type")
-    
-    # Unifica a busca de dados se os timeframes forem os mesmos para MA e RSI
-    required_timeframes = set()
-    if user_settings.is_ma_filter_enabled:
-        required_timeframes.add(user_settings.ma_timeframe)
-    if user_settings.is_rsi_filter_enabled:
-        required_timeframes.add(user_settings.rsi_timeframe)
-
-    hist_data_map = {}
-    for tf in required_timeframes:
-        klines_result = await get_historical_klines(symbol=symbol, interval=tf, limit=200)
-        if not klines_result.get("success"):
-            logger.warning(f"Não foi possível obter dados históricos para {symbol} no timeframe {tf}. Filtros para este timeframe serão ignorados.")
-            hist_data_map[tf] = None
-            continue
-
-        # Converte os dados para um DataFrame do Pandas em ordem cronológica crescente
-        df = pd.DataFrame(
-            klines_result['data'],
-            columns=['startTime', 'open', 'high', 'low', 'close', 'volume', 'turnover']
-        )
-        # Garante tipos numéricos adequados e ordenação por tempo (oldest -> newest)
-        df['close'] = pd.to_numeric(df['close'], errors='coerce')
-        df['startTime'] = pd.to_numeric(df['startTime'], errors='coerce')
-        df = df.sort_values(by='startTime').reset_index(drop=True)
-        hist_data_map[tf] = df
+    snapshot = snapshot_for(symbol)
 
     # Filtro 2: Média Móvel (MA)
     if user_settings.is_ma_filter_enabled:
-        df_ma = hist_data_map.get(user_settings.ma_timeframe)
-        if df_ma is not None:
-            ma_period = user_settings.ma_period
-            df_ma = df_ma.copy()
-            df_ma.ta.sma(length=ma_period, append=True)  # Calcula e adiciona a coluna da MA
-
-            ma_col = f'SMA_{ma_period}'
-            last_idx = df_ma[ma_col].last_valid_index()
-            if last_idx is not None:
-                latest_close = float(df_ma.loc[last_idx, 'close'])
-                latest_ma = float(df_ma.loc[last_idx, ma_col])
-
-                if side == 'LONG' and latest_close < latest_ma:
-                    return False, f"Rejeitado por Média Móvel (preço {latest_close:.4f} < MA {latest_ma:.4f})"
-                if side == 'SHORT' and latest_close > latest_ma:
-                    return False, f"Rejeitado por Média Móvel (preço {latest_close:.4f} > MA {latest_ma:.4f})"
+        ma = await snapshot.get(user_settings.ma_timeframe, "SMA", user_settings.ma_period)
+        if ma is not None:
+            latest_close, latest_ma = ma["close"], ma["value"]
+            if side == 'LONG' and latest_close < latest_ma:
+                return False, f"Rejeitado por Média Móvel (preço {latest_close:.4f} < MA {latest_ma:.4f})"
+            if side == 'SHORT' and latest_close > latest_ma:
+                return False, f"Rejeitado por Média Móvel (preço {latest_close:.4f} > MA {latest_ma:.4f})"
 
     # Filtro 3: Índice de Força Relativa (RSI)
     if user_settings.is_rsi_filter_enabled:
-        df_rsi = hist_data_map.get(user_settings.rsi_timeframe)
-        if df_rsi is not None:
+        rsi = await snapshot.get(user_settings.rsi_timeframe, "RSI", RSI_PERIOD)
+        if rsi is not None:
             oversold = user_settings.rsi_oversold_threshold
             overbought = user_settings.rsi_overbought_threshold
-            df_rsi = df_rsi.copy()
-            df_rsi.ta.rsi(append=True)  # Calcula e adiciona a coluna do RSI
-
-            rsi_col = 'RSI_14'
-            last_idx = df_rsi[rsi_col].last_valid_index()
-            if last_idx is not None:
-                latest_rsi = float(df_rsi.loc[last_idx, rsi_col])
-
-                if side == 'LONG' and latest_rsi > overbought:
-                    return False, f"Rejeitado por RSI (RSI {latest_rsi:.2f} > Sobrecompra {overbought})"
-                if side == 'SHORT' and latest_rsi < oversold:
-                    return False, f"Rejeitado por RSI (RSI {latest_rsi:.2f} < Sobrevenda {oversold})"
+            latest_rsi = rsi["value"]
+            if side == 'LONG' and latest_rsi > overbought:
+                return False, f"Rejeitado por RSI (RSI {latest_rsi:.2f} > Sobrecompra {overbought})"
+            if side == 'SHORT' and latest_rsi < oversold:
+                return False, f"Rejeitado por RSI (RSI {latest_rsi:.2f} < Sobrevenda {oversold})"
     
     # --- FIM DA NOVA LÓGICA ---
 
@@ -188,16 +130,17 @@ async def _avaliar_sinal(signal_data: dict, user_settings: User) -> Tuple[bool,
 async def _execute_trade(signal_data: dict, user: User, application: Application, db: Session, source_name: str):
     """Executa uma ordem a MERCADO, busca os detalhes da execução e envia uma notificação detalhada."""
     if not user.is_active:
-        await application.bot.send_message(
-            chat_id=user.telegram_id,
-            text="⏸️ Bot está PAUSADO: não abrirei novas posições. (As posições abertas seguem sendo gerenciadas.)"
+        get_dispatcher(application).send(
+            user.telegram_id,
+            "⏸️ Bot está PAUSADO: não abrirei novas posições. (As posições abertas seguem sendo gerenciadas.)",
+            parse_mode=None,
         )
         return
     
-    api_key = decrypt_data(user.api_key_encrypted)
-    api_secret = decrypt_data(user.api_secret_encrypted)
+    api_key, api_secret = get_user_credentials(user)
     
-    account_info = await get_account_info(api_key, api_secret)
+    with span("sizing", user=user.telegram_id):
+        account_info = await get_cached_account_info(user.telegram_id, api_key, api_secret)
     if not account_info.get("success"):
         await send_user_alert(application, user.telegram_id, f"❌ Falha ao buscar seu saldo Bybit para operar {signal_data['coin']}.")
         return
@@ -208,11 +151,13 @@ async def _execute_trade(signal_data: dict, user: User, application: Application
     order_result = await place_order(api_key, api_secret, signal_data, user, balance)
     
     if order_result.get("success"):
+        invalidate_wallet(user.telegram_id)
         order_data = order_result['data']
         order_id = order_data['orderId']
         
-        await asyncio.sleep(2)
-        final_order_data_result = await get_order_history(api_key, api_secret, order_id)
+        with span("fill_confirm", user=user.telegram_id):
+            await asyncio.sleep(2)
+            final_order_data_result = await get_order_history(api_key, api_secret, order_id)
         if not final_order_data_result.get("success"):
             await send_user_alert(application, user.telegram_id, f"⚠️ Ordem {signal_data['coin']} enviada, mas falha ao confirmar detalhes. Verifique na corretora.")
             return
@@ -262,8 +207,6 @@ async def _execute_trade(signal_data: dict, user: User, application: Application
             f"  - 🛡️ <b>Stop Loss:</b> ${stop_loss:,.4f}\n"
             f"{tp_text}"
         )
-        sent_message = await application.bot.send_message(chat_id=user.telegram_id, text=message, parse_mode='HTML')
-
         # --- DEDUPE: se já houver trade ativo do mesmo símbolo, atualiza em vez de duplicar ---
         existing = db.query(Trade).filter(
             Trade.user_telegram_id == user.telegram_id,
@@ -281,7 +224,8 @@ async def _execute_trade(signal_data: dict, user: User, application: Application
             existing.current_stop_loss = stop_loss
             existing.initial_targets = all_targets
             existing.total_initial_targets = num_targets
-            existing.notification_message_id = sent_message.message_id
+            existing.notification_message_id = None
+            card_trade = existing
             logger.info(
                 "[market->trade:merge] %s %s qty=%.6f entry=%.6f -> trade_id=%s",
                 existing.symbol, existing.side, existing.qty, existing.entry_price, str(existing.id)
@@ -289,7 +233,6 @@ async def _execute_trade(signal_data: dict, user: User, application: Application
         else:
             new_trade = Trade(
                 user_telegram_id=user.telegram_id, order_id=order_id,
-                notification_message_id=sent_message.message_id,
                     symbol=symbol, side=side, qty=qty, entry_price=entry_price,
                     stop_loss=stop_loss, current_stop_loss=stop_loss,
                 initial_targets=all_targets,
@@ -298,8 +241,281 @@ async def _execute_trade(signal_data: dict, user: User, application: Application
                 remaining_qty=qty
             )
             db.add(new_trade)
+            card_trade = new_trade
             logger.info(f"[market->trade:new] {order_id} para o usuário {user.telegram_id} salvo no DB.")
 
+        # Plano de saída fixado na entrada (quantidades por TP no qtyStep)
+        try:
+            await plan_trade_exits(card_trade, user)
+        except Exception:
+            logger.exception("[exit-plan] falha ao montar plano para %s; será criado pelo rastreador.", symbol)
+
+        # Persiste a posição antes de notificar; o ID do card é gravado quando o envio sair
+        db.commit()
+
+        # Escada de TPs reduce-only na corretora (2+ alvos); sem ela o rastreador segue por preço
+        try:
+            if await place_ladder_for_trade(card_trade, user, api_key, api_secret):
+                db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("[tp:ladder] falha ao colocar escada para %s; alvos seguem por preço.", symbol)
+        # Mesmo caminho das atualizações: o rastreador sabe que o card novo está na fila
+        # e guarda as edições até o envio sair (sem card duplicado)
+        await _send_or_edit_trade_message(application, user, card_trade, db, message)
+
+async def _route_signal_to_user(signal_data: dict, signal_type, symbol: str, user: User,
+                                application: Application, db: Session, source_name: str) -> str:
+    """Verificações de elegibilidade e execução de um sinal para um único usuário. Retorna o desfecho."""
+    if user.is_sleep_mode_enabled:
+        br_timezone = pytz.timezone("America/Sao_Paulo")
+        now_br = datetime.now(br_timezone).time()
+
+        # O bot fica offline das 00:00 (incluso) até 07:00 (excluso)
+        if 0 <= now_br.hour < 7:
+            logger.info(f"Sinal para {symbol} ignorado para o usuário {user.telegram_id} devido ao Modo Dormir ativo.")
+            return "sleep_mode"  # Pula para o próximo usuário
+
+    # 1. Verifica se há uma pausa ativa para a direção do sinal
+    signal_side = signal_data.get('order_type')
+    is_paused = False
+    # Usa datetime timezone-aware para comparar com campos do DB.
+    # Também normaliza valores antigos que possam ter sido salvos como 'naive'.
+    now_utc = datetime.now(pytz.utc)
+    long_paused = user.long_trades_paused_until
+    short_paused = user.short_trades_paused_until
+    if long_paused is not None and getattr(long_paused, 'tzinfo', None) is None:
+        long_paused = long_paused.replace(tzinfo=pytz.utc)
+    if short_paused is not None and getattr(short_paused, 'tzinfo', None) is None:
+        short_paused = short_paused.replace(tzinfo=pytz.utc)
+
+    scope = (getattr(user, 'circuit_breaker_scope', 'SIDE') or 'SIDE').upper()
+    if scope == 'GLOBAL':
+        if (long_paused and now_utc < long_paused) or (short_paused and now_utc < short_paused):
+            is_paused = True
+    elif scope == 'SYMBOL':
+        if is_symbol_paused(user.telegram_id, symbol):
+            is_paused = True
+    else:
+        if signal_side == 'LONG' and long_paused and now_utc < long_paused:
+            is_paused = True
+        elif signal_side == 'SHORT' and short_paused and now_utc < short_paused:
+            is_paused = True
+
+    if is_paused:
+        # Override por reversão (probe trade)
+        if getattr(user, 'reversal_override_enabled', False):
+            ok = await _reversal_confirmed(symbol, signal_side, user)
+            if ok:
+                probe_factor = float(getattr(user, 'probe_size_factor', 0.5) or 0.5)
+                signal_data = dict(signal_data)
+                signal_data['size_factor'] = max(0.1, min(1.0, probe_factor))
+                await send_user_alert(application, user.telegram_id,
+                    f"⚠️ Disjuntor ativo, mas reversão confirmada. Abrindo <b>probe</b> com {int(signal_data['size_factor']*100)}% do tamanho.")
+            else:
+                logger.info(f"Sinal de {signal_side} para {symbol} ignorado (disjuntor ativo, sem reversão).")
+                return "paused"
+        else:
+            logger.info(f"Sinal de {signal_side} para {symbol} ignorado para o usuário {user.telegram_id} devido à pausa do disjuntor.")
+            return "paused"
+
+    # 2. Se não estiver pausado, verifica se o gatilho de perdas é atingido
+    if user.circuit_breaker_threshold > 0:
+        scope = (getattr(user, 'circuit_breaker_scope', 'SIDE') or 'SIDE').upper()
+        # Contadores mantidos pelo rastreador: O(1), sem ida ao banco durante o fan-out
+        losing_trades_count = losing_count(db, user.telegram_id, scope, side=signal_side, symbol=symbol)
+
+        if losing_trades_count >= user.circuit_breaker_threshold:
+            logger.warning(f"DISJUNTOR ATIVADO ({scope}) para {symbol}/{signal_side} user={user.telegram_id} perdas={losing_trades_count}")
+            pause_until = datetime.now(pytz.utc) + timedelta(minutes=user.circuit_breaker_pause_minutes)
+            if scope == 'GLOBAL':
+                user.long_trades_paused_until = pause_until
+                user.short_trades_paused_until = pause_until
+                await send_user_alert(application, user.telegram_id,
+                    f"🚨 <b>Disjuntor GLOBAL</b> ativado ({losing_trades_count} perdas). Pausa {user.circuit_breaker_pause_minutes} min.")
+            elif scope == 'SYMBOL':
+                pause_symbol(user.telegram_id, symbol, user.circuit_breaker_pause_minutes)
+                await send_user_alert(application, user.telegram_id,
+                    f"🚨 <b>Disjuntor por Símbolo</b> em <b>{symbol}</b> ({losing_trades_count} perdas). Pausa {user.circuit_breaker_pause_minutes} min.")
+            else:
+                if signal_side == 'LONG':
+                    user.long_trades_paused_until = pause_until
+                else: # SHORT
+                    user.short_trades_paused_until = pause_until
+                await send_user_alert(application, user.telegram_id,
+                    f"🚨 <b>Disjuntor</b> ativado para {signal_side} ({losing_trades_count} perdas). Pausa {user.circuit_breaker_pause_minutes} min.")
+            return "breaker_tripped"
+
+    # 1.1. Guard-rail diário (Meta de lucro / Limite de perda)
+    try:
+        target = float(getattr(user, 'daily_profit_target', 0) or 0)
+        limit_loss = float(getattr(user, 'daily_loss_limit', 0) or 0)
+    except Exception:
+        target = 0.0; limit_loss = 0.0
+    if target > 0 or limit_loss > 0:
+        # Ledger local (core/daily_pnl_ledger.py): exato e sem chamada à corretora
+        pnl_today = daily_realized_pnl(db, user.telegram_id)
+        # Lucro alvo atingido?
+        if target > 0 and pnl_today >= target:
+            await send_user_alert(application, user.telegram_id,
+                f"✅ <b>Meta diária</b> atingida (P/L do dia: <b>${pnl_today:,.2f}</b>).\n"
+                "Novas entradas estão bloqueadas hoje.")
+            return "daily_target"
+        # Limite de perda estourado?
+        if limit_loss > 0 and pnl_today <= -limit_loss:
+            await send_user_alert(application, user.telegram_id,
+                f"⛔ <b>Limite de perda diário</b> atingido (P/L do dia: <b>${pnl_today:,.2f}</b>).\n"
+                "Novas entradas estão bloqueadas hoje.")
+            return "daily_loss_limit"
+
+    # Adiciona uma verificação para ver se o bot do usuário está ativo.
+    if not user.is_active:
+        logger.info(f"Sinal para {symbol} ignorado para o usuário {user.telegram_id} porque o bot está pausado.")
+        return "bot_paused"
+
+    # 1. Avalia o sinal contra os filtros do usuário
+    with span("filters", user=user.telegram_id):
+        aprovado, motivo = await _avaliar_sinal(signal_data, user)
+    if not aprovado:
+        logger.info(f"Sinal para {symbol} ignorado para o usuário {user.telegram_id}: {motivo}")
+        return "filtered"
+
+    # 2. Verifica a whitelist do usuário
+    if not is_coin_in_whitelist(symbol, user.coin_whitelist):
+        logger.info(f"Sinal para {symbol} ignorado para o usuário {user.telegram_id} devido à whitelist.")
+        return "whitelist"
+
+    # 3. Verifica o modo de aprovação individual do usuário
+    if user.approval_mode == 'AUTOMATIC':
+        logger.info(f"Usuário {user.telegram_id} em modo AUTOMÁTICO. Executando trade para {symbol}.")
+        if signal_type == SignalType.MARKET:
+            await _execute_trade(signal_data, user, application, db, source_name)
+            return "executed_market"
+        elif signal_type == SignalType.LIMIT:
+            await _execute_limit_order_for_user(signal_data, user, application, db)
+            return "executed_limit"
+        return "ignored_type"
+
+    elif user.approval_mode == 'MANUAL':
+        logger.info(f"Usuário {user.telegram_id} em modo MANUAL. Enviando sinal para sua aprovação.")
+
+        new_signal_for_approval = SignalForApproval(
+            user_telegram_id=user.telegram_id,  # <-- Agora salva o ID do usuário correto
+            symbol=symbol,
+            source_name=source_name,
+            signal_data=signal_data
+        )
+        db.add(new_signal_for_approval)
+        db.commit() # Commit para obter o ID
+
+        signal_details = (
+            f"<b>Sinal Recebido para Aprovação</b>\n\n"
+            f"<b>Moeda:</b> {signal_data['coin']}\n"
+            f"<b>Tipo:</b> {signal_data['order_type']}\n<b>Entrada:</b> {signal_data['entries'][0]}\n"
+            f"<b>Stop:</b> {signal_data['stop_loss']}\n<b>Alvo 1:</b> {signal_data['targets'][0]}\n\n"
+            f"O sinal passou nos seus filtros. Você aprova a entrada?"
+        )
+        approval_id = new_signal_for_approval.id
+        get_dispatcher(application).send(
+            user.telegram_id, # <-- Envia para o usuário específico
+            signal_details, parse_mode='HTML',
+            reply_markup=signal_approval_keyboard(approval_id),
+            on_sent=lambda msg, _id=approval_id: set_message_id(
+                SignalForApproval, _id, getattr(msg, 'message_id', None), column='approval_message_id'
+            ),
+        )
+        return "approval_sent"
+
+    return "no_mode"
+
+
+async def _fanout_user(user_id: int, signal_data: dict, signal_type, symbol: str,
+                       application: Application, source_name: str,
+                       semaphore: asyncio.Semaphore, started: float) -> Dict[str, Any]:
+    """Processa o sinal para um usuário em sessão própria (isolada dos demais)."""
+    async with semaphore:
+        began = time.perf_counter()
+        db = SessionLocal()
+        try:
+            # Checkout da conexão (e 1ª consulta) fora do loop: se o pool estiver cheio,
+            # quem espera é uma thread, não o event loop com as tarefas que o liberariam.
+            user = await asyncio.to_thread(
+                lambda: db.query(User).filter(User.telegram_id == user_id).first()
+            )
+            if user is None or not user.api_key_encrypted:
+                outcome = "no_user"
+            else:
+                # Cópia por usuário: o probe do disjuntor ajusta size_factor só para quem o aciona
+                outcome = await _route_signal_to_user(dict(signal_data), signal_type, symbol, user,
+                                                      application, db, source_name)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"[fanout] Falha ao processar {symbol} para o usuário {user_id}: {e}", exc_info=True)
+            outcome = "error"
+        finally:
+            db.close()
+        finished = time.perf_counter()
+        return {
+            "user_id": user_id,
+            "outcome": outcome,
+            "queued_s": began - started,
+            "elapsed_s": finished - began,
+            "done_at_s": finished - started,
+        }
+
+
+def _log_fanout_report(symbol: str, results: List[Dict[str, Any]], total_s: float) -> Dict[str, Any]:
+    """Resumo do fan-out: desfechos por tipo e dispersão dos horários de conclusão."""
+    outcomes: Dict[str, int] = {}
+    for r in results:
+        outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+    executed = [r["done_at_s"] for r in results if r["outcome"].startswith("executed") or r["outcome"] == "approval_sent"]
+    report = {
+        "symbol": symbol,
+        "users": len(results),
+        "outcomes": outcomes,
+        "total_s": total_s,
+        "first_entry_s": min(executed) if executed else None,
+        "last_entry_s": max(executed) if executed else None,
+    }
+    logger.info(
+        "[fanout] %s: usuarios=%d, duracao=%.2fs, entradas=%d (primeira=%s, ultima=%s), desfechos=%s",
+        symbol, report["users"], total_s, len(executed),
+        f"{report['first_entry_s']:.2f}s" if executed else "-",
+        f"{report['last_entry_s']:.2f}s" if executed else "-",
+        outcomes,
+    )
+    return report
+
+
+async def _prewarm_symbol(symbol: str, signal_type, snapshot: IndicatorSnapshot, indicator_keys) -> Dict[str, float]:
+    """
+    Pré-aquecimento do símbolo antes do fan-out: regras do instrumento, preço (MARKET)
+    e k-lines/indicadores dos filtros, tudo em paralelo. Cada usuário encontra os caches quentes.
+    """
+    async def _timed(name: str, coro):
+        began = time.perf_counter()
+        try:
+            await coro
+        except Exception:
+            logger.exception("[prewarm] falha em %s para %s", name, symbol)
+        return name, time.perf_counter() - began
+
+    jobs = [_timed("instrument", get_instrument_info(symbol))]
+    if signal_type == SignalType.MARKET:
+        jobs.append(_timed("price", get_market_price(symbol)))
+    if indicator_keys:
+        jobs.append(_timed("indicators", snapshot.prefetch(indicator_keys)))
+
+    started = time.perf_counter()
+    timings = dict(await asyncio.gather(*jobs))
+    logger.info("[prewarm] %s: %.2fs (%s)%s", symbol, time.perf_counter() - started,
+                ", ".join(f"{k}={v:.2f}s" for k, v in timings.items()),
+                f", {len(indicator_keys)} indicador(es) distinto(s)" if indicator_keys else "")
+    return timings
+
+
 async def process_new_signal(signal_data: dict, application: Application, source_name: str):
     """Processa um novo sinal, verificando a preferência de cada usuário individualmente."""
     signal_type = signal_data.get("type")
@@ -324,8 +540,7 @@ async def process_new_signal(signal_data: dict, application: Application, source
                     logger.warning(f"Não foi possível encontrar usuário ou chaves de API para a ordem pendente ID:{pending.id}. Pulando.")
                     continue
 
-                api_key = decrypt_data(user.api_key_encrypted)
-                api_secret = decrypt_data(user.api_secret_encrypted)
+                api_key, api_secret = get_user_credentials(user)
 
                 cancel_result = await cancel_order(
                     api_key=api_key,
@@ -349,184 +564,39 @@ async def process_new_signal(signal_data: dict, application: Application, source
             return
 
         elif signal_type in [SignalType.MARKET, SignalType.LIMIT]:
-            all_users = db.query(User).filter(User.api_key_encrypted.isnot(None)).all()
-            if not all_users:
-                logger.info("Nenhum usuário com API para processar o sinal.")
+            # Índice em memória: descarta sem tocar no banco quem não pode aceitar o sinal
+            # (sem API, bot pausado, whitelist, modo dormir, pausa do disjuntor sem override)
+            with span("eligibility"):
+                user_ids = routing_index.candidates(db, symbol, signal_data.get('order_type'))
+            if not user_ids:
+                logger.info(f"Nenhum usuário elegível para o sinal de {symbol} ({len(routing_index)} no índice).")
                 return
 
-            logger.info(f"Sinal para {symbol} recebido. Verificando preferências de {len(all_users)} usuário(s)...")
-
-            for user in all_users:
-                if user.is_sleep_mode_enabled:
-                    br_timezone = pytz.timezone("America/Sao_Paulo")
-                    now_br = datetime.now(br_timezone).time()
-                    
-                    # O bot fica offline das 00:00 (incluso) até 07:00 (excluso)
-                    if 0 <= now_br.hour < 7:
-                        logger.info(f"Sinal para {symbol} ignorado para o usuário {user.telegram_id} devido ao Modo Dormir ativo.")
-                        continue # Pula para o próximo usuário
-
-                # 1. Verifica se há uma pausa ativa para a direção do sinal
-                signal_side = signal_data.get('order_type')
-                is_paused = False
-                # Usa datetime timezone-aware para comparar com campos do DB.
-                # Também normaliza valores antigos que possam ter sido salvos como 'naive'.
-                now_utc = datetime.now(pytz.utc)
-                long_paused = user.long_trades_paused_until
-                short_paused = user.short_trades_paused_until
-                if long_paused is not None and getattr(long_paused, 'tzinfo', None) is None:
-                    long_paused = long_paused.replace(tzinfo=pytz.utc)
-                if short_paused is not None and getattr(short_paused, 'tzinfo', None) is None:
-                    short_paused = short_paused.replace(tzinfo=pytz.utc)
-
-                scope = (getattr(user, 'circuit_breaker_scope', 'SIDE') or 'SIDE').upper()
-                if scope == 'GLOBAL':
-                    if (long_paused and now_utc < long_paused) or (short_paused and now_utc < short_paused):
-                        is_paused = True
-                elif scope == 'SYMBOL':
-                    if _is_symbol_paused(user.telegram_id, symbol):
-                        is_paused = True
-                else:
-                    if signal_side == 'LONG' and long_paused and now_utc < long_paused:
-                        is_paused = True
-                    elif signal_side == 'SHORT' and short_paused and now_utc < short_paused:
-                        is_paused = True
-                
-                if is_paused:
-                    # Override por reversão (probe trade)
-                    if getattr(user, 'reversal_override_enabled', False):
-                        ok = await _reversal_confirmed(symbol, signal_side, user)
-                        if ok:
-                            probe_factor = float(getattr(user, 'probe_size_factor', 0.5) or 0.5)
-                            signal_data = dict(signal_data)
-                            signal_data['size_factor'] = max(0.1, min(1.0, probe_factor))
-                            await send_user_alert(application, user.telegram_id,
-                                f"⚠️ Disjuntor ativo, mas reversão confirmada. Abrindo <b>probe</b> com {int(signal_data['size_factor']*100)}% do tamanho.")
-                        else:
-                            logger.info(f"Sinal de {signal_side} para {symbol} ignorado (disjuntor ativo, sem reversão).")
-                            continue
-                    else:
-                        logger.info(f"Sinal de {signal_side} para {symbol} ignorado para o usuário {user.telegram_id} devido à pausa do disjuntor.")
-                        continue
-
-                # 2. Se não estiver pausado, verifica se o gatilho de perdas é atingido
-                if user.circuit_breaker_threshold > 0:
-                    scope = (getattr(user, 'circuit_breaker_scope', 'SIDE') or 'SIDE').upper()
-                    if scope == 'GLOBAL':
-                        losing_trades_count = db.query(Trade).filter(
-                            Trade.user_telegram_id == user.telegram_id,
-                            Trade.status == 'ACTIVE',
-                            Trade.unrealized_pnl_pct < 0
-                        ).count()
-                    elif scope == 'SYMBOL':
-                        losing_trades_count = db.query(Trade).filter(
-                            Trade.user_telegram_id == user.telegram_id,
-                            Trade.symbol == symbol,
-                            Trade.status == 'ACTIVE',
-                            Trade.unrealized_pnl_pct < 0
-                        ).count()
-                    else:
-                        losing_trades_count = db.query(Trade).filter(
-                            Trade.user_telegram_id == user.telegram_id,
-                            Trade.side == signal_side,
-                            Trade.status == 'ACTIVE',
-                            Trade.unrealized_pnl_pct < 0
-                        ).count()
-
-                    if losing_trades_count >= user.circuit_breaker_threshold:
-                        logger.warning(f"DISJUNTOR ATIVADO ({scope}) para {symbol}/{signal_side} user={user.telegram_id} perdas={losing_trades_count}")
-                        pause_until = datetime.now(pytz.utc) + timedelta(minutes=user.circuit_breaker_pause_minutes)
-                        if scope == 'GLOBAL':
-                            user.long_trades_paused_until = pause_until
-                            user.short_trades_paused_until = pause_until
-                            await send_user_alert(application, user.telegram_id,
-                                f"🚨 <b>Disjuntor GLOBAL</b> ativado ({losing_trades_count} perdas). Pausa {user.circuit_breaker_pause_minutes} min.")
-                        elif scope == 'SYMBOL':
-                            _pause_symbol(user.telegram_id, symbol, user.circuit_breaker_pause_minutes)
-                            await send_user_alert(application, user.telegram_id,
-                                f"🚨 <b>Disjuntor por Símbolo</b> em <b>{symbol}</b> ({losing_trades_count} perdas). Pausa {user.circuit_breaker_pause_minutes} min.")
-                        else:
-                            if signal_side == 'LONG':
-                                user.long_trades_paused_until = pause_until
-                            else: # SHORT
-                                user.short_trades_paused_until = pause_until
-                            await send_user_alert(application, user.telegram_id,
-                                f"🚨 <b>Disjuntor</b> ativado para {signal_side} ({losing_trades_count} perdas). Pausa {user.circuit_breaker_pause_minutes} min.")
-                        continue
-
-                # 1.1. Guard-rail diário (Meta de lucro / Limite de perda)
-                try:
-                    target = float(getattr(user, 'daily_profit_target', 0) or 0)
-                    limit_loss = float(getattr(user, 'daily_loss_limit', 0) or 0)
-                except Exception:
-                    target = 0.0; limit_loss = 0.0
-                if target > 0 or limit_loss > 0:
-                    api_key = decrypt_data(user.api_key_encrypted)
-                    api_secret = decrypt_data(user.api_secret_encrypted)
-                    ok, pnl_today = await _get_daily_pnl_cached(api_key, api_secret, user.telegram_id)
-                    if ok:
-                        # Lucro alvo atingido?
-                        if target > 0 and pnl_today >= target:
-                            await send_user_alert(application, user.telegram_id,
-                                f"✅ <b>Meta diária</b> atingida (P/L do dia: <b>${pnl_today:,.2f}</b>).\n"
-                                "Novas entradas estão bloqueadas hoje.")
-                            continue
-                        # Limite de perda estourado?
-                        if limit_loss > 0 and pnl_today <= -limit_loss:
-                            await send_user_alert(application, user.telegram_id,
-                                f"⛔ <b>Limite de perda diário</b> atingido (P/L do dia: <b>${pnl_today:,.2f}</b>).\n"
-                                "Novas entradas estão bloqueadas hoje.")
-                            continue
-
-                # Adiciona uma verificação para ver se o bot do usuário está ativo.
-                if not user.is_active:
-                    logger.info(f"Sinal para {symbol} ignorado para o usuário {user.telegram_id} porque o bot está pausado.")
-                    continue
+            logger.info(f"Sinal para {symbol} recebido. Verificando preferências de {len(user_ids)}/{len(routing_index)} usuário(s) elegíveis...")
 
-                # 1. Avalia o sinal contra os filtros do usuário
-                aprovado, motivo = await _avaliar_sinal(signal_data, user)
-                if not aprovado:
-                    logger.info(f"Sinal para {symbol} ignorado para o usuário {user.telegram_id}: {motivo}")
-                    continue
-                
-                # 2. Verifica a whitelist do usuário
-                if not is_coin_in_whitelist(symbol, user.coin_whitelist):
-                    logger.info(f"Sinal para {symbol} ignorado para o usuário {user.telegram_id} devido à whitelist.")
-                    continue
+            # Indicadores do sinal: conjunto distinto (tf, indicador, período) dos elegíveis, calculado uma vez
+            snapshot = IndicatorSnapshot(symbol)
+            filter_settings = db.query(
+                User.is_ma_filter_enabled, User.ma_timeframe, User.ma_period,
+                User.is_rsi_filter_enabled, User.rsi_timeframe, User.reversal_override_enabled,
+            ).filter(User.telegram_id.in_(user_ids)).all()
+            indicator_keys = required_indicators(filter_settings)
+            with span("prewarm"):
+                await _prewarm_symbol(symbol, signal_type, snapshot, indicator_keys)
+            token = activate_snapshot(snapshot)
 
-                # 3. Verifica o modo de aprovação individual do usuário
-                if user.approval_mode == 'AUTOMATIC':
-                    logger.info(f"Usuário {user.telegram_id} em modo AUTOMÁTICO. Executando trade para {symbol}.")
-                    if signal_type == SignalType.MARKET:
-                        await _execute_trade(signal_data, user, application, db, source_name)
-                    elif signal_type == SignalType.LIMIT:
-                        await _execute_limit_order_for_user(signal_data, user, application, db)
-
-                elif user.approval_mode == 'MANUAL':
-                    logger.info(f"Usuário {user.telegram_id} em modo MANUAL. Enviando sinal para sua aprovação.")
-                    
-                    new_signal_for_approval = SignalForApproval(
-                        user_telegram_id=user.telegram_id,  # <-- Agora salva o ID do usuário correto
-                        symbol=symbol,
-                        source_name=source_name,
-                        signal_data=signal_data
-                    )
-                    db.add(new_signal_for_approval)
-                    db.commit() # Commit para obter o ID
-
-                    signal_details = (
-                        f"<b>Sinal Recebido para Aprovação</b>\n\n"
-                        f"<b>Moeda:</b> {signal_data['coin']}\n"
-                        f"<b>Tipo:</b> {signal_data['order_type']}\n<b>Entrada:</b> {signal_data['entries'][0]}\n"
-                        f"<b>Stop:</b> {signal_data['stop_loss']}\n<b>Alvo 1:</b> {signal_data['targets'][0]}\n\n"
-                        f"O sinal passou nos seus filtros. Você aprova a entrada?"
-                    )
-                    sent_message = await application.bot.send_message(
-                        chat_id=user.telegram_id, # <-- Envia para o usuário específico
-                        text=signal_details, parse_mode='HTML',
-                        reply_markup=signal_approval_keyboard(new_signal_for_approval.id)
-                    )
-                    new_signal_for_approval.approval_message_id = sent_message.message_id
+            # Fan-out concorrente: cada usuário em sua tarefa e sessão, limitado por TF_SIGNAL_FANOUT_CONCURRENCY
+            try:
+                semaphore = asyncio.Semaphore(_FANOUT_CONCURRENCY)
+                started = time.perf_counter()
+                with span("fanout", users=len(user_ids)):
+                    results = await asyncio.gather(*(
+                        _fanout_user(uid, signal_data, signal_type, symbol, application, source_name, semaphore, started)
+                        for uid in user_ids
+                    ))
+            finally:
+                reset_snapshot(token)
+            _log_fanout_report(symbol, list(results), time.perf_counter() - started)
         
         db.commit()
     finally:
@@ -535,9 +605,10 @@ async def process_new_signal(signal_data: dict, application: Application, source
 async def _execute_limit_order_for_user(signal_data: dict, user: User, application: Application, db: Session):
     """Função auxiliar para posicionar uma ordem limite para um único usuário."""
     if not user.is_active:
-        await application.bot.send_message(
-            chat_id=user.telegram_id,
-            text="⏸️ Bot está PAUSADO: não abrirei novas posições. (As posições abertas seguem sendo gerenciadas.)"
+        get_dispatcher(application).send(
+            user.telegram_id,
+            "⏸️ Bot está PAUSADO: não abrirei novas posições. (As posições abertas seguem sendo gerenciadas.)",
+            parse_mode=None,
         )
         return
 
@@ -555,9 +626,9 @@ async def _execute_limit_order_for_user(signal_data: dict, user: User, applicati
     limit_price = float(min(entries)) if (signal_data.get('order_type') or '').upper() == 'LONG' else float(max(entries))
     signal_data['limit_price'] = limit_price
 
-    api_key = decrypt_data(user.api_key_encrypted)
-    api_secret = decrypt_data(user.api_secret_encrypted)
-    account_info = await get_account_info(api_key, api_secret)
+    api_key, api_secret = get_user_credentials(user)
+    with span("sizing", user=user.telegram_id):
+        account_info = await get_cached_account_info(user.telegram_id, api_key, api_secret)
     if not account_info.get("success"):
         logger.error(f"Falha ao buscar saldo para usuário {user.telegram_id} ao posicionar LIMIT em {symbol}.")
         return
@@ -566,6 +637,7 @@ async def _execute_limit_order_for_user(signal_data: dict, user: User, applicati
     limit_order_result = await place_limit_order(api_key, api_secret, signal_data, user, balance)
 
     if limit_order_result.get("success"):
+        invalidate_wallet(user.telegram_id)
         order_id = limit_order_result["data"]["orderId"]
         # Atualiza o SL do sinal para refletir o valor efetivo aplicado, se disponível
         eff_sl = limit_order_result.get("effective_stop_loss")
@@ -603,15 +675,20 @@ async def _execute_limit_order_for_user(signal_data: dict, user: User, applicati
             f"👀 Monitorando a execução…"
         )
    
-        sent_message = await application.bot.send_message(chat_id=user.telegram_id, text=message, parse_mode='HTML')
-        
-        db.add(PendingSignal(
+        pending = PendingSignal(
             user_telegram_id=user.telegram_id, 
             symbol=symbol, 
             order_id=order_id, 
             signal_data=signal_data,
-            notification_message_id=sent_message.message_id
-        ))
+        )
+        db.add(pending)
+        # Persiste a ordem antes de notificar; o ID da mensagem é gravado quando o envio sair
+        db.commit()
+        pending_id = pending.id
+        get_dispatcher(application).send(
+            user.telegram_id, message, parse_mode='HTML',
+            on_sent=lambda msg: set_message_id(PendingSignal, pending_id, getattr(msg, 'message_id', None)),
+        )
     else:
         error = limit_order_result.get('error') or "Erro desconhecido"
         await send_user_alert(application, user.telegram_id, f"❌ Falha ao posicionar sua ordem limite para <b>{symbol}</b>.\n<b>Motivo:</b> {error}")
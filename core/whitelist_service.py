@@ -1,5 +1,5 @@
 import logging
-from typing import Set
+from typing import FrozenSet, Optional, Set
 
 logger = logging.getLogger(__name__)
 
@@ -76,4 +76,21 @@ def is_coin_in_whitelist(symbol: str, user_whitelist_str: str) -> bool:
             return True
             
     # Se nenhuma das condições acima for atendida, a moeda não está na whitelist
-    return False
\ No newline at end of file
+    return False
+
+
+def compile_whitelist(user_whitelist_str: str) -> Optional[FrozenSet[str]]:
+    """
+    Pré-compila a whitelist em um conjunto de símbolos (MAIÚSCULOS), com as categorias expandidas.
+    Retorna None quando todas as moedas são permitidas. Mesma semântica de is_coin_in_whitelist.
+    """
+    if not user_whitelist_str or 'todas' in user_whitelist_str.lower():
+        return None
+    symbols: Set[str] = set()
+    for item in {item.strip() for item in user_whitelist_str.lower().split(',')}:
+        if not item:
+            continue
+        if item in CATEGORIES:
+            symbols |= CATEGORIES[item]
+        symbols.add(item.upper())
+    return frozenset(symbols)
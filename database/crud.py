@@ -8,4 +8,21 @@ def get_user_by_id(telegram_id: int):
         user = db.query(User).filter(User.telegram_id == telegram_id).first()
         return user
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def set_message_id(model, row_id: int, message_id: int, column: str = "notification_message_id") -> bool:
+    """Grava o message_id do Telegram numa linha já persistida (usado pelos callbacks do despachante)."""
+    if row_id is None or message_id is None:
+        return False
+    db = SessionLocal()
+    try:
+        updated = db.query(model).filter(model.id == row_id).update(
+            {getattr(model, column): message_id}, synchronize_session=False
+        )
+        db.commit()
+        return bool(updated)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -1,4 +1,4 @@
-from sqlalchemy import (Column, Integer, String, BigInteger, Boolean, Float, JSON, DateTime, UniqueConstraint)
+from sqlalchemy import (Column, Integer, String, BigInteger, Boolean, Float, JSON, Date, DateTime, UniqueConstraint)
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.sql import func
 
@@ -97,6 +97,10 @@ class Trade(Base):
     unrealized_pnl_pct = Column(Float, nullable=True)
     missing_cycles = Column(Integer, default=0, nullable=False)
     last_seen_at = Column(DateTime(timezone=True), nullable=True)
+    tp_orders = Column(JSON, nullable=True)  # escada de TPs reduce-only na corretora
+    exit_plan = Column(JSON, nullable=True)  # plano de saída (core/exit_plan.py)
+    partial_pnl = Column(Float, nullable=True)  # P/L realizado em parciais no dia partial_pnl_day
+    partial_pnl_day = Column(Date, nullable=True)  # dia (America/Sao_Paulo) das parciais
 
 class PendingSignal(Base):
     __tablename__ = 'pending_signals'
@@ -124,3 +128,30 @@ class AlertMessage(Base):
     user_telegram_id = Column(BigInteger, index=True, nullable=False)
     message_id = Column(BigInteger, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class MessageDeletion(Base):
+    """Agenda de remoção de mensagens (alertas e cards de trades fechados)."""
+    __tablename__ = 'message_deletions'
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    message_id = Column(BigInteger, nullable=False)
+    delete_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    kind = Column(String(20), nullable=False, default='alert')
+    trade_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (UniqueConstraint('chat_id', 'message_id', name='_deletion_chat_message_uc'),)
+
+class SymbolPause(Base):
+    """Pausa do disjuntor por símbolo (escopo SYMBOL), compartilhada entre processos."""
+    __tablename__ = 'symbol_pauses'
+    user_telegram_id = Column(BigInteger, primary_key=True)
+    symbol = Column(String(30), primary_key=True)
+    paused_until = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class ProcessedSignalMessage(Base):
+    """Mensagem de sinal já processada (por chat, mensagem e versão do conteúdo), com expiração."""
+    __tablename__ = 'processed_signal_messages'
+    chat_id = Column(BigInteger, primary_key=True)
+    message_id = Column(BigInteger, primary_key=True)
+    content_hash = Column(String(64), primary_key=True)
+    processed_at = Column(DateTime(timezone=True), nullable=False, index=True)
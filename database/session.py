@@ -16,12 +16,28 @@ DATABASE_URL = os.getenv('DATABASE_URL')
 if not DATABASE_URL:
     raise ValueError("A variável de ambiente DATABASE_URL não foi definida. A aplicação não pode iniciar.")
 
+# Tamanho do pool: o fan-out de sinais (core/trade_manager.py) se limita ao que sobra dele
+try:
+    POOL_SIZE = max(1, int(os.getenv("TF_DB_POOL_SIZE", "5") or "5"))
+except Exception:
+    POOL_SIZE = 5
+try:
+    MAX_OVERFLOW = max(0, int(os.getenv("TF_DB_MAX_OVERFLOW", "10") or "10"))
+except Exception:
+    MAX_OVERFLOW = 10
+
+_engine_kwargs = {}
+if DATABASE_URL.startswith("postgresql"):
+    # UPDATE/DELETE em lote (write-behind do rastreador) viram execute_batch no psycopg2
+    _engine_kwargs["executemany_mode"] = "values_plus_batch"
+
 engine = create_engine(
     DATABASE_URL,
     # Pool de conexões é recomendado para produção com PostgreSQL
     pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=10
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    **_engine_kwargs
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
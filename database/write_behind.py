@@ -0,0 +1,131 @@
+# database/write_behind.py
+"""
+Buffer write-behind para o rastreador.
+
+Em vez de cada helper chamar db.commit() por conta própria (um round-trip e um
+expire de todos os objetos por commit), as mutações de Trade/PendingSignal/
+AlertMessage de uma passada do usuário ficam na sessão e são gravadas em um
+único commit. A latência de persistência é limitada por TF_WRITE_BEHIND_MAX_SECONDS.
+
+Efeitos colaterais já executados na corretora (TP parcial, cancelamento,
+promoção de ordem para Trade) usam commit_durable(): gravam na hora, antes de
+qualquer confirmação ao usuário.
+"""
+import logging
+import os
+import time
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+_SESSION_INFO_KEY = "write_behind"
+
+try:
+    _DEFAULT_MAX_LATENCY = float(os.getenv("TF_WRITE_BEHIND_MAX_SECONDS", "5") or "5")
+except Exception:
+    _DEFAULT_MAX_LATENCY = 5.0
+
+
+class WriteBehindBuffer:
+    """Agrupa as mutações de uma sessão e faz flush/commit em lote."""
+
+    def __init__(self, db, max_latency_seconds: Optional[float] = None):
+        self.db = db
+        self.max_latency = _DEFAULT_MAX_LATENCY if max_latency_seconds is None else float(max_latency_seconds)
+        self._dirty_since: Optional[float] = None
+        self._pending_marks = 0
+        self.flushes = 0
+        self.deferred = 0
+        self.durable_commits = 0
+
+    def attach(self) -> "WriteBehindBuffer":
+        info = getattr(self.db, "info", None)
+        if isinstance(info, dict):
+            info[_SESSION_INFO_KEY] = self
+        return self
+
+    def detach(self) -> None:
+        info = getattr(self.db, "info", None)
+        if isinstance(info, dict) and info.get(_SESSION_INFO_KEY) is self:
+            info.pop(_SESSION_INFO_KEY, None)
+
+    def mark(self, reason: str = "") -> None:
+        """Registra que há mutação pendente; grava só se a latência máxima estourou."""
+        if self._dirty_since is None:
+            self._dirty_since = time.monotonic()
+        self._pending_marks += 1
+        self.deferred += 1
+        if time.monotonic() - self._dirty_since >= self.max_latency:
+            logger.debug("[write-behind] latência máxima atingida (%s); gravando lote.", reason or "-")
+            self.flush()
+
+    def durable(self, reason: str = "") -> None:
+        """Grava imediatamente (efeito colateral na corretora já aconteceu)."""
+        self._commit()
+        self.durable_commits += 1
+        logger.debug("[write-behind] commit durável (%s).", reason or "-")
+
+    def flush(self) -> bool:
+        """Grava o lote pendente num único commit. Retorna True se havia algo a gravar."""
+        has_changes = self._pending_marks > 0 or self._session_has_changes()
+        if not has_changes:
+            return False
+        self._commit()
+        self.flushes += 1
+        return True
+
+    def rollback(self) -> None:
+        self._reset()
+        self.db.rollback()
+
+    def _session_has_changes(self) -> bool:
+        try:
+            return bool(self.db.new or self.db.dirty or self.db.deleted)
+        except Exception:
+            return True
+
+    def _commit(self) -> None:
+        try:
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        finally:
+            self._reset()
+
+    def _reset(self) -> None:
+        self._dirty_since = None
+        self._pending_marks = 0
+
+
+def get_write_behind(db: Any) -> Optional[WriteBehindBuffer]:
+    info = getattr(db, "info", None)
+    if isinstance(info, dict):
+        return info.get(_SESSION_INFO_KEY)
+    return None
+
+
+def commit_deferred(db: Any, reason: str = "") -> None:
+    """Commit adiável: dentro de um buffer ativo só marca; fora dele faz commit direto."""
+    buffer = get_write_behind(db)
+    if buffer is not None:
+        buffer.mark(reason)
+        return
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def commit_durable(db: Any, reason: str = "") -> None:
+    """Commit imediato, com ou sem buffer ativo."""
+    buffer = get_write_behind(db)
+    if buffer is not None:
+        buffer.durable(reason)
+        return
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
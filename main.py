@@ -23,7 +23,7 @@ from bot.handlers import (
     toggle_stop_strategy_handler,
     signal_filters_menu_handler, toggle_ma_filter_handler, toggle_rsi_filter_handler,
     ask_ma_period, receive_ma_period, ASKING_MA_PERIOD,
-    admin_menu, list_channels_handler, select_channel_to_monitor, select_topic_to_monitor,
+    admin_menu, admin_latency_command, list_channels_handler, select_channel_to_monitor, select_topic_to_monitor,
     admin_view_targets_handler, back_to_admin_menu_handler,
     admin_create_invite_handler,
     bot_config_handler, bot_general_settings_handler, toggle_approval_mode_handler, handle_signal_approval, 
@@ -69,6 +69,9 @@ from bot.handlers import (
 )
 from services.telethon_service import start_signal_monitor
 from core.position_tracker import run_tracker
+from core.message_cleanup import run_message_cleanup_worker
+from core.close_confirmation import run_close_confirmation_worker
+from core.symbol_breaker import run_symbol_breaker_worker
 from services.notification_service import send_user_alert, send_error_report
 
 import warnings
@@ -320,6 +323,7 @@ async def main():
     application.add_handler(ts_trigger_conv)
     
     application.add_handler(CommandHandler("admin", admin_menu))
+    application.add_handler(CommandHandler("latency", admin_latency_command))
     application.add_handler(CallbackQueryHandler(list_channels_handler, pattern='^admin_list_channels$'))
     application.add_handler(CallbackQueryHandler(admin_create_invite_handler, pattern='^admin_create_invite$'))
     application.add_handler(CallbackQueryHandler(select_channel_to_monitor, pattern='^monitor_channel_'))
@@ -484,7 +488,10 @@ async def main():
     await asyncio.gather(
         run_ptb(application, comm_queue),
         start_signal_monitor(comm_queue),
-        run_tracker(application)
+        run_tracker(application),
+        run_message_cleanup_worker(application),
+        run_close_confirmation_worker(application),
+        run_symbol_breaker_worker()
     )
 
 if __name__ == "__main__":
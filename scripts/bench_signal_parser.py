@@ -0,0 +1,81 @@
+import sys
+import os
+import argparse
+import time
+
+# Adiciona o diretório raiz ao path para permitir a importação de módulos do projeto
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.signal_parser import parse_signal
+from tests.signal_corpus import adversarial_cases, build_corpus, random_token_messages
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))]
+
+
+def bench_corpus(repeat: int, seed: int):
+    """Mensagens/s por categoria e latência (p50/p99/máx) do corpus sintético."""
+    corpus = build_corpus(seed=seed)
+    by_category = {}
+    for category, text, expected in corpus:
+        if parse_signal(text) != expected:
+            print(f"⚠️ saída inesperada ({category}): {text[:80]!r}")
+        by_category.setdefault(category, []).append(text)
+
+    print(f"{'categoria':<10} {'msgs':>6} {'msgs/s':>12} {'p50 µs':>9} {'p99 µs':>9} {'máx µs':>9}")
+    all_latencies = []
+    total_msgs = 0
+    total_time = 0.0
+    for category, texts in sorted(by_category.items()):
+        latencies = []
+        for _ in range(repeat):
+            for text in texts:
+                started = time.perf_counter()
+                parse_signal(text)
+                latencies.append(time.perf_counter() - started)
+        elapsed = sum(latencies)
+        total_msgs += len(latencies)
+        total_time += elapsed
+        all_latencies += latencies
+        print(f"{category:<10} {len(texts):>6} {len(latencies) / elapsed:>12,.0f} "
+              f"{_percentile(latencies, 50) * 1e6:>9.1f} {_percentile(latencies, 99) * 1e6:>9.1f} "
+              f"{max(latencies) * 1e6:>9.1f}")
+    print(f"{'total':<10} {len(corpus):>6} {total_msgs / total_time:>12,.0f} "
+          f"{_percentile(all_latencies, 50) * 1e6:>9.1f} {_percentile(all_latencies, 99) * 1e6:>9.1f} "
+          f"{max(all_latencies) * 1e6:>9.1f}")
+
+
+def bench_worst_case(size: int, seed: int):
+    """Pior latência nos casos adversariais e no fuzz de mensagens longas."""
+    print(f"\nCasos adversariais ({size} caracteres):")
+    worst = ("", 0.0)
+    for name, text in adversarial_cases(size=size):
+        started = time.perf_counter()
+        parse_signal(text)
+        elapsed = time.perf_counter() - started
+        worst = max(worst, (name, elapsed), key=lambda item: item[1])
+        print(f"  {name:<26} {elapsed * 1e3:>9.2f} ms")
+    fuzz_worst = 0.0
+    for text in random_token_messages(seed=seed, count=200, size=size):
+        started = time.perf_counter()
+        parse_signal(text)
+        fuzz_worst = max(fuzz_worst, time.perf_counter() - started)
+    print(f"  {'fuzz (pior de 200)':<26} {fuzz_worst * 1e3:>9.2f} ms")
+    print(f"Pior caso adversarial: {worst[0]} ({worst[1] * 1e3:.2f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do parser de sinais (throughput e pior caso).")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetições do corpus (padrão: 20)")
+    parser.add_argument("--size", type=int, default=4096, help="Tamanho dos casos adversariais (padrão: 4096, limite do Telegram)")
+    parser.add_argument("--seed", type=int, default=0, help="Semente do corpus/fuzz")
+    args = parser.parse_args()
+
+    bench_corpus(args.repeat, args.seed)
+    bench_worst_case(args.size, args.seed)
+
+
+if __name__ == "__main__":
+    main()
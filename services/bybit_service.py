@@ -2,16 +2,26 @@ import logging
 import asyncio
 import os
 import random
-from typing import Dict, Any, Optional, List
+from time import monotonic
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime, time, timedelta
 from pybit.unified_trading import HTTP
 from pybit.exceptions import InvalidRequestError
 from database.models import User
+from utils.tracing import span
 from decimal import Decimal, ROUND_DOWN, ROUND_CEILING
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
 logger = logging.getLogger(__name__)
 INSTRUMENT_INFO_CACHE: Dict[str, Any] = {}
+# symbol -> (monotonic de quando foi lido, lastPrice)
+MARKET_PRICE_CACHE: Dict[str, Tuple[float, float]] = {}
+
+try:
+    # Idade máxima do preço reaproveitado na entrada a mercado (0 = sempre busca)
+    _ENTRY_PRICE_MAX_AGE = float(os.getenv("TF_ENTRY_PRICE_MAX_AGE_SECONDS", "2") or "2")
+except Exception:
+    _ENTRY_PRICE_MAX_AGE = 2.0
 
 def _compute_initial_sl_price(
     *,
@@ -279,6 +289,36 @@ def _resolve_position_index(session, symbol: str, close_side: str) -> Dict[str,
         return {"mode": "unknown", "positionIdx": None, "position_found": False, "details": {"reason": "exception", "error": str(e)}}
 
 
+def parse_wallet_account(account_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Converte uma conta UNIFIED (item de get_wallet_balance ou do tópico privado 'wallet',
+    que têm o mesmo formato) em {total_equity, available_balance_usdt, coin_list}.
+    """
+    equity_str = account_data.get('totalEquity')
+    total_equity = float(equity_str) if equity_str else 0.0
+    coin_list = account_data.get('coin', [])
+
+    available_balance_usdt = 0.0
+    for coin in coin_list:
+        if coin.get('coin') == 'USDT':
+            wallet_balance_str = coin.get('walletBalance', '0')
+            order_margin_str = coin.get('totalOrderIM', '0')
+            position_margin_str = coin.get('totalPositionIM', '0')
+
+            wallet_balance = float(wallet_balance_str) if wallet_balance_str else 0.0
+            order_margin = float(order_margin_str) if order_margin_str else 0.0
+            position_margin = float(position_margin_str) if position_margin_str else 0.0
+
+            # Cálculo correto para Conta de Trading Unificada
+            available_balance_usdt = wallet_balance - order_margin - position_margin
+            break
+
+    return {
+        "total_equity": total_equity,
+        "available_balance_usdt": available_balance_usdt,
+        "coin_list": coin_list
+    }
+
 async def get_account_info(api_key: str, api_secret: str) -> dict:
     """Busca o saldo da conta, calculando o saldo disponível para Contas Unificadas."""
     def _sync_call():
@@ -291,32 +331,7 @@ async def get_account_info(api_key: str, api_secret: str) -> dict:
                 if not account_data_list:
                     return {"success": False, "data": {}, "error": "Lista de contas vazia na resposta da API."}
                 
-                account_data = account_data_list[0]
-                equity_str = account_data.get('totalEquity')
-                total_equity = float(equity_str) if equity_str else 0.0
-                coin_list = account_data.get('coin', [])
-                
-                available_balance_usdt = 0.0
-                for coin in coin_list:
-                    if coin.get('coin') == 'USDT':
-                        wallet_balance_str = coin.get('walletBalance', '0')
-                        order_margin_str = coin.get('totalOrderIM', '0')
-                        position_margin_str = coin.get('totalPositionIM', '0')
-
-                        wallet_balance = float(wallet_balance_str) if wallet_balance_str else 0.0
-                        order_margin = float(order_margin_str) if order_margin_str else 0.0
-                        position_margin = float(position_margin_str) if position_margin_str else 0.0
-                        
-                        # Cálculo correto para Conta de Trading Unificada
-                        available_balance_usdt = wallet_balance - order_margin - position_margin
-                        break
-                
-                result_data = {
-                    "total_equity": total_equity,
-                    "available_balance_usdt": available_balance_usdt,
-                    "coin_list": coin_list
-                }
-                return {"success": True, "data": result_data}
+                return {"success": True, "data": parse_wallet_account(account_data_list[0])}
                 
             return {"success": False, "data": {}, "error": response.get('retMsg', 'Erro desconhecido')}
         except Exception as e:
@@ -329,7 +344,7 @@ async def place_order(api_key: str, api_secret: str, signal_data: dict, user_set
     """Abre uma nova posição a mercado (Market) com validação completa, incluindo verificação de SL contra o preço atual."""
     symbol = signal_data['coin']
     
-    price_check = await get_market_price(symbol)
+    price_check = await get_market_price(symbol, max_age=_ENTRY_PRICE_MAX_AGE)
     if not price_check.get("success"):
         return {"success": False, "error": f"Não foi possível obter o preço de mercado atual para {symbol}."}
     current_market_price = Decimal(str(price_check["price"]))
@@ -405,14 +420,16 @@ async def place_order(api_key: str, api_secret: str, signal_data: dict, user_set
                 payload["takeProfit"] = str(all_targets[0])
             # --- FIM DA MODIFICAÇÃO ---
 
-            try:
-                session.set_leverage(category="linear", symbol=symbol, buyLeverage=str(leverage), sellLeverage=str(leverage))
-            except InvalidRequestError as e:
-                if "leverage not modified" in str(e).lower(): logger.warning(f"Alavancagem para {symbol} já está correta. Continuando...")
-                else: return {"success": False, "error": str(e)}
+            with span("set_leverage"):
+                try:
+                    session.set_leverage(category="linear", symbol=symbol, buyLeverage=str(leverage), sellLeverage=str(leverage))
+                except InvalidRequestError as e:
+                    if "leverage not modified" in str(e).lower(): logger.warning(f"Alavancagem para {symbol} já está correta. Continuando...")
+                    else: return {"success": False, "error": str(e)}
             
             _safe_log_order_payload("place_order:market_entry", payload)
-            response = session.place_order(**{k: v for k, v in payload.items() if v is not None})
+            with span("place_order", order_type="Market"):
+                response = session.place_order(**{k: v for k, v in payload.items() if v is not None})
             if response.get('retCode') == 0:
                 res = {"success": True, "data": response['result'], "effective_stop_loss": float(eff_sl)}
                 return res
@@ -428,14 +445,23 @@ async def place_order(api_key: str, api_secret: str, signal_data: dict, user_set
         logger.error(f"Exceção em place_order (async): {e}", exc_info=True)
         return {"success": False, "error": str(e)}
 
-async def get_market_price(symbol: str) -> dict:
-    """Busca o preço de mercado atual de forma assíncrona."""
+async def get_market_price(symbol: str, max_age: float = 0.0) -> dict:
+    """
+    Busca o preço de mercado atual de forma assíncrona.
+    Com max_age > 0 aceita o último preço obtido há no máximo max_age segundos (ex.: aquecido no pré-aquecimento do sinal).
+    """
+    if max_age > 0:
+        cached = MARKET_PRICE_CACHE.get(symbol)
+        if cached and monotonic() - cached[0] <= max_age:
+            return {"success": True, "price": cached[1]}
+
     def _sync_call():
         try:
             session = HTTP(testnet=False, timeout=30)
             response = session.get_tickers(category="linear", symbol=symbol)
             if response.get('retCode') == 0 and response['result']['list']:
                 price = float(response['result']['list'][0]['lastPrice'])
+                MARKET_PRICE_CACHE[symbol] = (monotonic(), price)
                 return {"success": True, "price": price}
             else:
                 return {"success": False, "error": response.get('retMsg', 'Preço não encontrado')}
@@ -762,6 +788,68 @@ async def modify_position_stop_loss(
         logger.error(f"Exceção na lógica de modificar Stop Loss para {symbol}: {e}", exc_info=True)
         return {"success": False, "error": str(e)}
 
+async def set_native_trailing_stop(
+    api_key: str,
+    api_secret: str,
+    symbol: str,
+    side: str,
+    distance: float,
+    active_price: Optional[float] = None,
+    position_idx: Optional[int] = None,
+) -> dict:
+    """
+    Entrega o trailing à Bybit (set_trading_stop com trailingStop/activePrice).
+    distance: distância em preço (alinhada ao tick, mínimo 1 tick).
+    active_price: preço de ativação; se o mercado já passou dele, ativa imediatamente (omitido).
+    """
+    rules = await get_instrument_info(symbol)
+    if not rules.get("success"):
+        return {"success": False, "error": rules.get("error", f"Regras do instrumento {symbol} não encontradas.")}
+    tick = rules.get("tickSize", Decimal("0"))
+    if tick <= 0:
+        return {"success": False, "error": f"tickSize inválido para {symbol}."}
+
+    def _sync_call():
+        try:
+            session = get_session(api_key, api_secret)
+            is_long = (side or "").upper() == "LONG"
+            dist = max(_round_down_to_tick(Decimal(str(distance)), tick), tick)
+            payload: Dict[str, Any] = {
+                "category": "linear", "symbol": symbol,
+                "trailingStop": str(dist), "tpslMode": "Full",
+            }
+            if position_idx is not None:
+                payload["positionIdx"] = position_idx
+
+            if active_price:
+                t = session.get_tickers(category="linear", symbol=symbol)
+                lst = (t.get("result", {}) or {}).get("list", [])
+                last_price = Decimal(str(lst[0].get("lastPrice"))) if lst else None
+                act = Decimal(str(active_price))
+                act = _round_up_to_tick(act, tick) if is_long else _round_down_to_tick(act, tick)
+                not_reached = last_price is not None and ((is_long and act > last_price) or (not is_long and act < last_price))
+                if not_reached:
+                    payload["activePrice"] = str(act)
+
+            _safe_log_order_payload("trailing:native", payload)
+            resp = session.set_trading_stop(**payload)
+            if resp.get("retCode") == 0:
+                return {"success": True, "data": resp.get("result"), "distance": float(dist),
+                        "active_price": float(payload["activePrice"]) if "activePrice" in payload else None}
+            msg = resp.get("retMsg") or ""
+            if "not modified" in msg.lower():
+                return {"success": True, "data": {"note": "not modified"}, "distance": float(dist)}
+            return {"success": False, "error": msg}
+        except InvalidRequestError as e:
+            if "not modified" in str(e).lower():
+                return {"success": True, "data": {"note": "not modified"}, "distance": float(distance)}
+            return {"success": False, "error": str(e)}
+        except Exception as e:
+            logger.error(f"Exceção ao configurar trailing nativo para {symbol}: {e}", exc_info=True)
+            return {"success": False, "error": str(e)}
+
+    return await asyncio.to_thread(_sync_call)
+
 async def get_open_positions(api_key: str, api_secret: str) -> dict:
     return await get_open_positions_with_pnl(api_key, api_secret)
 
@@ -880,16 +968,18 @@ async def place_limit_order(api_key: str, api_secret: str, signal_data: dict, us
             if eff_sl is not None:
                 payload["stopLoss"] = str(eff_sl)
 
-            try:
-                session.set_leverage(category="linear", symbol=symbol, buyLeverage=str(leverage), sellLeverage=str(leverage))
-            except InvalidRequestError as e:
-                if "leverage not modified" in str(e).lower():
-                    logger.warning(f"Alavancagem para {symbol} já está correta. Continuando...")
-                else:
-                    return {"success": False, "error": str(e)}
+            with span("set_leverage"):
+                try:
+                    session.set_leverage(category="linear", symbol=symbol, buyLeverage=str(leverage), sellLeverage=str(leverage))
+                except InvalidRequestError as e:
+                    if "leverage not modified" in str(e).lower():
+                        logger.warning(f"Alavancagem para {symbol} já está correta. Continuando...")
+                    else:
+                        return {"success": False, "error": str(e)}
 
             _safe_log_order_payload("place_limit_order:first_try", payload)
-            response = session.place_order(**{k: v for k, v in payload.items() if v is not None})
+            with span("place_order", order_type="Limit"):
+                response = session.place_order(**{k: v for k, v in payload.items() if v is not None})
             if response.get('retCode') == 0:
                 return {"success": True, "data": response['result'], "effective_stop_loss": float(eff_sl) if eff_sl is not None else None}
             return {"success": False, "error": response.get('retMsg')}
@@ -960,6 +1050,100 @@ async def cancel_order(api_key: str, api_secret: str, order_id: str, symbol: str
             return {"success": False, "error": str(e)}
     return await asyncio.to_thread(_sync_call)
 
+# --- ESCADA DE TAKE PROFIT (REDUCE-ONLY) ---
+async def place_tp_ladder(api_key: str, api_secret: str, symbol: str, side: str, legs: List[Dict[str, Any]]) -> dict:
+    """Coloca uma ordem Limit reduce-only por alvo.
+
+    legs: [{"i": idx, "target": preço do sinal, "qty": quantidade}], side = lado do TRADE (LONG/SHORT).
+    Preço alinhado ao tick a favor da execução; quantidade arredondada ao qtyStep.
+    Pernas abaixo do mínimo somam na próxima (a última leva o que sobrar); "covers" lista
+    os índices que cada ordem cobre (os somados + o próprio).
+    Retorna {"success", "orders": [{"i","target","price","qty","id","status","covers"}], "errors": [...]}.
+    """
+    rules = await get_instrument_info(symbol)
+    if not rules.get("success"):
+        return {"success": False, "error": rules.get("error", f"Regras para {symbol} não encontradas."), "orders": []}
+
+    def _sync_call():
+        try:
+            session = get_session(api_key, api_secret)
+            is_long = (side or "").upper() == "LONG"
+            close_side = "Sell" if is_long else "Buy"
+            tick, step, min_qty = rules["tickSize"], rules["qtyStep"], rules["minOrderQty"]
+
+            resolve = _resolve_position_index(session, symbol, close_side)
+            position_idx = resolve.get("positionIdx") if resolve.get("mode") == "hedge" else None
+
+            orders, errors = [], []
+            carry = Decimal("0")
+            carried_idx: List[int] = []
+            for n, leg in enumerate(legs):
+                qty = _round_down_to_step(Decimal(str(leg["qty"])) + carry, step)
+                if qty < min_qty:
+                    carry += Decimal(str(leg["qty"]))
+                    carried_idx.append(leg["i"])
+                    continue
+                covers = carried_idx + [leg["i"]]
+                carry = Decimal("0")
+                carried_idx = []
+                target = Decimal(str(leg["target"]))
+                price = _round_down_to_tick(target, tick) if is_long else _round_up_to_tick(target, tick)
+                payload = {
+                    "category": "linear", "symbol": symbol, "side": close_side,
+                    "orderType": "Limit", "qty": str(qty), "price": str(price),
+                    "reduceOnly": True, "timeInForce": "GTC",
+                }
+                if position_idx is not None:
+                    payload["positionIdx"] = position_idx
+                _safe_log_order_payload("tp_ladder:leg", payload)
+                try:
+                    resp = session.place_order(**payload)
+                except InvalidRequestError as e:
+                    errors.append({"i": leg["i"], "error": str(e)})
+                    continue
+                if resp.get("retCode") == 0:
+                    orders.append({
+                        "i": leg["i"], "target": float(leg["target"]), "price": float(price),
+                        "qty": float(qty), "id": (resp.get("result") or {}).get("orderId"), "status": "open",
+                        "covers": covers,
+                    })
+                else:
+                    errors.append({"i": leg["i"], "error": resp.get("retMsg")})
+            return {"success": bool(orders) and not errors, "orders": orders, "errors": errors}
+        except Exception as e:
+            logger.error(f"Exceção ao colocar escada de TP para {symbol}: {e}", exc_info=True)
+            return {"success": False, "error": str(e), "orders": []}
+
+    return await asyncio.to_thread(_sync_call)
+
+
+async def get_open_orders(api_key: str, api_secret: str, symbol: Optional[str] = None) -> dict:
+    """Lista as ordens abertas (de um símbolo ou de todos os USDT perpétuos) em uma chamada paginada."""
+    def _sync_call():
+        try:
+            session = get_session(api_key, api_secret)
+            params: Dict[str, Any] = {"category": "linear", "limit": 50}
+            if symbol:
+                params["symbol"] = symbol
+            else:
+                params["settleCoin"] = "USDT"
+            items: List[Dict[str, Any]] = []
+            while True:
+                resp = session.get_open_orders(**params)
+                if resp.get("retCode") != 0:
+                    return {"success": False, "error": resp.get("retMsg")}
+                result = resp.get("result") or {}
+                items.extend(result.get("list") or [])
+                cursor = result.get("nextPageCursor")
+                if not cursor or len(result.get("list") or []) < params["limit"]:
+                    break
+                params["cursor"] = cursor
+            return {"success": True, "data": items}
+        except Exception as e:
+            logger.error(f"Exceção ao listar ordens abertas: {e}", exc_info=True)
+            return {"success": False, "error": str(e)}
+    return await asyncio.to_thread(_sync_call)
+
 # --- PNL FECHADO (PERFORMANCE) ---
 async def get_closed_pnl_breakdown(api_key: str, api_secret: str, start_time: datetime, end_time: datetime) -> dict:
     """
@@ -1202,6 +1386,8 @@ async def get_open_positions_with_pnl(api_key: str, api_secret: str) -> dict:
                     "unrealized_pnl": pnl,
                     "unrealized_pnl_frac": pnl_frac,  # padronizado em FRAÇÃO
                     "position_idx": pos_idx,
+                    "stop_loss": float(pos.get("stopLoss") or 0) or None,
+                    "trailing_stop": float(pos.get("trailingStop") or 0) or None,
                 }
 
                 if key in seen:
@@ -1,8 +1,8 @@
 import logging
 from telegram.ext import Application
 from utils.config import ADMIN_ID, ERROR_CHANNEL_ID
-from database.session import SessionLocal
-from database.models import AlertMessage
+from services.telegram_dispatcher import get_dispatcher
+from core.message_cleanup import schedule_alert_deletion
 
 logger = logging.getLogger(__name__)
 
@@ -24,15 +24,26 @@ async def send_notification(application: Application, message: str):
         logger.error(f"Falha ao enviar notificação para o admin: {e}")
 
 
-async def send_user_alert(application: Application, user_id: int, text: str, parse_mode: str = 'HTML') -> int | None:
+async def send_user_alert(application: Application, user_id: int, text: str, parse_mode: str = 'HTML') -> None:
     """
-    Envia um alerta geral ao usuário e registra para limpeza posterior
-    conforme as preferências de 'alert_cleanup_*'. Retorna o message_id
-    ou None em caso de falha.
+    Enfileira um alerta geral ao usuário no despachante de saída e, quando o
+    envio acontece, agenda a remoção conforme as preferências de
+    'alert_cleanup_*' (core/message_cleanup.py). Não espera pelo Telegram.
     """
     if not application:
         return None
 
+    def _register(msg) -> None:
+        message_id = getattr(msg, 'message_id', None)
+        if message_id is not None:
+            schedule_alert_deletion(user_id, message_id)
+
+    def _on_error(exc: Exception) -> None:
+        logger.error(f"Falha ao enviar alerta ao usuário {user_id}: {exc}")
+
+    get_dispatcher(application).send(user_id, text, parse_mode=parse_mode, on_sent=_register, on_error=_on_error)
+    return None
+
 
 async def send_error_report(application: Application, text: str, parse_mode: str = 'HTML') -> int | None:
     """
@@ -51,17 +62,3 @@ async def send_error_report(application: Application, text: str, parse_mode: str
     except Exception as e:
         logger.error(f"Falha ao enviar relatório de erro para canal: {e}")
         return None
-    try:
-        msg = await application.bot.send_message(chat_id=user_id, text=text, parse_mode=parse_mode)
-        message_id = getattr(msg, 'message_id', None)
-        if message_id is not None:
-            db = SessionLocal()
-            try:
-                db.add(AlertMessage(user_telegram_id=user_id, message_id=message_id))
-                db.commit()
-            finally:
-                db.close()
-        return message_id
-    except Exception as e:
-        logging.getLogger(__name__).error(f"Falha ao enviar alerta ao usuário {user_id}: {e}")
-        return None
@@ -0,0 +1,143 @@
+"""
+Deduplicação persistente das mensagens de sinal do Telegram.
+
+A chave é (chat_id, message_id, hash do conteúdo): IDs de canais diferentes não
+colidem, e uma edição que muda o texto vira uma versão nova (edição sem mudança
+de texto continua duplicada). As chaves ficam na tabela processed_signal_messages
+— sobrevivem a reinícios/reconexões — e num cache em memória limitado
+(TF_SIGNAL_DEDUPE_MEMORY) que evita ir ao banco para repetições recentes.
+Entradas com mais de TF_SIGNAL_DEDUPE_TTL_HOURS são descartadas dos dois lados.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+import pytz
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from database.session import SessionLocal
+from database.models import ProcessedSignalMessage
+
+logger = logging.getLogger(__name__)
+
+try:
+    _TTL_SECONDS = float(os.getenv("TF_SIGNAL_DEDUPE_TTL_HOURS", "72") or "72") * 3600.0
+except Exception:
+    _TTL_SECONDS = 72 * 3600.0
+try:
+    _MEMORY = max(1, int(os.getenv("TF_SIGNAL_DEDUPE_MEMORY", "5000") or "5000"))
+except Exception:
+    _MEMORY = 5000
+_PURGE_EVERY = 600.0
+
+_Key = Tuple[int, int, str]
+
+# chave -> time.monotonic() do registro
+_SEEN: "OrderedDict[_Key, float]" = OrderedDict()
+_LOCK = threading.Lock()
+_last_purge = 0.0
+
+
+def content_hash(text: Optional[str]) -> str:
+    return hashlib.sha256((text or "").strip().encode("utf-8")).hexdigest()
+
+
+def _remember(key: _Key) -> None:
+    now = time.monotonic()
+    with _LOCK:
+        _SEEN[key] = now
+        _SEEN.move_to_end(key)
+        while _SEEN and (len(_SEEN) > _MEMORY or now - next(iter(_SEEN.values())) > _TTL_SECONDS):
+            _SEEN.popitem(last=False)
+
+
+def seen_recently(chat_id: Optional[int], message_id: Optional[int], text: Optional[str]) -> bool:
+    """Checagem só em memória (sem banco), para descartar repetições antes do parser."""
+    if chat_id is None or message_id is None:
+        return False
+    key = (int(chat_id), int(message_id), content_hash(text))
+    with _LOCK:
+        stamp = _SEEN.get(key)
+    return stamp is not None and time.monotonic() - stamp <= _TTL_SECONDS
+
+
+def claim_message(chat_id: Optional[int], message_id: Optional[int], text: Optional[str]) -> bool:
+    """
+    Registra a versão da mensagem como processada. True se ela é nova (deve seguir),
+    False se já tinha sido processada — por este ou outro processo, antes ou depois
+    de um reinício. Sem chat/mensagem identificáveis não há como deduplicar: True.
+    Erro de banco (fora a violação da PK) é logado e também devolve True.
+    Bloqueante (banco): chamar via asyncio.to_thread no loop do Telethon.
+    """
+    if chat_id is None or message_id is None:
+        return True
+    key = (int(chat_id), int(message_id), content_hash(text))
+    with _LOCK:
+        if key in _SEEN:
+            return False
+    db = SessionLocal()
+    try:
+        db.add(ProcessedSignalMessage(
+            chat_id=key[0], message_id=key[1], content_hash=key[2],
+            processed_at=datetime.now(pytz.utc),
+        ))
+        db.commit()
+        fresh = True
+    except IntegrityError:
+        db.rollback()
+        fresh = False
+    except SQLAlchemyError:
+        # Banco indisponível: segue com o dedupe em memória (fail-open) em vez de
+        # derrubar o listener; a chave fica no cache e repetições locais param aqui
+        db.rollback()
+        logger.exception("[dedupe] falha ao registrar chat=%s msg=%s; seguindo só com a memória", key[0], key[1])
+        fresh = True
+    finally:
+        db.close()
+    _remember(key)
+    _maybe_purge()
+    return fresh
+
+
+def purge_expired() -> int:
+    """Remove do banco as entradas mais velhas que o TTL. Retorna quantas saíram."""
+    cutoff = datetime.now(pytz.utc) - timedelta(seconds=_TTL_SECONDS)
+    db = SessionLocal()
+    try:
+        deleted = db.query(ProcessedSignalMessage).filter(
+            ProcessedSignalMessage.processed_at < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _maybe_purge() -> None:
+    global _last_purge
+    now = time.monotonic()
+    with _LOCK:
+        if now - _last_purge < _PURGE_EVERY:
+            return
+        _last_purge = now
+    try:
+        removed = purge_expired()
+        if removed:
+            logger.info("[dedupe] %d mensagem(ns) expirada(s) removida(s)", removed)
+    except Exception:
+        logger.exception("[dedupe] falha ao remover mensagens expiradas")
+
+
+def reset() -> None:
+    global _last_purge
+    with _LOCK:
+        _SEEN.clear()
+        _last_purge = 0.0
@@ -0,0 +1,30 @@
+"""
+Envelope de um sinal do Telegram na comm_queue.
+
+O signal_listener faz o parse uma única vez e enfileira o envelope com o sinal
+já interpretado, o texto bruto, a origem (chat/tópico/mensagem) e os instantes
+de envio, recebimento e enfileiramento; o queue_processor só o consome.
+"""
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from utils.tracing import SignalTrace
+
+
+@dataclass(slots=True)
+class SignalEnvelope:
+    signal: Dict[str, Any]
+    raw_text: str
+    chat_id: Optional[int]
+    topic_id: Optional[int] = None
+    message_id: Optional[int] = None
+    message_date: Optional[datetime] = None  # envio no Telegram (UTC)
+    received_at: float = field(default_factory=time.time)  # epoch, chegada no listener
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    trace: Optional[SignalTrace] = None
+
+    @property
+    def source_name(self) -> str:
+        return f"telegram:{self.chat_id}"
@@ -1,5 +1,6 @@
 import re
 import logging
+from bisect import bisect_left
 from typing import Dict, Any, List, Optional
 
 logger = logging.getLogger(__name__)
@@ -15,6 +16,9 @@ class SignalType:
 # Helpers de normalização
 # -----------------------
 _FLOAT = r'[-+]?\d+(?:[.,]\d+)?'
+_FLOAT_RE = re.compile(_FLOAT)
+_NON_NUMERIC_RE = re.compile(r'[^0-9.+-]')
+_NON_ALNUM_RE = re.compile(r'[^A-Z0-9]')
 
 def _to_float(x: str) -> float:
     """Converte string com vírgula ou ponto para float."""
@@ -22,7 +26,7 @@ def _to_float(x: str) -> float:
         return 0.0
     x = x.strip().replace(' ', '').replace(',', '.')
     # remove percentuais e símbolos residuais
-    x = re.sub(r'[^0-9.+-]', '', x)
+    x = _NON_NUMERIC_RE.sub('', x)
     try:
         return float(x)
     except Exception:
@@ -31,58 +35,128 @@ def _to_float(x: str) -> float:
 def _normalize_symbol(coin_raw: str) -> str:
     coin = (coin_raw or '').strip().upper()
     # remove emojis e lixo
-    coin = re.sub(r'[^A-Z0-9]', '', coin)
+    coin = _NON_ALNUM_RE.sub('', coin)
     # alguns sinais usam par completo (ex.: AVAXUSDT)
     if coin.endswith('USDT') or coin.endswith('USD'):
         return coin if coin.endswith('USDT') else f'{coin}T'  # USD -> USDT (fail-safe)
     return f'{coin}USDT' if coin else coin
 
 def _pick_first_number(text: str) -> Optional[float]:
-    m = re.search(_FLOAT, text)
+    m = _FLOAT_RE.search(text)
     return _to_float(m.group(0)) if m else None
 
 def _findall_numbers(text: str) -> List[float]:
-    return [_to_float(g) for g in re.findall(_FLOAT, text or '')]
+    return [_to_float(g) for g in _FLOAT_RE.findall(text or '')]
 
 
 # ----------------------------------------------------
 # Padrões de alto nível (ordem importa: específicos 1º)
 # ----------------------------------------------------
 CANCEL_PATTERN = re.compile(r'⚠️\s*([A-Za-z0-9]+)[^\n]*sinal\s*cancelad[oa]', re.IGNORECASE)
+# Partes do CANCEL_PATTERN para _match_cancel (mesma semântica, sem backtracking quadrático)
+_CANCEL_MARK = '⚠️'
+_WS_RE = re.compile(r'\s*')
+_ALNUM_RUN_RE = re.compile(r'[A-Za-z0-9]+', re.IGNORECASE)
+_CANCEL_TAIL_RE = re.compile(r'sinal\s*cancelad[oa]', re.IGNORECASE)
+
+# Campos: (palavras-chave em minúsculas, padrão pré-compilado). O padrão só roda
+# a partir da linha onde aparece a 1ª palavra-chave do rótulo; sem ela, o campo
+# nem é procurado.
+_FIELDS = {
+    "coin": (("moeda", "coin", "pair"), re.compile(r'(?:Moeda|Coin|Pair)\s*:\s*([A-Za-z0-9 ._-]+)', re.IGNORECASE)),
+    "side": (("tipo",), re.compile(r'Tipo\s*:\s*([A-Za-z ]+)', re.IGNORECASE)),
+    "entry": (("zona",), re.compile(r'Zona\s*de\s*Entrada\s*:\s*([^\n\r]+)', re.IGNORECASE)),
+    "sl": (("stop",), re.compile(r'Stop\s*Loss\s*:\s*([^\n\r]+)', re.IGNORECASE)),
+    "conf": (("confian",), re.compile(r'Confian[çc]a\s*:\s*([0-9.,]+)\s*%', re.IGNORECASE)),
+}
+TARGET_PATTERN = re.compile(r'(?:^|\n)\s*T(\d+)\s*:\s*([^\n\r]+)', re.IGNORECASE)
+TIPO_LABEL_PATTERN = re.compile(r'Tipo\s*:', re.IGNORECASE)
 
 # “Ordem Limite” / “Ordem a/à Mercado” podem aparecer em qualquer lugar
-IS_MARKET_PATTERN = re.compile(r'Ordem\s*(?:à|a)?\s*Mercado', re.IGNORECASE)
+# (\s* só depois do 'à/a' opcional: dois \s* vizinhos ficam quadráticos em espaços longos)
+IS_MARKET_PATTERN = re.compile(r'Ordem\s*(?:[àa]\s*)?Mercado', re.IGNORECASE)
 IS_LIMIT_PATTERN  = re.compile(r'Ordem\s*Limite', re.IGNORECASE)
 
-# Verificador de “sinal completo”
-FULL_SIGNAL_GUARD = re.compile(r'(?=.*(?:Moeda|Coin|Pair)\s*:)(?=.*Tipo\s*:)(?=.*Stop\s*Loss\s*:)', re.IGNORECASE | re.DOTALL)
+
+def _match_cancel(text: str) -> Optional[str]:
+    """
+    Equivale a CANCEL_PATTERN.search(text).group(1), em tempo linear. A regex
+    volta atrás em ([A-Za-z0-9]+)[^\n]* e fica quadrática em mensagens longas
+    (ex.: '⚠️ ' + 4000 letras custava ~135 ms). Aqui: para cada ⚠️ (o 1º com
+    match vence), a moeda vai do 1º caractere não-branco até o fim da sequência
+    alfanumérica ou até o último 'sinal ... cancelado' daquela linha, o que vier antes.
+    """
+    tails = None
+    line_end = -1
+    p = text.find(_CANCEL_MARK)
+    while p >= 0:
+        coin_start = _WS_RE.match(text, p + len(_CANCEL_MARK)).end()
+        run = _ALNUM_RUN_RE.match(text, coin_start)
+        if run:
+            if tails is None:
+                tails = [m.start() for m in _CANCEL_TAIL_RE.finditer(text)]
+                if not tails:
+                    return None
+            if coin_start > line_end:
+                line_end = text.find('\n', coin_start)
+                if line_end < 0:
+                    line_end = len(text)
+            i = bisect_left(tails, line_end) - 1
+            if i >= 0 and tails[i] > coin_start:
+                return text[coin_start:min(run.end(), tails[i])]
+        p = text.find(_CANCEL_MARK, p + 1)
+    return None
+
+
+def _prefilter(low: str) -> bool:
+    """Descarte barato (substrings) de mensagens sem os rótulos obrigatórios."""
+    return 'tipo' in low and 'stop' in low and ('moeda' in low or 'coin' in low or 'pair' in low)
+
+
+def _scan(text: str, low: str) -> Dict[str, Any]:
+    """
+    Valores brutos dos campos (1ª ocorrência, como um re.search no texto todo),
+    alvos em ordem e flags de Mercado/Limite. low = text.casefold().
+    """
+    aligned = len(low) == len(text)  # casefold raramente muda o tamanho (ex.: ß)
+    raw: Dict[str, Any] = {}
+    for field, (keywords, pattern) in _FIELDS.items():
+        hits = [i for i in (low.find(k) for k in keywords) if i >= 0]
+        if not hits:
+            raw[field] = None
+            continue
+        start = text.rfind('\n', 0, min(hits)) + 1 if aligned else 0
+        m = pattern.search(text, start)
+        raw[field] = m.group(1).strip() if m else None
+    raw["targets"] = [val for _, val in TARGET_PATTERN.findall(text)]
+    has_ordem = 'ordem' in low
+    raw["market"] = has_ordem and IS_MARKET_PATTERN.search(text) is not None
+    raw["limit"] = has_ordem and IS_LIMIT_PATTERN.search(text) is not None
+    return raw
 
 
 # ---------------------------
 # Extrator de sinal “completo”
 # ---------------------------
-def _full_signal_extractor(message_text: str) -> Optional[Dict[str, Any]]:
-
-    def find_single_value(pattern: str, text: str) -> Optional[str]:
-        # Usa .*? para pular emojis e rótulos adicionais na linha
-        m = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
-        return m.group(1).strip() if m else None
+def _full_signal_extractor(message_text: str, raw: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    if raw is None:
+        raw = _scan(message_text, message_text.casefold())
 
     # --- Campos básicos ---
-    coin_raw = find_single_value(r'(?:Moeda|Coin|Pair)\s*:\s*([A-Za-z0-9 ._-]+)', message_text)
-    order_type_raw = find_single_value(r'Tipo\s*:\s*([A-Za-z ]+)', message_text)
-    entry_raw = find_single_value(r'Zona\s*de\s*Entrada\s*:\s*([^\n\r]+)', message_text)
-    sl_raw = find_single_value(r'Stop\s*Loss\s*:\s*([^\n\r]+)', message_text)
+    coin_raw = raw.get("coin")
+    order_type_raw = raw.get("side")
+    entry_raw = raw.get("entry")
+    sl_raw = raw.get("sl")
 
     # targets: T1:, T2:, ...
     targets = []
-    for tlabel, val in re.findall(r'(?:^|\n)\s*T(\d+)\s*:\s*([^\n\r]+)', message_text, flags=re.IGNORECASE):
+    for val in raw["targets"]:
         n = _pick_first_number(val)
         if n is not None:
             targets.append(n)
 
     # confiança (se existir)
-    conf_raw = find_single_value(r'Confian[çc]a\s*:\s*([0-9.,]+)\s*%', message_text)
+    conf_raw = raw.get("conf")
     confidence = _to_float(conf_raw) if conf_raw else None
 
     # normalizações
@@ -111,8 +185,8 @@ def _full_signal_extractor(message_text: str) -> Optional[Dict[str, Any]]:
 
     # --- Determinação do tipo (MARKET x LIMIT) ---
     # 1) texto explícito
-    is_market_text = bool(IS_MARKET_PATTERN.search(message_text))
-    is_limit_text  = bool(IS_LIMIT_PATTERN.search(message_text))
+    is_market_text = raw["market"]
+    is_limit_text = raw["limit"]
 
     # 2) heurística: “entrada única” OU faixa idêntica => MARKET
     entries_imply_market = False
@@ -156,6 +230,7 @@ def parse_signal(message_text: str) -> Optional[Dict[str, Any]]:
       - CANCELAMENTO: '⚠️ <COIN> ... sinal cancelad(o/a)'
       - ENTRADA COMPLETA: campos Moeda/Coin/Pair, Tipo, Stop Loss (com 'Ordem Limite' ou 'Ordem à Mercado')
     Retorna um dicionário com os campos normalizados ou None se não reconhecer.
+    Mensagens sem as palavras-chave são descartadas antes de qualquer regex.
     """
     if not message_text or not isinstance(message_text, str):
         return None
@@ -163,14 +238,20 @@ def parse_signal(message_text: str) -> Optional[Dict[str, Any]]:
     text = message_text.strip()
 
     # 1) Cancelamento
-    m_cancel = CANCEL_PATTERN.search(text)
-    if m_cancel:
-        coin = _normalize_symbol(m_cancel.group(1))
-        return {"type": SignalType.CANCELAR, "coin": coin}
-
-    # 2) Sinal de entrada (guarda)
-    if not FULL_SIGNAL_GUARD.search(text):
+    coin_cancel = _match_cancel(text)
+    if coin_cancel is not None:
+        return {"type": SignalType.CANCELAR, "coin": _normalize_symbol(coin_cancel)}
+
+    # 2) Sinal de entrada (guarda: Moeda/Coin/Pair, Tipo e Stop Loss presentes).
+    # Sem Moeda ou Stop Loss o extrator já descarta; só o rótulo Tipo sem valor
+    # válido precisa da checagem explícita.
+    low = text.casefold()
+    if not _prefilter(low):
+        return None
+    raw = _scan(text, low)
+    if raw["coin"] is None or raw["sl"] is None:
+        return None
+    if raw["side"] is None and not TIPO_LABEL_PATTERN.search(text):
         return None
 
-    data = _full_signal_extractor(text)
-    return data
\ No newline at end of file
+    return _full_signal_extractor(text, raw)
@@ -0,0 +1,295 @@
+"""
+Despachante de saída para o Telegram.
+
+Os caminhos de trade (rastreador, trade_manager, alertas) apenas ENFILEIRAM
+envios/edições/remoções; um único worker por bot entrega respeitando:
+  - balde global (~30 msg/s, limite do Bot API);
+  - balde por chat (~1 msg/s, com pequena rajada);
+  - RetryAfter (flood control): pausa global pelo tempo pedido e reenfileira na frente;
+  - coalescência: várias edições pendentes da mesma mensagem viram uma só (a mais recente).
+
+Quem precisa do message_id de um envio passa um callback on_sent(message).
+"""
+import asyncio
+import inspect
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)) or default)
+    except Exception:
+        return default
+
+
+_GLOBAL_RATE = _env_float("TF_TG_GLOBAL_RATE", 30.0)
+_CHAT_RATE = _env_float("TF_TG_CHAT_RATE", 1.0)
+_CHAT_BURST = _env_float("TF_TG_CHAT_BURST", 3.0)
+_MAX_ATTEMPTS = 5
+
+
+class _TokenBucket:
+    """Balde de tokens simples (rate tokens/s, capacidade = rajada)."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = max(0.001, float(rate))
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Segundos até haver 1 token disponível (0 = pode enviar já)."""
+        self._refill(now)
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1.0
+
+
+class _Outbound:
+    __slots__ = ("kind", "chat_id", "message_id", "text", "kwargs", "on_sent", "on_error", "attempts", "not_before")
+
+    def __init__(self, kind: str, chat_id: int, message_id: Optional[int], text: Optional[str],
+                 kwargs: Dict[str, Any], on_sent: Optional[Callable], on_error: Optional[Callable]):
+        self.kind = kind
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.kwargs = kwargs
+        self.on_sent = on_sent
+        self.on_error = on_error
+        self.attempts = 0
+        self.not_before = 0.0
+
+
+class TelegramDispatcher:
+    """Fila de saída com limites de taxa e coalescência de edições."""
+
+    def __init__(self, bot, *, global_rate: float = _GLOBAL_RATE,
+                 per_chat_rate: float = _CHAT_RATE, per_chat_burst: float = _CHAT_BURST):
+        self.bot = bot
+        self._global = _TokenBucket(global_rate, global_rate)
+        self._per_chat_rate = per_chat_rate
+        self._per_chat_burst = per_chat_burst
+        self._chats: Dict[int, _TokenBucket] = {}
+        self._items: "OrderedDict[Tuple, _Outbound]" = OrderedDict()
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._paused_until = 0.0
+        self.stats = {"sent": 0, "edited": 0, "deleted": 0, "coalesced": 0, "retry_after": 0, "failed": 0}
+
+    # ------------------------------------------------------------------ API
+    def send(self, chat_id: int, text: str, *, on_sent: Optional[Callable] = None,
+             on_error: Optional[Callable] = None, **kwargs) -> None:
+        kwargs.setdefault("parse_mode", "HTML")
+        self._put(("send", next(self._seq)), _Outbound("send", chat_id, None, text, kwargs, on_sent, on_error))
+
+    def edit(self, chat_id: int, message_id: int, text: str, *, on_sent: Optional[Callable] = None,
+             on_error: Optional[Callable] = None, **kwargs) -> None:
+        kwargs.setdefault("parse_mode", "HTML")
+        key = ("edit", chat_id, message_id)
+        pending = self._items.get(key)
+        if pending is not None:
+            # Mantém a posição na fila e troca pelo conteúdo mais recente
+            pending.text = text
+            pending.kwargs = kwargs
+            pending.on_sent = on_sent or pending.on_sent
+            pending.on_error = on_error or pending.on_error
+            self.stats["coalesced"] += 1
+            return
+        self._put(key, _Outbound("edit", chat_id, message_id, text, kwargs, on_sent, on_error))
+
+    def delete(self, chat_id: int, message_id: int, *, on_sent: Optional[Callable] = None) -> None:
+        # Editar uma mensagem que será apagada é desperdício de cota
+        if self._items.pop(("edit", chat_id, message_id), None) is not None:
+            self.stats["coalesced"] += 1
+        self._put(("delete", chat_id, message_id), _Outbound("delete", chat_id, message_id, None, {}, on_sent, None))
+
+    def pending(self) -> int:
+        return len(self._items)
+
+    # -------------------------------------------------------------- worker
+    def _put(self, key: Tuple, item: _Outbound) -> None:
+        self._items[key] = item
+        self._ensure_started()
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _ensure_started(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # sem loop ainda; o próximo enqueue dentro do loop inicia o worker
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run(), name="telegram-dispatcher")
+
+    def _chat_bucket(self, chat_id: int) -> _TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = _TokenBucket(self._per_chat_rate, self._per_chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _next_ready(self, now: float) -> Tuple[Optional[Tuple], float]:
+        """Primeiro item cujo chat tem token; preserva a ordem dentro de cada chat."""
+        blocked = set()
+        min_wait = None
+        for key, item in self._items.items():
+            if item.chat_id in blocked:
+                continue
+            wait = max(self._chat_bucket(item.chat_id).wait_time(now), item.not_before - now)
+            if wait <= 0:
+                return key, 0.0
+            blocked.add(item.chat_id)
+            min_wait = wait if min_wait is None else min(min_wait, wait)
+        return None, (min_wait if min_wait is not None else 0.0)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if not self._items:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                key, wait = self._next_ready(now)
+                if key is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                global_wait = self._global.wait_time(now)
+                if global_wait > 0:
+                    await asyncio.sleep(global_wait)
+                    continue
+
+                item = self._items.pop(key)
+                now = time.monotonic()
+                self._global.take(now)
+                self._chat_bucket(item.chat_id).take(now)
+                await self._deliver(key, item)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("[tg-dispatch] erro inesperado no worker")
+                await asyncio.sleep(1)
+
+    async def _deliver(self, key: Tuple, item: _Outbound) -> None:
+        item.attempts += 1
+        try:
+            if item.kind == "send":
+                result = await self.bot.send_message(chat_id=item.chat_id, text=item.text, **item.kwargs)
+                self.stats["sent"] += 1
+            elif item.kind == "edit":
+                try:
+                    result = await self.bot.edit_message_text(
+                        chat_id=item.chat_id, message_id=item.message_id, text=item.text, **item.kwargs
+                    )
+                except BadRequest as e:
+                    if "message is not modified" not in str(e).lower():
+                        raise
+                    result = True
+                self.stats["edited"] += 1
+            else:
+                try:
+                    result = await self.bot.delete_message(chat_id=item.chat_id, message_id=item.message_id)
+                except BadRequest as e:
+                    msg = str(e).lower()
+                    if "message to delete not found" not in msg and "message can't be deleted" not in msg:
+                        raise
+                    logger.debug("[tg-dispatch] mensagem já removida (chat=%s id=%s)", item.chat_id, item.message_id)
+                    result = False
+                self.stats["deleted"] += 1
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+            self.stats["retry_after"] += 1
+            self._paused_until = time.monotonic() + retry_after
+            logger.warning("[tg-dispatch] flood control: aguardando %.1fs (pendentes=%d)", retry_after, len(self._items))
+            self._requeue(key, item, front=True)
+            return
+        except BadRequest as e:
+            # BadRequest herda de NetworkError, mas não adianta repetir
+            await self._fail(item, e)
+            return
+        except (TimedOut, NetworkError) as e:
+            if item.attempts < _MAX_ATTEMPTS:
+                item.not_before = time.monotonic() + min(30.0, 2.0 ** item.attempts)
+                self._requeue(key, item, front=False)
+                return
+            await self._fail(item, e)
+            return
+        except Exception as e:
+            await self._fail(item, e)
+            return
+
+        await self._callback(item.on_sent, result)
+
+    def _requeue(self, key: Tuple, item: _Outbound, *, front: bool) -> None:
+        if key in self._items:
+            # Uma edição mais nova chegou enquanto esta estava em voo: fica a mais nova
+            return
+        self._items[key] = item
+        if front:
+            self._items.move_to_end(key, last=False)
+
+    async def _fail(self, item: _Outbound, exc: Exception) -> None:
+        self.stats["failed"] += 1
+        if item.on_error is None:
+            logger.warning("[tg-dispatch] falha ao %s chat=%s msg=%s: %s",
+                           item.kind, item.chat_id, item.message_id, exc)
+        await self._callback(item.on_error, exc)
+
+    @staticmethod
+    async def _callback(cb: Optional[Callable], arg: Any) -> None:
+        if cb is None:
+            return
+        try:
+            res = cb(arg)
+            if inspect.isawaitable(res):
+                await res
+        except Exception:
+            logger.exception("[tg-dispatch] falha no callback")
+
+
+_DISPATCHERS: Dict[int, TelegramDispatcher] = {}
+
+
+def get_dispatcher(application) -> TelegramDispatcher:
+    """Despachante único por bot (criado sob demanda)."""
+    bot = application.bot
+    dispatcher = _DISPATCHERS.get(id(bot))
+    if dispatcher is None or dispatcher.bot is not bot:
+        dispatcher = TelegramDispatcher(bot)
+        _DISPATCHERS[id(bot)] = dispatcher
+    return dispatcher
@@ -2,6 +2,8 @@ import logging
 import asyncio
 import os
 import re
+import time
+from typing import Optional
 from telegram.ext import Application
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telethon.sync import TelegramClient
@@ -13,6 +15,9 @@ from database.session import SessionLocal
 from services.notification_service import send_error_report
 from database.models import MonitoredTarget
 from .signal_parser import parse_signal
+from .signal_dedupe import claim_message, seen_recently
+from .signal_envelope import SignalEnvelope
+from utils.tracing import activate, deactivate, finish_trace, span, start_trace
 
 logger = logging.getLogger(__name__)
 
@@ -23,8 +28,12 @@ SESSION_PATH = '/data/tradeflow_user'
 # --- DEFINIÇÃO ÚNICA E CORRETA DO CLIENTE ---
 client = TelegramClient(SESSION_PATH, API_ID, API_HASH)
 comm_queue = None
-# Cache em memória para armazenar os IDs das mensagens já processadas e evitar duplicidade.
-PROCESSED_MESSAGE_IDS = set()
+# Alvos monitorados em memória: {(channel_id, topic_id)}; topic_id None = canal sem tópico.
+# Carregado na partida e recarregado pelas ações da fila que alteram os alvos.
+MONITORED_TARGETS: frozenset = frozenset()
+_targets_loaded = False
+# Canais com que o listener está registrado no cliente (None = ainda não registrado)
+_LISTENER_CHATS: Optional[frozenset] = None
 
 
 # --- Funções de Busca (Helpers) ---
@@ -37,6 +46,21 @@ def get_monitored_targets():
     finally:
         db.close()
 
+def reload_monitored_targets() -> int:
+    """Recarrega o conjunto em memória a partir do DB. Retorna o nº de alvos."""
+    global MONITORED_TARGETS, _targets_loaded
+    MONITORED_TARGETS = frozenset((t.channel_id, t.topic_id) for t in get_monitored_targets())
+    _targets_loaded = True
+    _register_listener(frozenset(channel_id for channel_id, _ in MONITORED_TARGETS))
+    logger.info(f"[Telethon] {len(MONITORED_TARGETS)} alvo(s) monitorado(s) carregado(s).")
+    return len(MONITORED_TARGETS)
+
+def is_monitored(chat_id, topic_id) -> bool:
+    """Consulta O(1) ao conjunto de alvos (sem sessão de banco após a carga inicial)."""
+    if not _targets_loaded:
+        reload_monitored_targets()
+    return (chat_id, topic_id) in MONITORED_TARGETS
+
 async def list_channels():
     """Lista todos os canais e supergrupos com logging detalhado."""
     logger.info("[list_channels] Iniciando busca de diálogos...")
@@ -77,14 +101,25 @@ async def list_channel_topics(channel_id: int):
     return topics
 
 # --- Listener de Sinais ---
-# Em vez de filtrar por regex no decorator, ouvimos TUDO e deixamos o parser decidir.
-from telethon import events
+# Registrado com filtro chats= dos canais monitorados: o Telethon descarta o tráfego
+# dos demais diálogos antes de montar o evento. O tópico é conferido no listener.
+
+def _register_listener(chats: frozenset) -> None:
+    """(Re)registra o listener filtrado pelos canais; sem alvos, fica desligado."""
+    global _LISTENER_CHATS
+    if chats == _LISTENER_CHATS:
+        return
+    client.remove_event_handler(signal_listener)
+    if chats:
+        ids = sorted(chats)
+        client.add_event_handler(signal_listener, events.NewMessage(chats=ids))
+        client.add_event_handler(signal_listener, events.MessageEdited(chats=ids))
+    _LISTENER_CHATS = chats
+    logger.info(f"[Telethon] Listener registrado para {len(chats)} canal(is).")
 
-@client.on(events.NewMessage)
-@client.on(events.MessageEdited)
 async def signal_listener(event):
     """
-    Ouve TODAS as mensagens e processa APENAS as dos alvos monitorados.
+    Recebe as mensagens dos canais monitorados e processa APENAS as dos alvos (canal/tópico).
     """
     global comm_queue
     if not comm_queue: return
@@ -94,15 +129,9 @@ async def signal_listener(event):
     topic_id = event.reply_to.reply_to_msg_id if getattr(event, "reply_to", None) else None
     text = (getattr(event, "raw_text", None) or getattr(getattr(event, "message", None), "message", None) or "")
 
-    # 1. Primeiro, verifica se a mensagem é de um alvo monitorado
-    monitored_targets = get_monitored_targets()
-    is_target = any(
-        (t.channel_id == chat_id and ((t.topic_id is None and topic_id is None) or t.topic_id == topic_id))
-        for t in monitored_targets
-    )
-
+    # 1. Primeiro, verifica se a mensagem é de um alvo monitorado (conjunto em memória)
     # 2. Se não for um alvo, a função termina silenciosamente.
-    if not is_target:
+    if not is_monitored(chat_id, topic_id):
         return
 
     # --- LÓGICA DE LOG MOVIDA PARA CÁ ---
@@ -110,13 +139,21 @@ async def signal_listener(event):
     preview = text.replace("\n", " ")[:120]
     logger.info(f"📨 [Telethon] Mensagem RELEVANTE recebida | chat_id={chat_id} | msg_id={message_id} | preview={preview!r}")
 
-    # O resto da lógica para evitar duplicidade e processar o sinal continua a mesma...
-    if message_id in PROCESSED_MESSAGE_IDS:
-        logger.info(f"⏭️ [Telethon] Mensagem {message_id} já processada. Ignorando.")
+    # Duplicidade por (chat, mensagem, conteúdo): edição que muda o texto é versão nova
+    if seen_recently(chat_id, message_id, text):
+        logger.info(f"⏭️ [Telethon] Mensagem {chat_id}/{message_id} já processada. Ignorando.")
         return
 
-    from services.signal_parser import parse_signal
-    parsed = parse_signal(text)
+    # Trace de latência: nasce aqui, com o horário de envio da mensagem.
+    # Único parse do sinal: o resultado segue no envelope pela fila.
+    message_date = getattr(getattr(event, "message", None), "date", None)
+    trace = start_trace(f"telegram:{chat_id}", message_id, message_date)
+    token = activate(trace)
+    try:
+        with span("parse"):
+            parsed = parse_signal(text)
+    finally:
+        deactivate(token)
 
     if parsed:
         logger.info(
@@ -124,13 +161,18 @@ async def signal_listener(event):
             f"type={parsed.get('type')} coin={parsed.get('coin')} "
             f"order={parsed.get('order_type')} entries={parsed.get('entries')} sl={parsed.get('stop_loss')}"
         )
-        if message_id is not None:
-            PROCESSED_MESSAGE_IDS.add(message_id)
+        # Registro persistente (sobrevive a reinícios); falso = já processada antes
+        if not await asyncio.to_thread(claim_message, chat_id, message_id, text):
+            logger.info(f"⏭️ [Telethon] Mensagem {chat_id}/{message_id} já processada. Ignorando.")
+            return
 
         await comm_queue.put({
             "action": "process_signal",
-            "signal_text": text,
-            "source_name": f"telegram:{chat_id}"
+            "envelope": SignalEnvelope(
+                signal=parsed, raw_text=text, chat_id=chat_id, topic_id=topic_id,
+                message_id=message_id, message_date=message_date,
+                received_at=trace.started_at, trace=trace,
+            ),
         })
 
 # --- Processador da Fila ---
@@ -205,20 +247,27 @@ async def queue_processor(queue: asyncio.Queue, ptb_app: Application):
                             feedback_msg = f"✅ Canal '{channel_name}' adicionado à lista de monitoramento."
                         
                         db.commit()
+                        reload_monitored_targets()
                         await ptb_app.bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=feedback_msg)
                 finally:
                     db.close()
 
+            elif action == "refresh_targets":
+                reload_monitored_targets()
+
             elif action == "process_signal":
                 logger.info("[Queue Processor] ... Entrou no bloco de 'process_signal'.")
-                signal_text = request.get("signal_text")
-                source_name = request.get("source_name", "Fonte Desconhecida")
-                
-                signal_data = parse_signal(signal_text)
-                if signal_data:
-                    await process_new_signal(signal_data, ptb_app, source_name)
-                else:
-                    logger.info("Mensagem da fila não é um sinal válido.")
+                envelope: SignalEnvelope = request["envelope"]
+                trace = envelope.trace
+                if trace is not None:
+                    trace.add_span("queue", envelope.enqueued_at, time.perf_counter())
+                token = activate(trace)
+                signal_data = envelope.signal  # já interpretado no listener
+                try:
+                    await process_new_signal(signal_data, ptb_app, envelope.source_name)
+                finally:
+                    deactivate(token)
+                    finish_trace(trace, symbol=signal_data.get("coin"), type=str(signal_data.get("type")))
             
             else:
                 logger.warning(f"[Queue Processor] Ação desconhecida ou nula recebida: '{action}'")
@@ -279,6 +328,7 @@ async def start_signal_monitor(queue: asyncio.Queue):
         await asyncio.sleep(30)
 
 
+    reload_monitored_targets()
     logger.info("✅ Monitor de sinais e processador de fila ativos.")
     
     asyncio.create_task(queue_processor(queue, ptb_app))
@@ -0,0 +1,79 @@
+"""
+Cache de saldo por usuário.
+
+get_account_info() faz um get_wallet_balance(UNIFIED) completo; dimensionar cada
+ordem, o painel, o assistente de banca e o relatório de desempenho repetiam essa
+ida à corretora. Aqui o resultado fica em memória por TF_WALLET_CACHE_SECONDS e é
+invalidado quando algo muda a margem (ordem aberta, TP/fechamento executado).
+Se um consumidor do tópico privado 'wallet' estiver rodando, update_from_stream()
+mantém o valor sempre fresco.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from services.bybit_service import get_account_info, parse_wallet_account
+
+logger = logging.getLogger(__name__)
+
+try:
+    _TTL_SECONDS = float(os.getenv("TF_WALLET_CACHE_SECONDS", "10") or "10")
+except Exception:
+    _TTL_SECONDS = 10.0
+
+# telegram_id -> (monotonic de quando foi lido, resultado de get_account_info)
+_WALLETS: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+_INFLIGHT: Dict[int, "asyncio.Future"] = {}
+_STATS: Dict[str, int] = {"hits": 0, "misses": 0, "stream_updates": 0, "invalidations": 0}
+
+
+async def get_cached_account_info(user_id: int, api_key: str, api_secret: str,
+                                  max_age: Optional[float] = None) -> Dict[str, Any]:
+    """get_account_info() com cache por usuário. Só respostas com sucesso são guardadas."""
+    ttl = _TTL_SECONDS if max_age is None else max_age
+    cached = _WALLETS.get(user_id)
+    if cached and ttl > 0 and time.monotonic() - cached[0] <= ttl:
+        _STATS["hits"] += 1
+        return cached[1]
+
+    pending = _INFLIGHT.get(user_id)
+    if pending is not None:
+        _STATS["hits"] += 1
+        return await pending
+
+    _STATS["misses"] += 1
+    fut = asyncio.get_running_loop().create_future()
+    _INFLIGHT[user_id] = fut
+    result: Dict[str, Any] = {"success": False, "data": {}, "error": "falha ao consultar saldo"}
+    try:
+        result = await get_account_info(api_key, api_secret)
+        if result.get("success"):
+            _WALLETS[user_id] = (time.monotonic(), result)
+    finally:
+        _INFLIGHT.pop(user_id, None)
+        fut.set_result(result)
+    return result
+
+
+def update_from_stream(user_id: int, account_data: Dict[str, Any]) -> None:
+    """Aplica uma mensagem do tópico privado 'wallet' (item com accountType UNIFIED)."""
+    if (account_data.get("accountType") or "UNIFIED").upper() != "UNIFIED":
+        return
+    _WALLETS[user_id] = (time.monotonic(), {"success": True, "data": parse_wallet_account(account_data)})
+    _STATS["stream_updates"] += 1
+
+
+def invalidate_wallet(user_id: int) -> None:
+    """Descarta o saldo em cache (ordem aberta, TP ou fechamento executado)."""
+    if _WALLETS.pop(user_id, None) is not None:
+        _STATS["invalidations"] += 1
+
+
+def wallet_cache_stats(reset: bool = False) -> Dict[str, int]:
+    snapshot = dict(_STATS, size=len(_WALLETS))
+    if reset:
+        for k in _STATS:
+            _STATS[k] = 0
+    return snapshot
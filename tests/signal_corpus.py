@@ -0,0 +1,169 @@
+"""
+Corpus sintético para o parser de sinais (services/signal_parser.py).
+
+Usado pelos testes de desempenho e por scripts/bench_signal_parser.py. Traz
+sinais no formato real dos canais (Limite/Mercado, sinônimos de moeda,
+confiança, emojis), cancelamentos, ruído de chat, mensagens longas e cheias de
+emoji, e casos adversariais montados para expor backtracking catastrófico.
+"""
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+# Limite de texto de uma mensagem no Telegram
+TELEGRAM_MAX_CHARS = 4096
+
+CorpusItem = Tuple[str, str, Optional[Dict[str, Any]]]  # (categoria, texto, esperado)
+
+_COINS = ["BTC", "ETH", "SOL", "AVAX", "NMR", "CYBER", "1000PEPE", "DOGE", "LINK", "ARB"]
+_EMOJIS = "🚀🔥💎📊📈📉💰🛑🎯🟢🔴⚠️✅❌⏳🏁☯️🧭📢🌐"
+
+_NOISE = [
+    "Bom dia, pessoal! Mercado lateral hoje, cuidado com alavancagem.",
+    "BTC rompendo resistência, atenção ao volume 👀",
+    "🎯 Alvo 1 atingido em SOL (+5.2%)",
+    "📊 Status: Sinal aberto",
+    "Resultado da semana: 18 alvos, 3 stops. Parabéns a todos! 🚀🚀",
+    "Entrem no grupo VIP: https://t.me/exemplo",
+    "Stop movido para o preço de entrada em ETH.",
+    "Alguém sabe se a Bybit está com instabilidade?",
+    "Tipo de conta recomendado: Unified.",
+    "Moeda do dia: LINK. Análise completa amanhã.",
+]
+
+
+def _fmt(value: float, rng: random.Random) -> str:
+    text = f"{value:.8f}" if rng.random() < 0.5 else repr(value)
+    return text.replace(".", ",") if rng.random() < 0.1 else text
+
+
+def make_signal(rng: random.Random, emoji_heavy: bool = False) -> Tuple[str, Dict[str, Any]]:
+    """Sinal de entrada completo e o dicionário que o parser deve devolver."""
+    coin = rng.choice(_COINS)
+    side = rng.choice(["LONG", "SHORT"])
+    market = rng.random() < 0.4
+    base = round(rng.uniform(0.5, 500.0), 4)
+    if market:
+        ranged = rng.random() < 0.5  # faixa idêntica "x - x" ou preço único
+        entries = [base, base] if ranged else [base]
+        entry_txt = f"{_fmt(base, rng)} - {_fmt(base, rng)}" if ranged else _fmt(base, rng)
+        header = rng.choice(["🏁 #{n} - Ordem à Mercado", "🏁 #{n} - Ordem a Mercado"])
+    else:
+        high = round(base * 1.03, 4)
+        entries = [base, high]
+        entry_txt = f"{_fmt(base, rng)} - {_fmt(high, rng)}"
+        header = "⏳ #{n} - Ordem Limite"
+    step = base * 0.02
+    sl = round(base - 3 * step if side == "LONG" else base + 3 * step, 4)
+    targets = [round(base + (i + 1) * step if side == "LONG" else base - (i + 1) * step, 4)
+               for i in range(rng.randint(1, 6))]
+    confidence = round(rng.uniform(40, 95), 2) if rng.random() < 0.6 else None
+
+    label = rng.choice(["Moeda", "Coin", "Pair"])
+    deco = (lambda s: f"{rng.choice(_EMOJIS)} {s}") if emoji_heavy or rng.random() < 0.7 else (lambda s: s)
+    lines = [
+        header.format(n=rng.randint(1, 99999)),
+        "",
+        deco(f"Canal: GRE - {rng.randint(1, 99)}"),
+        deco(f"{label}: {coin}"),
+        deco(f"Tipo: {side} (Futures)"),
+        deco(f"Alavancagem: {rng.choice([5, 10, 20])}x"),
+        "",
+        deco(f"Zona de Entrada: {entry_txt}"),
+        deco(f"Stop Loss: {_fmt(sl, rng)} ({rng.uniform(1, 15):.4f}%)"),
+        deco("Alvos:"),
+    ]
+    lines += [f"T{i + 1}: {_fmt(t, rng)} ({rng.uniform(1, 20):.2f}%)" for i, t in enumerate(targets)]
+    lines.append(deco("Status: Sinal aberto"))
+    if confidence is not None:
+        lines.append(deco(f"Confiança: {confidence}%  🧭 Consenso: {rng.randint(1, 6)}/6"))
+    if emoji_heavy:
+        lines = [line + " " + "".join(rng.choice(_EMOJIS) for _ in range(rng.randint(5, 30))) for line in lines]
+
+    expected = {
+        "type": "MARKET" if market else "LIMIT",
+        "coin": f"{coin}USDT",
+        "order_type": side,
+        "entries": entries,
+        "stop_loss": sl,
+        "targets": targets,
+        "confidence": confidence,
+    }
+    return "\n".join(lines), expected
+
+
+def make_cancel(rng: random.Random) -> Tuple[str, Dict[str, Any]]:
+    coin = rng.choice(_COINS)
+    text = f"⚠️ {coin} {rng.choice(['', '#123 ', '(Futures) '])}sinal {rng.choice(['cancelado', 'cancelada'])}"
+    return text, {"type": "CANCELAR", "coin": f"{coin}USDT"}
+
+
+def make_long(rng: random.Random) -> str:
+    """Ruído próximo do limite do Telegram (mistura de frases e emojis)."""
+    parts: List[str] = []
+    while sum(len(p) + 1 for p in parts) < TELEGRAM_MAX_CHARS - 200:
+        parts.append(rng.choice(_NOISE) if rng.random() < 0.7 else "".join(rng.choice(_EMOJIS) for _ in range(40)))
+    return "\n".join(parts)
+
+
+def build_corpus(seed: int = 0, signals: int = 200, cancels: int = 50, noise: int = 600,
+                 long_messages: int = 20, emoji_signals: int = 30) -> List[CorpusItem]:
+    """Corpus determinístico; a proporção padrão imita um canal (maioria ruído)."""
+    rng = random.Random(seed)
+    items: List[CorpusItem] = []
+    for _ in range(signals):
+        text, expected = make_signal(rng)
+        items.append(("signal", text, expected))
+    for _ in range(emoji_signals):
+        text, expected = make_signal(rng, emoji_heavy=True)
+        items.append(("emoji", text, expected))
+    for _ in range(cancels):
+        text, expected = make_cancel(rng)
+        items.append(("cancel", text, expected))
+    for _ in range(noise):
+        items.append(("noise", rng.choice(_NOISE), None))
+    for _ in range(long_messages):
+        items.append(("long", make_long(rng), None))
+    rng.shuffle(items)
+    return items
+
+
+def adversarial_cases(size: int = 20_000) -> List[Tuple[str, str]]:
+    """
+    Entradas que maximizam o backtracking dos padrões do parser (quantificadores
+    adjacentes sobre o mesmo alfabeto, rótulos sem valor, milhares de âncoras).
+    Um padrão linear processa cada uma em poucos milissegundos.
+    """
+    labels = "Moeda: X Tipo: Y Stop Loss: Z "
+    return [
+        ("cancel_alnum_run", "⚠️ " + "A" * size + " sinal cancelad"),
+        ("cancel_many_marks", "⚠️ A " * (size // 5) + "sinal cancelad"),
+        ("cancel_marks_no_tail", ("⚠️ BTC sinal " * (size // 13))),
+        ("newlines", labels + "\n" * size),
+        ("whitespace_after_labels", labels + "Stop Loss:" + " " * size),
+        ("ordem_spaces", labels + "Ordem" + " " * size + "a" + " " * size),
+        ("stop_spaces", labels + "Stop" + " " * size + "Loss"),
+        ("confidence_digits", labels + "Confiança: " + "1" * size),
+        ("empty_targets", labels + "\n" + "T1:\n" * (size // 4)),
+        ("targets_spaces", labels + "\n" + ("T" + "1" * 50 + " " * 50) * (size // 101)),
+        ("entry_numbers", labels + "Zona de Entrada: " + "1.1-" * (size // 4)),
+        ("repeated_labels", (labels + "Zona de ") * (size // 38)),
+        ("emoji_only", "".join(_EMOJIS[i % len(_EMOJIS)] for i in range(size))),
+    ]
+
+
+def random_token_messages(seed: int = 0, count: int = 200, size: int = TELEGRAM_MAX_CHARS) -> List[str]:
+    """Fuzz: mensagens longas montadas de pedaços relevantes para as regex."""
+    rng = random.Random(seed)
+    tokens = ["⚠️", " ", "\n", "\t", "BTC", "sinal", "cancelado", "Moeda", "Coin", "Tipo", "Stop", "Loss",
+              ":", "Zona de Entrada", "T1", "T", "1", "2.5", ",", "-", "%", "Confiança", "Ordem", "à",
+              "Mercado", "Limite", "🚀", "💎", "LONG", "SHORT"]
+    out = []
+    for _ in range(count):
+        parts: List[str] = []
+        length = 0
+        while length < size:
+            tok = rng.choice(tokens) * (rng.randint(1, 200) if rng.random() < 0.05 else 1)
+            parts.append(tok)
+            length += len(tok)
+        out.append("".join(parts)[:size])
+    return out
@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+import core.breaker_counters as bc
+
+
+def _t(tid, side="LONG", symbol="BTCUSDT", pnl=-0.01, status="ACTIVE", user=1):
+    return SimpleNamespace(id=tid, user_telegram_id=user, side=side, symbol=symbol,
+                           unrealized_pnl_pct=pnl, status=status)
+
+
+class FakeDB:
+    def __init__(self, rows): self.rows = rows; self.queries = 0
+    def query(self, *a): self.queries += 1; return self
+    def filter(self, *a): return self
+    def all(self): return self.rows
+
+
+def test_contadores_por_escopo_e_mudanca_de_sinal():
+    bc.reset()
+    db = FakeDB([(1, 1, "LONG", "BTCUSDT")])
+    assert bc.losing_count(db, 1, "SIDE", side="LONG") == 1  # semeado do banco
+    trades = [_t(1), _t(2, side="SHORT", symbol="ETHUSDT"), _t(3, symbol="ETHUSDT", pnl=0.02)]
+    bc.sync_user_trades(1, trades)
+    assert bc.losing_count(db, 1, "GLOBAL") == 2
+    assert bc.losing_count(db, 1, "SYMBOL", symbol="ETHUSDT") == 1
+    assert bc.losing_count(db, 1, "SIDE", side="SHORT") == 1
+
+    trades[2].unrealized_pnl_pct = -0.03  # virou prejuízo
+    bc.observe_trade(trades[2])
+    assert bc.losing_count(db, 1, "SYMBOL", symbol="ETHUSDT") == 2
+    trades[0].unrealized_pnl_pct = 0.01  # voltou ao lucro
+    bc.observe_trade(trades[0])
+    assert bc.losing_count(db, 1, "SIDE", side="LONG") == 1
+
+    bc.forget_trade(2)
+    bc.sync_user_trades(1, [trades[2]])  # trade 1 saiu da lista ativa
+    assert bc.losing_count(db, 1, "GLOBAL") == 1
+    assert bc.losing_count(db, 2, "GLOBAL") == 0
+    assert db.queries == 1
@@ -0,0 +1,117 @@
+import asyncio
+import types
+
+import core.position_tracker as pt
+
+
+class FakeDispatcher:
+    """Guarda as chamadas; o teste decide quando cada uma é 'entregue'."""
+    def __init__(self):
+        self.calls = []
+
+    def send(self, chat_id, text, *, on_sent=None, on_error=None, **kw):
+        self.calls.append(["send", None, text, on_sent, on_error])
+
+    def edit(self, chat_id, message_id, text, *, on_sent=None, on_error=None, **kw):
+        self.calls.append(["edit", message_id, text, on_sent, on_error])
+
+    def deliver(self, i, result=True):
+        self.calls[i][3](result)
+
+
+def _setup(monkeypatch, min_edit=30.0):
+    d = FakeDispatcher()
+    monkeypatch.setattr(pt, "get_dispatcher", lambda app: d)
+    monkeypatch.setattr(pt, "set_message_id", lambda *a: None)
+    monkeypatch.setattr(pt, "_CARD_MIN_EDIT_SECONDS", min_edit)
+    pt._CARD_CACHE.clear()
+    trade = types.SimpleNamespace(id=1, symbol="BTCUSDT", side="LONG", notification_message_id=50)
+    user = types.SimpleNamespace(telegram_id=111)
+    return d, trade, user
+
+
+def _card(trade, user, text, throttle=False):
+    return pt._send_or_edit_trade_message(None, user, trade, None, text, throttle=throttle)
+
+
+def test_hash_so_e_gravado_na_entrega(monkeypatch):
+    d, trade, user = _setup(monkeypatch)
+
+    async def _go():
+        await _card(trade, user, "A")
+        assert pt._CARD_CACHE[1].get("hash") is None
+        await _card(trade, user, "A")  # já na fila: não duplica
+        assert len(d.calls) == 1
+        d.deliver(0)
+        assert pt._CARD_CACHE[1]["hash"] == pt._card_hash("A")
+    asyncio.run(_go())
+
+
+def test_edicao_adiada_sai_no_fim_do_intervalo(monkeypatch):
+    d, trade, user = _setup(monkeypatch, min_edit=0.05)
+
+    async def _go():
+        await _card(trade, user, "A")
+        await _card(trade, user, "B", throttle=True)
+        await _card(trade, user, "C", throttle=True)
+        assert [c[2] for c in d.calls] == ["A"]
+        await asyncio.sleep(0.1)
+        assert [c[2] for c in d.calls] == ["A", "C"]  # só o mais recente
+    asyncio.run(_go())
+
+
+def test_titulo_nao_espera_intervalo_e_cancela_pendente(monkeypatch):
+    d, trade, user = _setup(monkeypatch, min_edit=0.05)
+
+    async def _go():
+        await _card(trade, user, "A")
+        await _card(trade, user, "B", throttle=True)
+        await _card(trade, user, "TP1", throttle=False)
+        await asyncio.sleep(0.1)
+        assert [c[2] for c in d.calls] == ["A", "TP1"]
+    asyncio.run(_go())
+
+
+def test_atualizacoes_durante_envio_novo_nao_se_perdem(monkeypatch):
+    d, trade, user = _setup(monkeypatch)
+    trade.notification_message_id = None
+
+    async def _go():
+        await _card(trade, user, "A")
+        await _card(trade, user, "TP1")
+        await _card(trade, user, "TP2")
+        assert [c[0] for c in d.calls] == ["send"]
+        d.deliver(0, types.SimpleNamespace(message_id=77))
+        assert d.calls[1][:3] == ["edit", 77, "TP2"]
+    asyncio.run(_go())
+
+
+def test_falha_na_edicao_recria_o_card(monkeypatch):
+    d, trade, user = _setup(monkeypatch)
+
+    async def _go():
+        await _card(trade, user, "A")
+        d.calls[0][4](Exception("message to edit not found"))
+        assert d.calls[1][:3] == ["send", None, "A"]
+        await _card(trade, user, "B")  # enquanto o novo card não sai
+        d.deliver(1, types.SimpleNamespace(message_id=78))
+        assert d.calls[2][:3] == ["edit", 78, "B"]
+    asyncio.run(_go())
+
+
+def test_card_de_entrada_no_merge_segura_atualizacoes_do_rastreador(monkeypatch):
+    d, trade, user = _setup(monkeypatch)
+
+    async def _go():
+        await _card(trade, user, "A")
+        d.deliver(0)
+        # Merge (trade_manager): card de entrada novo no lugar do antigo
+        trade.notification_message_id = None
+        await _card(trade, user, "Entrada")
+        assert d.calls[1][:3] == ["send", None, "Entrada"]
+        await _card(trade, user, "B", throttle=True)  # rastreador antes do on_sent
+        assert len(d.calls) == 2
+        d.deliver(1, types.SimpleNamespace(message_id=79))
+        trade.notification_message_id = 79
+        assert d.calls[2][:3] == ["edit", 79, "B"]
+    asyncio.run(_go())
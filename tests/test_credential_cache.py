@@ -0,0 +1,44 @@
+import types
+
+from utils import security
+from utils.security import (
+    credential_cache_stats,
+    encrypt_data,
+    get_user_credentials,
+    invalidate_user_credentials,
+)
+
+
+def _user(tid, key, secret):
+    return types.SimpleNamespace(
+        telegram_id=tid, api_key_encrypted=encrypt_data(key), api_secret_encrypted=encrypt_data(secret)
+    )
+
+
+def test_segunda_leitura_nao_descriptografa(monkeypatch):
+    calls = []
+    real = security.decrypt_data
+    monkeypatch.setattr(security, "decrypt_data", lambda d: calls.append(d) or real(d))
+    invalidate_user_credentials(501)
+    credential_cache_stats(reset=True)
+
+    user = _user(501, "KEY", "SECRET")
+    assert get_user_credentials(user) == ("KEY", "SECRET")
+    assert get_user_credentials(user) == ("KEY", "SECRET")
+    assert len(calls) == 2
+    stats = credential_cache_stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2
+
+
+def test_troca_de_chave_muda_o_hash_e_invalidacao_zera(monkeypatch):
+    invalidate_user_credentials(502)
+    old = _user(502, "OLD", "OLDSECRET")
+    get_user_credentials(old)
+    cached = [v for k, v in security._CRED_CACHE.items() if k[0] == 502]
+
+    new = _user(502, "NEW", "NEWSECRET")
+    assert get_user_credentials(new) == ("NEW", "NEWSECRET")
+
+    monkeypatch.setattr(security, "_CRED_ZEROIZE", True)
+    assert invalidate_user_credentials(502) == 4
+    assert all(not any(v) for v in cached)
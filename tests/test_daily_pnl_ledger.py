@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytz
+
+import core.daily_pnl_ledger as ledger
+
+
+class FakeDB:
+    def __init__(self, rows): self.rows = rows; self.queries = 0
+    def query(self, *a): self.queries += 1; return self
+    def filter(self, *a): return self
+    def all(self): return self.rows
+
+
+def _t(tid, side="LONG", entry=100.0, closed_pnl=None, closed_at=None, user=1):
+    return SimpleNamespace(id=tid, user_telegram_id=user, side=side, symbol="BTCUSDT",
+                           entry_price=entry, closed_pnl=closed_pnl, closed_at=closed_at,
+                           partial_pnl=None, partial_pnl_day=None)
+
+
+def _row(tid, status="ACTIVE", closed_pnl=None, closed_at=None, partial=None, partial_day=None):
+    return (tid, status, closed_pnl, closed_at, partial, partial_day)
+
+
+def test_semeia_do_banco_e_soma_parciais_e_fechamentos():
+    ledger.reset()
+    now = datetime.now(pytz.utc)
+    db = FakeDB([_row(10, "CLOSED_PROFIT", 5.0, now), _row(11, "CLOSED_LOSS", -2.0, now)])
+    assert ledger.daily_realized_pnl(db, 1) == 3.0
+
+    t = _t(12, side="SHORT", entry=100.0)
+    ledger.record_partial_close(db, t, 90.0, 0.5)  # +5 estimado
+    assert ledger.daily_realized_pnl(db, 1) == 8.0
+
+    # Fechamento confirmado substitui as estimativas do trade
+    t.closed_pnl, t.closed_at = 4.5, datetime.now(pytz.utc)
+    ledger.record_trade_close(db, t)
+    ledger.record_trade_close(db, t)  # idempotente
+    assert ledger.daily_realized_pnl(db, 1) == 7.5
+    assert db.queries == 1
+
+
+def test_ignora_fechamento_de_outro_dia_e_vira_o_dia(monkeypatch):
+    ledger.reset()
+    db = FakeDB([])
+    old = _t(20, closed_pnl=-50.0, closed_at=datetime.now(pytz.utc) - timedelta(days=2))
+    ledger.record_trade_close(db, old)
+    assert ledger.daily_realized_pnl(db, 1) == 0.0
+
+    ledger.record_partial_close(db, _t(21), 110.0, 1.0)
+    assert ledger.daily_realized_pnl(db, 1) == 10.0
+    tomorrow = ledger._today() + timedelta(days=1)
+    monkeypatch.setattr(ledger, "_today", lambda: tomorrow)
+    assert ledger.daily_realized_pnl(db, 1) == 0.0  # novo dia: ressemeado do banco (vazio)
+
+
+def test_parciais_persistidas_semeiam_apos_reiniciar():
+    ledger.reset()
+    db = FakeDB([])
+    t = _t(30)
+    ledger.record_partial_close(db, t, 110.0, 1.0)
+    ledger.record_partial_close(db, t, 120.0, 0.5)
+    assert (t.partial_pnl, t.partial_pnl_day) == (20.0, ledger._today())
+
+    # Reinício: aberto com parciais, manual (closed_pnl só do restante) e ghost (zerado)
+    ledger.reset()
+    now, today = datetime.now(pytz.utc), ledger._today()
+    db = FakeDB([
+        _row(30, partial=20.0, partial_day=today),
+        _row(31, "CLOSED_MANUAL", 3.0, now, partial=8.0, partial_day=today),
+        _row(32, "CLOSED_GHOST", 0.0, now, partial=-4.0, partial_day=today),
+        _row(33, "CLOSED_PROFIT", 6.0, now, partial=2.0, partial_day=today),  # confirmado cobre tudo
+        _row(34, "ACTIVE", partial=9.0, partial_day=today - timedelta(days=1)),  # parcial de ontem
+    ])
+    assert ledger.daily_realized_pnl(db, 1) == 20.0 + 8.0 - 4.0 + 6.0
@@ -0,0 +1,44 @@
+import types
+from decimal import Decimal
+
+from core.exit_plan import advance_exit_plan, build_exit_plan, pending_tps, tp_number
+
+
+def test_plano_arredonda_no_step_e_ultimo_tp_leva_o_restante():
+    plan = build_exit_plan("50,30,20", 10.0, 10.0, [1.1, 1.2, 1.3], qty_step=Decimal("0.4"))
+    qtys = [row[1] for row in plan["tp"]]
+    assert qtys[0] == 4.8 and qtys[1] == 2.8
+    assert abs(sum(qtys) - 10.0) < 1e-9
+    assert [row[2] for row in plan["tp"]] == [1.1, 1.2, 1.3]
+
+
+def test_plano_legado_respeita_tps_ja_executados():
+    # 3 TPs no sinal, o 1º já saiu: distribuição EQUAL sobre a qty original
+    plan = build_exit_plan("EQUAL", 9.0, 6.0, [1.2, 1.3], offset=1, total_targets=3)
+    assert [row[1] for row in plan["tp"]] == [3.0, 3.0]
+    assert tp_number(plan, 0) == 2
+
+
+def test_avanco_por_indice_sincroniza_alvos_restantes():
+    trade = types.SimpleNamespace(initial_targets=[1.1, 1.2, 1.3], exit_plan=None)
+    trade.exit_plan = build_exit_plan("EQUAL", 3.0, 3.0, trade.initial_targets)
+    advance_exit_plan(trade, [0])
+    assert trade.exit_plan["i"] == 1
+    assert trade.initial_targets == [1.2, 1.3]
+    assert [k for k, *_ in pending_tps(trade.exit_plan)] == [1, 2]
+
+
+def test_tp_inferior_que_falhou_continua_pendente():
+    # Mesmo ciclo: close do TP1 falhou, TP2 executou → só o TP2 sai do plano
+    trade = types.SimpleNamespace(initial_targets=[1.1, 1.2, 1.3], exit_plan=None)
+    trade.exit_plan = build_exit_plan("EQUAL", 3.0, 3.0, trade.initial_targets)
+    advance_exit_plan(trade, [1])
+    assert (trade.exit_plan["i"], trade.exit_plan["x"]) == (0, [1])
+    assert [k for k, *_ in pending_tps(trade.exit_plan)] == [0, 2]
+    assert trade.initial_targets == [1.1, 1.3]
+
+    # TP1 executa depois: o índice avança sobre o prefixo contíguo
+    advance_exit_plan(trade, [0])
+    assert (trade.exit_plan["i"], trade.exit_plan["x"]) == (2, [])
+    assert [k for k, *_ in pending_tps(trade.exit_plan)] == [2]
+    assert trade.initial_targets == [1.3]
@@ -0,0 +1,81 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+
+import core.indicator_service as ind
+from core import indicators
+
+
+def _user(**kw):
+    base = dict(is_ma_filter_enabled=True, ma_timeframe="60", ma_period=50,
+                is_rsi_filter_enabled=True, rsi_timeframe="60", reversal_override_enabled=False)
+    base.update(kw)
+    return SimpleNamespace(**base)
+
+
+def test_conjunto_distinto_de_indicadores():
+    users = [_user() for _ in range(50)] + [_user(ma_period=20, rsi_timeframe="240")]
+    assert ind.required_indicators(users) == {
+        ("60", "SMA", 50), ("60", "RSI", 14), ("60", "SMA", 20), ("240", "RSI", 14),
+    }
+
+
+def test_klines_e_indicadores_calculados_uma_vez(monkeypatch):
+    fetches = []
+
+    async def fake_klines(symbol, interval, limit=200):
+        fetches.append(interval)
+        await asyncio.sleep(0.01)
+        rows = [[str(1000 * i), "1", "1", "1", str(100 + i), "1", "1"] for i in range(60)]
+        return {"success": True, "data": list(reversed(rows))}
+
+    computed = []
+
+    def fake_compute(self, kl, tf, kind, period):
+        computed.append((kind, period))
+        return {"close": float(kl.close[-1]), "value": float(period)}
+
+    monkeypatch.setattr(ind, "get_historical_klines", fake_klines)
+    monkeypatch.setattr(ind.IndicatorSnapshot, "_compute", fake_compute)
+    ind._KLINE_CACHE.clear()
+
+    async def _run():
+        snap = ind.IndicatorSnapshot("BTCUSDT")
+        await snap.prefetch(ind.required_indicators([_user() for _ in range(20)]))
+        token = ind.activate_snapshot(snap)
+        try:
+            results = await asyncio.gather(*(ind.snapshot_for("BTCUSDT").get("60", "SMA", 50) for _ in range(20)))
+        finally:
+            ind.reset_snapshot(token)
+        return results
+
+    results = asyncio.run(_run())
+    assert fetches == ["60"]
+    assert sorted(computed) == [("RSI", 14), ("SMA", 50)]
+    assert all(r == {"close": 159.0, "value": 50.0} for r in results)
+
+
+def test_estado_incremental_aplica_so_candles_novos():
+    def rows(first, n=60):
+        return [[str(60000 * i), str(100 + i % 7), str(101 + i % 7), str(99 + i % 7), str(100 + i % 7), "1", "1"]
+                for i in range(first, first + n)]
+
+    ind._STATES.clear()
+    ind.indicator_stats(reset=True)
+    a = ind._advance("XUSDT", "1", "RSI", 14, ind.Klines(rows(0)))
+    b = ind._advance("XUSDT", "1", "RSI", 14, ind.Klines(rows(1)))  # um candle novo
+    stats = ind.indicator_stats()
+    assert stats["candles_applied"] == 59 + 1
+
+    # Incremental == recálculo completo sobre todo o histórico visto (candles 0..60)
+    closes = np.array([100 + i % 7 for i in range(61)], dtype=float)
+    assert abs(a - indicators.rsi(closes[:60], 14)[-1]) < 1e-6
+    assert abs(b - indicators.rsi(closes, 14)[-1]) < 1e-6
+
+    # Do zero só com a janela nova (candles 1..60): o RMA (adjust=True) semeia de
+    # outro ponto, então o valor difere do incremental — é o recálculo dessa janela
+    ind._STATES.clear()
+    fresh = ind._advance("XUSDT", "1", "RSI", 14, ind.Klines(rows(1)))
+    assert abs(fresh - indicators.rsi(closes[1:], 14)[-1]) < 1e-6
+    assert abs(b - fresh) > 1e-6
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from core import indicators as ind
+
+# Referências em pandas com a mesma definição do pandas_ta (parâmetros padrão)
+
+
+def _ref_rma(s: pd.Series, n: int) -> pd.Series:
+    return s.ewm(alpha=1.0 / n, min_periods=n).mean()
+
+
+def _ref_rsi(close: pd.Series, n: int = 14) -> pd.Series:
+    diff = close.diff()
+    up, down = diff.clip(lower=0), (-diff).clip(lower=0)
+    up[diff.isna()] = np.nan
+    down[diff.isna()] = np.nan
+    g, l = _ref_rma(up, n), _ref_rma(down, n)
+    return 100 * g / (g + l)
+
+
+def _ref_ema(close: pd.Series, n: int) -> pd.Series:
+    c = close.copy()
+    seed = c.iloc[:n].mean()
+    c.iloc[:n - 1] = np.nan
+    c.iloc[n - 1] = seed
+    return c.ewm(span=n, adjust=False).mean()
+
+
+def _ref_atr(high, low, close, n=14):
+    prev = close.shift(1)
+    tr = pd.concat([high - low, (high - prev).abs(), (prev - low).abs()], axis=1).max(axis=1)
+    tr.iloc[0] = np.nan
+    return _ref_rma(tr, n)
+
+
+def _series(n=300, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, n))
+    high = close + rng.uniform(0, 1, n)
+    low = close - rng.uniform(0, 1, n)
+    return high, low, close
+
+
+def test_lote_bate_com_referencia():
+    high, low, close = _series()
+    c = pd.Series(close)
+    np.testing.assert_allclose(ind.sma(close, 50), c.rolling(50).mean(), rtol=1e-9, equal_nan=True)
+    np.testing.assert_allclose(ind.ema(close, 21), _ref_ema(c, 21), rtol=1e-9, equal_nan=True)
+    np.testing.assert_allclose(ind.rsi(close, 14), _ref_rsi(c, 14), rtol=1e-9, equal_nan=True)
+    np.testing.assert_allclose(ind.atr(high, low, close, 14),
+                               _ref_atr(pd.Series(high), pd.Series(low), c, 14), rtol=1e-9, equal_nan=True)
+
+
+def test_incremental_peek_nao_altera_estado():
+    high, low, close = _series(120)
+    for kind, length, batch in (("SMA", 20, ind.sma(close, 20)), ("EMA", 9, ind.ema(close, 9)),
+                                ("RSI", 14, ind.rsi(close, 14)), ("ATR", 14, ind.atr(high, low, close, 14))):
+        state = ind.new_state(kind, length)
+        for i in range(len(close) - 1):
+            state.update(close[i], high[i], low[i])
+        peeked = state.peek(close[-1], high[-1], low[-1])
+        assert abs(peeked - batch[-1]) < 1e-9
+        assert state.peek(close[-1], high[-1], low[-1]) == peeked
+        assert abs(state.update(close[-1], high[-1], low[-1]) - batch[-1]) < 1e-9
@@ -0,0 +1,155 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+
+import core.message_cleanup as mc
+from core.message_cleanup import compute_delete_at
+from database.models import AlertMessage, MessageDeletion, Trade, User
+
+# Testes de integração com Postgres (ON CONFLICT de verdade, SKIP LOCKED) só rodam
+# com TF_TEST_DATABASE_URL apontando para um banco descartável
+_PG_URL = os.getenv("TF_TEST_DATABASE_URL")
+_TABLES = [User.__table__, Trade.__table__, AlertMessage.__table__, MessageDeletion.__table__]
+
+
+def test_off_nao_agenda():
+    assert compute_delete_at("OFF", 30, datetime(2025, 1, 1, tzinfo=pytz.utc)) is None
+    assert compute_delete_at(None, None, datetime(2025, 1, 1, tzinfo=pytz.utc)) is None
+
+
+def test_after_soma_o_atraso():
+    ref = datetime(2025, 1, 1, 12, 0, tzinfo=pytz.utc)
+    assert compute_delete_at("AFTER", 45, ref) == datetime(2025, 1, 1, 12, 45, tzinfo=pytz.utc)
+
+
+def test_after_trata_naive_como_utc():
+    ref = datetime(2025, 1, 1, 12, 0)
+    assert compute_delete_at("after", 10, ref) == datetime(2025, 1, 1, 12, 10, tzinfo=pytz.utc)
+
+
+def test_eod_usa_meia_noite_de_sao_paulo():
+    # 23:30 em SP (02:30 UTC do dia seguinte) -> remove à 00:00 SP = 03:00 UTC
+    ref = datetime(2025, 3, 11, 2, 30, tzinfo=pytz.utc)
+    assert compute_delete_at("EOD", 30, ref) == datetime(2025, 3, 11, 3, 0, tzinfo=pytz.utc)
+    # 10:00 SP -> meia-noite seguinte
+    ref = datetime(2025, 3, 11, 13, 0, tzinfo=pytz.utc)
+    assert compute_delete_at("EOD", 30, ref) == datetime(2025, 3, 12, 3, 0, tzinfo=pytz.utc)
+
+
+class FakeDispatcher:
+    def __init__(self): self.deleted = []
+    def delete(self, chat_id, message_id, **kw): self.deleted.append((chat_id, message_id))
+    def pending(self): return 0
+
+
+def _session(monkeypatch, url="sqlite://"):
+    engine = create_engine(url)
+    for table in _TABLES:
+        table.create(engine, checkfirst=True)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(mc, "SessionLocal", Session)
+    dispatcher = FakeDispatcher()
+    monkeypatch.setattr(mc, "get_dispatcher", lambda app: dispatcher)
+    return engine, Session, dispatcher
+
+
+def _trade(i, user=1, status="CLOSED_PROFIT", msg=None, closed_at=None):
+    return Trade(id=i, user_telegram_id=user, order_id=f"o{i}", symbol="BTCUSDT", side="LONG", qty=1.0,
+                 status=status, notification_message_id=msg, closed_at=closed_at)
+
+
+def test_agendamento_e_upsert_on_conflict():
+    executed = []
+
+    class FakeDB:
+        def execute(self, stmt): executed.append(stmt)
+
+    at = datetime(2025, 1, 1, tzinfo=pytz.utc)
+    mc.schedule_message_deletion(FakeDB(), 111, 222, at, kind="trade", trade_id=5)
+    compiled = executed[0].compile(dialect=postgresql.dialect())
+    sql = str(compiled)
+    assert sql.startswith("INSERT INTO message_deletions (chat_id, message_id, delete_at, kind, trade_id)")
+    assert "ON CONFLICT ON CONSTRAINT _deletion_chat_message_uc DO UPDATE SET " \
+           "delete_at = %(param_1)s, kind = %(param_2)s, trade_id = %(param_3)s" in sql
+    assert compiled.params["param_1"] == at and compiled.params["param_2"] == "trade" and compiled.params["param_3"] == 5
+
+
+def test_backfill_agenda_legado_uma_vez(monkeypatch):
+    engine, Session, _ = _session(monkeypatch)
+    scheduled = []
+    monkeypatch.setattr(mc, "schedule_message_deletion",
+                        lambda db, chat, msg, at, kind="alert", trade_id=None: scheduled.append((chat, msg, kind, trade_id)))
+    closed_at = datetime(2025, 1, 1, 12, tzinfo=pytz.utc)
+    db = Session()
+    db.add_all([
+        User(telegram_id=1, msg_cleanup_mode="AFTER", alert_cleanup_mode="EOD"),
+        User(telegram_id=2),  # OFF/OFF: fora do backfill
+        AlertMessage(user_telegram_id=1, message_id=10, created_at=closed_at),
+        AlertMessage(user_telegram_id=2, message_id=20, created_at=closed_at),
+        _trade(1, msg=100, closed_at=closed_at),
+        _trade(2, msg=101, closed_at=closed_at),  # já agendado
+        _trade(3, status="ACTIVE", msg=102),
+        _trade(4, user=2, msg=103, closed_at=closed_at),
+        MessageDeletion(chat_id=1, message_id=101, delete_at=closed_at, kind="trade", trade_id=2),
+    ])
+    db.commit()
+
+    assert mc._backfill_legacy(db) == 2
+    assert sorted(scheduled) == [(1, 10, "alert", None), (1, 100, "trade", 1)]
+    assert [a.user_telegram_id for a in db.query(AlertMessage).all()] == [2]  # alerta migrado sai da tabela
+    db.close()
+
+
+def test_lote_vencido_e_limitado_e_limpa_o_card(monkeypatch):
+    engine, Session, dispatcher = _session(monkeypatch)
+    now = datetime.now(pytz.utc)
+    db = Session()
+    db.add_all([_trade(1, msg=100), _trade(2, msg=101)])
+    db.add_all([
+        MessageDeletion(chat_id=1, message_id=100, delete_at=now - timedelta(minutes=3), kind="trade", trade_id=1),
+        MessageDeletion(chat_id=1, message_id=50, delete_at=now - timedelta(minutes=2), kind="alert"),
+        MessageDeletion(chat_id=1, message_id=51, delete_at=now - timedelta(minutes=1), kind="alert"),
+        MessageDeletion(chat_id=1, message_id=101, delete_at=now + timedelta(hours=1), kind="trade", trade_id=2),
+    ])
+    db.commit(); db.close()
+
+    assert mc._pop_due_batch(None, 2) == 2  # os 2 mais antigos
+    assert dispatcher.deleted == [(1, 100), (1, 50)]
+    assert mc._pop_due_batch(None, 2) == 1
+    assert mc._pop_due_batch(None, 2) == 0  # o futuro fica
+
+    db = Session()
+    assert [r.message_id for r in db.query(MessageDeletion).all()] == [101]
+    assert {t.id: t.notification_message_id for t in db.query(Trade).all()} == {1: None, 2: 101}
+    db.close()
+
+
+@pytest.mark.skipif(not _PG_URL, reason="TF_TEST_DATABASE_URL não definido (Postgres)")
+def test_postgres_upsert_reagenda_e_skip_locked(monkeypatch):
+    engine, Session, dispatcher = _session(monkeypatch, _PG_URL)
+    try:
+        now = datetime.now(pytz.utc)
+        db = Session()
+        mc.schedule_message_deletion(db, 1, 10, now + timedelta(hours=1))
+        mc.schedule_message_deletion(db, 1, 10, now - timedelta(minutes=1))  # reagenda a mesma mensagem
+        for msg in (11, 12):
+            mc.schedule_message_deletion(db, 1, msg, now - timedelta(minutes=1))
+        db.commit()
+        assert db.query(MessageDeletion).filter(MessageDeletion.message_id == 10).count() == 1
+
+        # Outro worker segurando a linha 10: o lote pula ela em vez de esperar
+        holder = Session()
+        holder.query(MessageDeletion).filter(MessageDeletion.message_id == 10).with_for_update().one()
+        assert mc._pop_due_batch(None, 10) == 2
+        assert sorted(m for _, m in dispatcher.deleted) == [11, 12]
+        holder.rollback(); holder.close()
+        assert mc._pop_due_batch(None, 10) == 1
+        db.close()
+    finally:
+        for table in reversed(_TABLES):
+            table.drop(engine, checkfirst=True)
@@ -1,6 +1,8 @@
 import asyncio
 import types
 
+import core.position_tracker as pt
+
 class FakeBot:
     def __init__(self): self.edits = []
     async def edit_message_text(self, chat_id, message_id, text, parse_mode=None):
@@ -11,51 +13,67 @@ class FakeApp:
 
 class T:
     # Mock minimal de Trade
-    def __init__(self, symbol, side, missing_cycles=0, notification_message_id=123):
+    def __init__(self, symbol, side, missing_cycles=0, notification_message_id=123, id=1):
+        self.id = id
         self.symbol = symbol; self.side = side
         self.status = "ACTIVE"; self.closed_pnl = None
         self.remaining_qty = 1.0; self.notification_message_id = notification_message_id
         self.missing_cycles = missing_cycles
         self.last_seen_at = None
 
-async def _run(policy, bybit_keys, trades, threshold=3):
+def _patch(monkeypatch):
+    enqueued, notified = [], []
+    monkeypatch.setattr(pt, "enqueue_close_confirmation", lambda uid, tid: enqueued.append((uid, tid)) or True)
+
+    async def _notify(application, user, trade):
+        notified.append(trade.symbol)
+    monkeypatch.setattr(pt, "notify_sync_status", _notify)
+    return enqueued, notified
+
+def _run(bybit_keys, trades, threshold=3):
     app = FakeApp()
     user = types.SimpleNamespace(telegram_id=111)
     db = object()
-    await policy(app, user, db, trades, bybit_keys, threshold)
+    asyncio.run(pt.apply_missing_cycles_policy(app, user, db, trades, bybit_keys, threshold))
     return app.bot.edits
 
-def test_nao_fecha_em_1_ou_2_ciclos(event_loop=None):
-    from main import apply_missing_cycles_policy  # ajuste o import conforme onde você adicionou a função
-
+def test_nao_fecha_em_1_ou_2_ciclos(monkeypatch):
+    enqueued, notified = _patch(monkeypatch)
     trades = [T("TIAUSDT", "LONG")]
     # 1º ciclo ausente
-    edits = asyncio.get_event_loop().run_until_complete(_run(apply_missing_cycles_policy, set(), trades))
+    _run(set(), trades)
     assert trades[0].missing_cycles == 1
     assert trades[0].status == "ACTIVE"
-    assert edits == []
+    assert notified == []
 
-    # 2º ciclo ausente
-    edits = asyncio.get_event_loop().run_until_complete(_run(apply_missing_cycles_policy, set(), trades))
+    # 2º ciclo ausente: só avisa que está sincronizando
+    _run(set(), trades)
     assert trades[0].missing_cycles == 2
     assert trades[0].status == "ACTIVE"
-    assert edits == []
+    assert notified == ["TIAUSDT"]
+    assert enqueued == []
 
-def test_fecha_no_3o_ciclo(event_loop=None):
-    from main import apply_missing_cycles_policy
-
-    trades = [T("TIAUSDT", "LONG", missing_cycles=2)]
-    edits = asyncio.get_event_loop().run_until_complete(_run(apply_missing_cycles_policy, set(), trades))
+def test_3o_ciclo_enfileira_confirmacao_sem_fechar_no_ciclo(monkeypatch):
+    enqueued, _ = _patch(monkeypatch)
+    trades = [T("TIAUSDT", "LONG", missing_cycles=2, id=42)]
+    edits = _run(set(), trades)
     assert trades[0].missing_cycles == 3
-    assert trades[0].status == "CLOSED_GHOST"
-    assert trades[0].remaining_qty == 0.0
-    assert len(edits) == 1  # mensagem de remoção enviada
-
-def test_reset_quando_volta_a_aparecer(event_loop=None):
-    from main import apply_missing_cycles_policy
+    # O fechamento (PnL ou CLOSED_GHOST) é decidido pela fila de confirmação
+    assert trades[0].status == "ACTIVE"
+    assert enqueued == [(111, 42)]
+    assert edits == []
 
+def test_reset_quando_volta_a_aparecer(monkeypatch):
+    enqueued, _ = _patch(monkeypatch)
     trades = [T("TIAUSDT", "LONG", missing_cycles=2)]
-    edits = asyncio.get_event_loop().run_until_complete(_run(apply_missing_cycles_policy, {("TIAUSDT","LONG")}, trades))
+    _run({("TIAUSDT", "LONG")}, trades)
     assert trades[0].missing_cycles == 0
     assert trades[0].status == "ACTIVE"
-    assert len(edits) == 0
\ No newline at end of file
+    assert enqueued == []
+
+def test_enqueue_ignora_trade_ja_em_andamento():
+    from core import close_confirmation as cc
+    cc._INFLIGHT.discard(9001)
+    assert cc.enqueue_close_confirmation(111, 9001) is True
+    assert cc.enqueue_close_confirmation(111, 9001) is False
+    cc._INFLIGHT.discard(9001)
@@ -0,0 +1,154 @@
+import asyncio
+import types
+from decimal import Decimal
+
+from pybit.exceptions import InvalidRequestError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import core.position_tracker as pt
+import services.bybit_service as bs
+from database.models import PendingSignal, Trade
+
+
+class FakeSession:
+    def __init__(self, last_price=100.0, set_error=None, positions=None):
+        self.last_price = last_price
+        self.set_error = set_error
+        self.positions = positions or []
+        self.payloads = []
+
+    def get_tickers(self, category, symbol):
+        return {"result": {"list": [{"lastPrice": str(self.last_price)}]}}
+
+    def set_trading_stop(self, **payload):
+        self.payloads.append(payload)
+        if self.set_error:
+            raise self.set_error
+        return {"retCode": 0, "result": {}}
+
+    def get_positions(self, **kw):
+        return {"retCode": 0, "result": {"list": self.positions}}
+
+
+def _api_error(message):
+    return InvalidRequestError(request="set_trading_stop", message=message, status_code=34040,
+                               time="0", resp_headers={})
+
+
+def _patch_exchange(monkeypatch, session):
+    async def fake_rules(symbol):
+        return {"success": True, "tickSize": Decimal("0.1")}
+    monkeypatch.setattr(bs, "get_instrument_info", fake_rules)
+    monkeypatch.setattr(bs, "get_session", lambda k, s: session)
+
+
+def test_trailing_nativo_alinha_ao_tick_e_so_envia_ativacao_futura(monkeypatch):
+    session = FakeSession(last_price=100.0)
+    _patch_exchange(monkeypatch, session)
+
+    res = asyncio.run(bs.set_native_trailing_stop("k", "s", "BTCUSDT", "LONG", 2.37, active_price=102.03, position_idx=1))
+    assert res["success"] and res["distance"] == 2.3 and res["active_price"] == 102.1
+    assert session.payloads[-1] == {"category": "linear", "symbol": "BTCUSDT", "trailingStop": "2.3",
+                                    "tpslMode": "Full", "positionIdx": 1, "activePrice": "102.1"}
+
+    # Mercado já passou da ativação (SHORT abaixo dela): ativa imediatamente; distância mínima = 1 tick
+    res = asyncio.run(bs.set_native_trailing_stop("k", "s", "BTCUSDT", "SHORT", 0.01, active_price=101.0))
+    assert res["success"] and res["active_price"] is None
+    assert session.payloads[-1]["trailingStop"] == "0.1" and "activePrice" not in session.payloads[-1]
+
+
+def test_trailing_nativo_not_modified_conta_como_sucesso(monkeypatch):
+    _patch_exchange(monkeypatch, FakeSession(set_error=_api_error("not modified")))
+    assert asyncio.run(bs.set_native_trailing_stop("k", "s", "BTCUSDT", "LONG", 1.0))["success"]
+
+    _patch_exchange(monkeypatch, FakeSession(set_error=_api_error("invalid position")))
+    assert not asyncio.run(bs.set_native_trailing_stop("k", "s", "BTCUSDT", "LONG", 1.0))["success"]
+
+
+def _trade(**kw):
+    base = dict(id=5, symbol="BTCUSDT", side="LONG", current_stop_loss=100.0, trail_high_water_mark=None)
+    base.update(kw)
+    return types.SimpleNamespace(**base)
+
+
+def _sync(trade, position_data):
+    return asyncio.run(pt._sync_native_trailing("k", "s", trade, position_data, 100.0, 2.0, "[t]", False, None))
+
+
+def test_tf_exchange_trailing_entrega_a_corretora_e_espelha_o_sl(monkeypatch):
+    calls = []
+
+    async def fake_set(api_key, api_secret, symbol, side, distance, active_price=None, position_idx=None):
+        calls.append((side, distance, active_price, position_idx))
+        return {"success": True, "distance": distance, "active_price": active_price}
+
+    monkeypatch.setattr(pt, "set_native_trailing_stop", fake_set)
+    monkeypatch.setattr(pt, "_NATIVE_TRAILING", True)
+    trade = _trade()
+
+    assert _sync(trade, {"position_idx": 1}) == (True, True, "📈 Trailing Stop na Corretora")
+    assert calls == [("LONG", 2.0, 102.0, 1)]
+
+    # Já ativo na corretora: não reenvia; só espelha o SL que ela moveu
+    assert _sync(trade, {"trailing_stop": 2.0, "stop_loss": 104.0}) == (True, True, "📈 Trailing Stop Ajustado")
+    assert len(calls) == 1
+    assert trade.current_stop_loss == 104.0 and trade.trail_high_water_mark == 106.0
+
+    monkeypatch.setattr(pt, "_NATIVE_TRAILING", False)
+    assert _sync(_trade(id=6), {}) == (False, False, None)
+    assert len(calls) == 1
+
+
+def test_falha_no_trailing_nativo_cai_para_o_local_ate_fechar(monkeypatch):
+    calls = []
+
+    async def fake_set(*a, **kw):
+        calls.append(a)
+        return {"success": False, "error": "10001"}
+
+    monkeypatch.setattr(pt, "set_native_trailing_stop", fake_set)
+    monkeypatch.setattr(pt, "_NATIVE_TRAILING", True)
+    pt._NATIVE_TRAIL_FAILED.clear()
+    trade = _trade(id=7)
+
+    assert _sync(trade, {}) == (False, False, None)
+    assert _sync(trade, {}) == (False, False, None)
+    assert len(calls) == 1 and 7 in pt._NATIVE_TRAIL_FAILED
+
+    pt.forget_trade_state(7)  # trade fechou
+    assert 7 not in pt._NATIVE_TRAIL_FAILED
+
+
+def test_posicoes_trazem_o_sl_e_a_adocao_usa_o_sl_da_corretora(monkeypatch):
+    session = FakeSession(positions=[
+        {"symbol": "ETHUSDT", "side": "Sell", "size": "2", "avgPrice": "2000", "markPrice": "1900",
+         "positionIdx": 2, "stopLoss": "2100", "trailingStop": "0"},
+        {"symbol": "SOLUSDT", "side": "Buy", "size": "3", "avgPrice": "150", "markPrice": "151",
+         "positionIdx": 1, "stopLoss": "", "trailingStop": "1.5"},
+    ])
+    _patch_exchange(monkeypatch, session)
+    res = asyncio.run(bs.get_open_positions_with_pnl("k", "s"))
+    by_symbol = {p["symbol"]: p for p in res["data"]}
+    assert by_symbol["ETHUSDT"]["stop_loss"] == 2100.0 and by_symbol["ETHUSDT"]["trailing_stop"] is None
+    assert by_symbol["SOLUSDT"]["stop_loss"] is None and by_symbol["SOLUSDT"]["trailing_stop"] == 1.5
+
+    engine = create_engine("sqlite://")
+    Trade.__table__.create(engine)
+    PendingSignal.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    user = types.SimpleNamespace(telegram_id=1)
+    db.add(PendingSignal(user_telegram_id=1, symbol="ETHUSDT", order_id="p1",
+                         signal_data={"targets": [1800, 1700], "stop_loss": 2200}))
+    db.add(PendingSignal(user_telegram_id=1, symbol="SOLUSDT", order_id="p2",
+                         signal_data={"targets": [160], "stop_loss": 140}))
+    db.commit()
+
+    eth = pt._adopt_position(db, user, "ETHUSDT", by_symbol["ETHUSDT"])
+    sol = pt._adopt_position(db, user, "SOLUSDT", by_symbol["SOLUSDT"])
+    db.commit()
+    assert (eth.side, eth.status, eth.qty, eth.entry_price) == ("SHORT", "ACTIVE_SYNCED", 2.0, 2000.0)
+    assert eth.stop_loss == eth.current_stop_loss == 2100.0  # SL da corretora vence o do sinal
+    assert eth.initial_targets == [1800, 1700] and eth.total_initial_targets == 2
+    assert sol.current_stop_loss == 140  # sem SL na corretora: usa o do sinal
+    assert db.query(PendingSignal).count() == 0
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytz
+
+from core.routing_index import RoutingIndex
+from core.whitelist_service import compile_whitelist, is_coin_in_whitelist
+
+NOON_UTC = datetime(2025, 1, 10, 15, 0, tzinfo=pytz.utc)  # 12:00 em São Paulo
+
+
+def _user(uid, **kw):
+    base = dict(
+        telegram_id=uid, api_key_encrypted="k", is_active=True, is_sleep_mode_enabled=False,
+        coin_whitelist="todas", long_trades_paused_until=None, short_trades_paused_until=None,
+        circuit_breaker_scope="SIDE", reversal_override_enabled=False,
+    )
+    base.update(kw)
+    return SimpleNamespace(**base)
+
+
+class FakeDB:
+    def __init__(self, users): self.users = users; self.queries = 0
+    def query(self, *a): self.queries += 1; return self
+    def filter(self, *a, **k): return self
+    def all(self): return list(self.users)
+
+
+def test_compile_whitelist_mesma_semantica():
+    wl = compile_whitelist("memecoins, SOLUSDT")
+    for sym in ("DOGEUSDT", "SOLUSDT", "BTCUSDT"):
+        assert (sym in wl) == is_coin_in_whitelist(sym, "memecoins, SOLUSDT")
+    assert compile_whitelist("todas") is None
+
+
+def test_candidatos_respeitam_whitelist_pausa_e_ativo():
+    until = NOON_UTC + timedelta(minutes=30)
+    db = FakeDB([
+        _user(1),
+        _user(2, coin_whitelist="ETHUSDT"),
+        _user(3, is_active=False),
+        _user(4, long_trades_paused_until=until),
+        _user(5, long_trades_paused_until=until, reversal_override_enabled=True),
+        _user(6, api_key_encrypted=None),
+    ])
+    idx = RoutingIndex(ttl_seconds=3600)
+    assert sorted(idx.candidates(db, "BTCUSDT", "LONG", NOON_UTC)) == [1, 5]
+    assert sorted(idx.candidates(db, "ETHUSDT", "SHORT", NOON_UTC)) == [1, 2, 4, 5]
+    assert idx.stats["rebuilds"] == 1
+
+
+def test_modo_dormir_e_invalidacao():
+    user = _user(1, is_sleep_mode_enabled=True)
+    db = FakeDB([user])
+    idx = RoutingIndex(ttl_seconds=3600)
+    night = datetime(2025, 1, 10, 5, 0, tzinfo=pytz.utc)  # 02:00 em São Paulo
+    assert idx.candidates(db, "BTCUSDT", "LONG", night) == []
+    assert idx.candidates(db, "BTCUSDT", "LONG", NOON_UTC) == [1]
+
+    user.coin_whitelist = "ETHUSDT"
+    assert idx.candidates(db, "BTCUSDT", "LONG", NOON_UTC) == [1]  # ainda não invalidado
+    idx.mark_dirty([1])
+    assert idx.candidates(db, "BTCUSDT", "LONG", NOON_UTC) == []
+    assert idx.stats == {"rebuilds": 1, "refreshed": 1, "lookups": 4}
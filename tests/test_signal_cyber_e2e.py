@@ -28,6 +28,21 @@ sys.modules.setdefault("telegram", telegram)
 sys.modules.setdefault("telegram.ext", telegram_ext)
 sys.modules.setdefault("telegram.constants", telegram_constants)
 
+# telegram.error stub (usado pelo despachante de saída)
+telegram_error = types.ModuleType("telegram.error")
+class TelegramError(Exception): pass
+class NetworkError(TelegramError): pass
+class BadRequest(NetworkError): pass
+class TimedOut(NetworkError): pass
+class RetryAfter(TelegramError):
+    def __init__(self, retry_after):
+        super().__init__(f"Flood control exceeded. Retry in {retry_after} seconds")
+        self.retry_after = retry_after
+for _cls in (TelegramError, NetworkError, BadRequest, TimedOut, RetryAfter):
+    setattr(telegram_error, _cls.__name__, _cls)
+telegram.error = telegram_error
+sys.modules.setdefault("telegram.error", telegram_error)
+
 bot_pkg = types.ModuleType("bot")
 bot_keyboards = types.ModuleType("bot.keyboards")
 def signal_approval_keyboard(signal_id: int):
@@ -137,7 +152,7 @@ async def test_cyber_limit_short_positions_limit_order(monkeypatch):
     monkeypatch.setattr(tm, "place_order", fake_place_order)  # não deve ser chamado
     monkeypatch.setattr(tm, "place_limit_order", fake_place_limit_order)
     monkeypatch.setattr(tm, "get_account_info", fake_get_account_info)
-    monkeypatch.setattr(tm, "decrypt_data", fake_decrypt)
+    monkeypatch.setattr(tm, "get_user_credentials", lambda u: (fake_decrypt(u.api_key_encrypted), fake_decrypt(u.api_secret_encrypted)))
     monkeypatch.setattr(tm, "PendingSignal", DummyPending)
 
     await tm.execute_signal_for_all_users(parsed, app, db, source_name="TEST-CHANNEL")
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytz
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import services.signal_dedupe as dedupe
+from database.models import ProcessedSignalMessage
+
+
+def _use_sqlite(monkeypatch):
+    engine = create_engine("sqlite://")
+    ProcessedSignalMessage.__table__.create(engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(dedupe, "SessionLocal", Session)
+    dedupe.reset()
+    return Session
+
+
+def test_chave_por_chat_mensagem_e_conteudo(monkeypatch):
+    _use_sqlite(monkeypatch)
+    assert dedupe.claim_message(-100, 7, "BTC LONG") is True
+    assert dedupe.seen_recently(-100, 7, "BTC LONG")
+    assert dedupe.claim_message(-100, 7, "BTC LONG ") is False  # mesma versão
+    assert dedupe.claim_message(-200, 7, "BTC LONG") is True   # outro canal, mesmo id
+    assert dedupe.claim_message(-100, 7, "BTC SHORT") is True  # edição mudou o texto
+    assert dedupe.claim_message(None, 7, "BTC LONG") is True   # sem chat: não deduplica
+
+
+def test_sobrevive_a_reinicio_e_expira(monkeypatch):
+    Session = _use_sqlite(monkeypatch)
+    assert dedupe.claim_message(-100, 8, "ETH") is True
+    dedupe.reset()  # memória perdida, banco continua
+    assert not dedupe.seen_recently(-100, 8, "ETH")
+    assert dedupe.claim_message(-100, 8, "ETH") is False
+
+    db = Session()
+    db.query(ProcessedSignalMessage).update(
+        {"processed_at": datetime.now(pytz.utc) - timedelta(seconds=dedupe._TTL_SECONDS + 60)})
+    db.commit(); db.close()
+    assert dedupe.purge_expired() == 1
+    dedupe.reset()
+    assert dedupe.claim_message(-100, 8, "ETH") is True
+
+
+def test_erro_de_banco_segue_com_a_memoria(monkeypatch):
+    from sqlalchemy.exc import OperationalError
+
+    class BrokenSession:
+        def add(self, obj): pass
+        def commit(self): raise OperationalError("INSERT", {}, Exception("conexão recusada"))
+        def rollback(self): pass
+        def close(self): pass
+
+    monkeypatch.setattr(dedupe, "SessionLocal", BrokenSession)
+    dedupe.reset()
+    assert dedupe.claim_message(-100, 9, "SOL") is True  # fail-open
+    assert dedupe.seen_recently(-100, 9, "SOL")
+    assert dedupe.claim_message(-100, 9, "SOL") is False  # repetição barrada pela memória
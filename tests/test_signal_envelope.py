@@ -0,0 +1,14 @@
+from datetime import datetime, timedelta
+
+import pytz
+
+from services.signal_envelope import SignalEnvelope
+
+
+def test_envelope_origem():
+    sent = datetime.now(pytz.utc) - timedelta(seconds=2)
+    env = SignalEnvelope(signal={"coin": "BTCUSDT"}, raw_text="BTC LONG", chat_id=-1001, topic_id=5,
+                         message_id=42, message_date=sent)
+    assert env.source_name == "telegram:-1001"
+    assert (env.topic_id, env.message_id, env.message_date) == (5, 42, sent)
+    assert env.received_at > sent.timestamp() and env.trace is None
@@ -0,0 +1,124 @@
+import asyncio
+
+import core.trade_manager as tm
+
+
+class FakeQuery:
+    def filter(self, *a, **k): return self
+    def first(self): return type("U", (), {"api_key_encrypted": "x"})()
+
+
+class FakeSession:
+    def __init__(self): self.committed = False
+    def query(self, *a): return FakeQuery()
+    def commit(self): self.committed = True
+    def rollback(self): pass
+    def close(self): pass
+
+
+def test_fanout_roda_usuarios_em_paralelo_com_limite(monkeypatch):
+    running, peak, calls = 0, 0, 0
+
+    async def fake_route(signal_data, signal_type, symbol, user, application, db, source_name):
+        nonlocal running, peak, calls
+        calls += 1
+        call = calls
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        if call == 3:
+            raise RuntimeError("boom")
+        return "executed_market"
+
+    monkeypatch.setattr(tm, "SessionLocal", FakeSession)
+    monkeypatch.setattr(tm, "_route_signal_to_user", fake_route)
+
+    async def _run():
+        sem = asyncio.Semaphore(2)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        results = await asyncio.gather(*(
+            tm._fanout_user(uid, {}, None, "BTCUSDT", None, "src", sem, 0.0) for uid in range(1, 5)
+        ))
+        return results, loop.time() - started
+
+    results, elapsed = asyncio.run(_run())
+    assert peak == 2
+    assert elapsed < 0.18  # 4 usuários, 2 por vez → ~2 rodadas de 50ms
+    report = tm._log_fanout_report("BTCUSDT", results, elapsed)
+    assert report["outcomes"] == {"executed_market": 3, "error": 1}
+
+
+def test_prewarm_busca_em_paralelo(monkeypatch):
+    calls = []
+
+    def slow(name):
+        async def _f(*a, **k):
+            calls.append(name)
+            await asyncio.sleep(0.05)
+            return {"success": True}
+        return _f
+
+    class FakeSnapshot:
+        prefetch = staticmethod(slow("klines"))
+
+    monkeypatch.setattr(tm, "get_instrument_info", slow("instrument"))
+    monkeypatch.setattr(tm, "get_market_price", slow("price"))
+
+    timings = asyncio.run(tm._prewarm_symbol("BTCUSDT", tm.SignalType.MARKET, FakeSnapshot(), {("60", "SMA", 50)}))
+    assert sorted(calls) == ["instrument", "klines", "price"]
+    assert set(timings) == {"instrument", "price", "indicators"}
+
+    calls.clear()
+    asyncio.run(tm._prewarm_symbol("BTCUSDT", tm.SignalType.LIMIT, FakeSnapshot(), set()))
+    assert calls == ["instrument"]
+
+
+def test_limite_do_fanout_respeita_o_pool():
+    assert tm._fanout_limit(16, 5, 10) == 4  # pool padrão: 15 - 6 reservadas, 2 por tarefa
+    assert tm._fanout_limit(2, 5, 10) == 2
+    assert tm._fanout_limit(16, 2, 0) == 1
+
+
+def test_fanout_com_mais_usuarios_que_conexoes_no_pool(monkeypatch, tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import QueuePool
+    from database.models import User
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}", poolclass=QueuePool, pool_size=3, max_overflow=0,
+        pool_timeout=5, connect_args={"check_same_thread": False},
+    )
+    User.__table__.create(engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    db.add_all([User(telegram_id=uid, api_key_encrypted="x") for uid in range(1, 11)])
+    db.commit()
+    db.close()
+
+    async def fake_route(signal_data, signal_type, symbol, user, application, db, source_name):
+        db.query(User).count()  # consulta síncrona no loop, como o código real
+        await asyncio.sleep(0.02)
+        return "executed_market"
+
+    monkeypatch.setattr(tm, "SessionLocal", Session)
+    monkeypatch.setattr(tm, "_route_signal_to_user", fake_route)
+
+    async def _run(limit):
+        outer = Session()
+        outer.connection()  # sessão externa do process_new_signal segura 1 das 3 conexões
+        try:
+            sem = asyncio.Semaphore(limit)
+            return await asyncio.gather(*(
+                tm._fanout_user(uid, {}, None, "BTCUSDT", None, "src", sem, 0.0) for uid in range(1, 11)
+            ))
+        finally:
+            outer.close()
+
+    # Limite acima das conexões livres: as tarefas excedentes esperam o pool numa thread,
+    # o loop segue rodando quem já tem conexão e ninguém cai no pool_timeout.
+    for limit in (2, 6):
+        results = asyncio.run(_run(limit))
+        assert [r["outcome"] for r in results] == ["executed_market"] * 10
@@ -123,3 +123,27 @@ def test_parse_cancel_signal():
     assert data is not None
     assert data["type"] == SignalType.CANCELAR
     assert data["coin"] == "BTCUSDT"
+
+
+def test_parse_ignores_chatter_and_keeps_first_occurrence():
+    assert parse_signal("Bom dia! BTC rompendo resistência, atenção ao stop.") is None
+    assert parse_signal("Moeda: SOL\nStop Loss: 186") is None  # sem rótulo Tipo
+
+    message = textwrap.dedent(
+        """
+        Moeda: ETH
+        Tipo: 123
+        Zona de Entrada: 3000
+        Stop Loss: 2900
+        T1: 3100
+        Moeda: BTC
+        T2: 3200
+        """
+    )
+
+    data = parse_signal(message)
+
+    assert data["coin"] == "ETHUSDT"
+    assert data["order_type"] == "LONG"
+    assert data["type"] == SignalType.MARKET
+    assert data["targets"] == [3100.0, 3200.0]
@@ -0,0 +1,32 @@
+import time
+
+import pytest
+
+from services.signal_parser import parse_signal
+from tests.signal_corpus import adversarial_cases, build_corpus, random_token_messages
+
+# Folga larga para máquinas lentas/CI: um padrão linear fica em poucos ms nesses
+# tamanhos; backtracking quadrático passa de segundos.
+MAX_SECONDS = 0.25
+
+
+def _timed(text):
+    started = time.perf_counter()
+    result = parse_signal(text)
+    return result, time.perf_counter() - started
+
+
+def test_corpus_outputs():
+    for category, text, expected in build_corpus(seed=7, noise=100, long_messages=5):
+        assert parse_signal(text) == expected, (category, text)
+
+
+@pytest.mark.parametrize("name,text", adversarial_cases(size=20_000), ids=lambda v: v if len(v) < 40 else None)
+def test_adversarial_inputs_stay_linear(name, text):
+    _, elapsed = _timed(text)
+    assert elapsed < MAX_SECONDS, f"{name}: {elapsed:.3f}s"
+
+
+def test_fuzz_long_messages_worst_case():
+    worst = max(_timed(text)[1] for text in random_token_messages(seed=11, count=100, size=16_000))
+    assert worst < MAX_SECONDS, f"pior caso {worst:.3f}s"
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import pytz
+
+import core.symbol_breaker as sb
+
+
+def test_cache_read_through_expira_e_invalida(monkeypatch):
+    now = datetime.now(pytz.utc)
+    db_rows = {7: {"BTCUSDT": now + timedelta(minutes=5), "ETHUSDT": now + timedelta(seconds=1)}}
+    loads = []
+
+    def fake_load(user_id, at):
+        loads.append(user_id)
+        return {s: u for s, u in db_rows.get(user_id, {}).items() if u > at}
+
+    monkeypatch.setattr(sb, "_load_user", fake_load)
+    monkeypatch.setattr(sb, "_CACHE_USERS", 2)
+    sb._CACHE.clear()
+
+    assert sb.is_symbol_paused(7, "BTCUSDT")
+    assert not sb.is_symbol_paused(7, "SOLUSDT")
+    assert loads == [7]  # segunda leitura veio do cache
+
+    # Expiração por timestamp também limpa a entrada em memória
+    sb._cached_user(7, now + timedelta(seconds=2))
+    assert "ETHUSDT" not in sb._CACHE[7]
+
+    # LRU limitado
+    sb.is_symbol_paused(8, "BTCUSDT")
+    sb.is_symbol_paused(9, "BTCUSDT")
+    assert list(sb._CACHE) == [8, 9]
+
+    # NOTIFY de outro processo -> descarta e relê do banco
+    db_rows[8] = {"XRPUSDT": now + timedelta(minutes=1)}
+    sb.invalidate_user(8)
+    assert sb.is_symbol_paused(8, "XRPUSDT")
+    assert loads == [7, 8, 9, 8]
+
+
+def test_listener_usa_add_reader_e_reconecta(monkeypatch):
+    import asyncio
+    import socket
+    import types
+
+    class FakeConn:
+        """Socket no lugar do fd do psycopg2; poll() lê os NOTIFY 'chegados'."""
+        def __init__(self):
+            self.sock, self.peer = socket.socketpair()
+            self.sock.setblocking(False)
+            self.notifies = []
+            self.executed = []
+            self.closed = False
+
+        def fileno(self):
+            return self.sock.fileno()
+
+        def cursor(self):
+            conn = self
+
+            class _Cur:
+                def __enter__(self): return self
+                def __exit__(self, *a): return False
+                def execute(self, sql): conn.executed.append(sql)
+            return _Cur()
+
+        def poll(self):
+            data = self.sock.recv(1024)
+            if not data:
+                raise OSError("conexão encerrada")
+            self.notifies += [types.SimpleNamespace(payload=p) for p in data.decode().split()]
+
+        def close(self):
+            self.closed = True
+            self.sock.close()
+
+    conns = []
+
+    def fake_connect():
+        conns.append(FakeConn())
+        return conns[-1]
+
+    real_sleep = asyncio.sleep
+    monkeypatch.setattr(sb, "_connect_listener", fake_connect)
+    monkeypatch.setattr(sb.asyncio, "sleep", lambda s: real_sleep(0))
+    invalidated = []
+    monkeypatch.setattr(sb, "invalidate_user", invalidated.append)
+
+    async def _go():
+        task = asyncio.create_task(sb._listen_forever())
+        while not conns or not conns[0].executed:
+            await real_sleep(0.01)
+        conns[0].peer.send(b"7 8")
+        while len(invalidated) < 2:
+            await real_sleep(0.01)
+        conns[0].peer.close()  # conexão caiu → reconecta com outra
+        while len(conns) < 2 or not conns[1].executed:
+            await real_sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(asyncio.wait_for(_go(), 5))
+    assert invalidated == [7, 8]
+    assert conns[0].executed == [f"LISTEN {sb.CHANNEL};"]
+    assert conns[0].closed and conns[1].closed
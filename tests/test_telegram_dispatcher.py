@@ -0,0 +1,108 @@
+import asyncio
+import types
+
+from telegram.error import BadRequest, RetryAfter
+
+from services.telegram_dispatcher import TelegramDispatcher
+
+
+class FakeBot:
+    def __init__(self, fail_first_with=None):
+        self.calls = []
+        self._fail = fail_first_with
+
+    async def send_message(self, chat_id, text, **kw):
+        if self._fail is not None:
+            exc, self._fail = self._fail, None
+            raise exc
+        self.calls.append(("send", chat_id, text))
+        return types.SimpleNamespace(message_id=1000 + len(self.calls))
+
+    async def edit_message_text(self, chat_id, message_id, text, **kw):
+        self.calls.append(("edit", chat_id, message_id, text))
+        return True
+
+    async def delete_message(self, chat_id, message_id):
+        self.calls.append(("delete", chat_id, message_id))
+        return True
+
+
+async def _drain(d: TelegramDispatcher, timeout: float = 3.0):
+    waited = 0.0
+    while d.pending() and waited < timeout:
+        await asyncio.sleep(0.01)
+        waited += 0.01
+    await asyncio.sleep(0.02)
+
+
+def test_edicoes_da_mesma_mensagem_sao_coalescidas():
+    async def _run():
+        bot = FakeBot()
+        d = TelegramDispatcher(bot, global_rate=100, per_chat_rate=100, per_chat_burst=1)
+        for i in range(5):
+            d.edit(1, 55, f"v{i}")
+        await _drain(d)
+        return bot.calls, d.stats
+
+    calls, stats = asyncio.run(_run())
+    assert calls == [("edit", 1, 55, "v4")]
+    assert stats["coalesced"] == 4
+
+
+def test_on_sent_recebe_message_id_e_respeita_ordem_por_chat():
+    async def _run():
+        bot = FakeBot()
+        d = TelegramDispatcher(bot, global_rate=100, per_chat_rate=100, per_chat_burst=5)
+        got = []
+        d.send(1, "a", on_sent=lambda m: got.append(m.message_id))
+        d.send(2, "b")
+        d.send(1, "c")
+        await _drain(d)
+        return bot.calls, got
+
+    calls, got = asyncio.run(_run())
+    assert [c[2] for c in calls if c[1] == 1] == ["a", "c"]
+    assert got == [1001]
+
+
+def test_limite_por_chat_espaca_envios():
+    async def _run():
+        bot = FakeBot()
+        d = TelegramDispatcher(bot, global_rate=100, per_chat_rate=20, per_chat_burst=1)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for i in range(4):
+            d.send(7, str(i))
+        await _drain(d)
+        return loop.time() - start, len(bot.calls)
+
+    elapsed, n = asyncio.run(_run())
+    assert n == 4
+    assert elapsed >= 0.14  # 3 intervalos de 1/20s após o primeiro token
+
+
+def test_retry_after_reenfileira_e_entrega():
+    async def _run():
+        bot = FakeBot(fail_first_with=RetryAfter(0))
+        d = TelegramDispatcher(bot, global_rate=100, per_chat_rate=100, per_chat_burst=5)
+        d.send(3, "x")
+        await _drain(d)
+        return bot.calls, d.stats
+
+    calls, stats = asyncio.run(_run())
+    assert calls == [("send", 3, "x")]
+    assert stats["retry_after"] == 1
+
+
+def test_bad_request_vai_para_on_error_sem_repetir():
+    async def _run():
+        bot = FakeBot(fail_first_with=BadRequest("chat not found"))
+        d = TelegramDispatcher(bot, global_rate=100, per_chat_rate=100, per_chat_burst=5)
+        errors = []
+        d.send(3, "x", on_error=errors.append)
+        await _drain(d)
+        return bot.calls, errors
+
+    calls, errors = asyncio.run(_run())
+    assert calls == []
+    assert len(errors) == 1
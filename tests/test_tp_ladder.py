@@ -0,0 +1,62 @@
+import asyncio
+import types
+from decimal import Decimal
+
+import core.tp_ladder as tpl
+import services.bybit_service as bs
+
+
+def test_reconcilia_perna_executada_e_cancelada(monkeypatch):
+    statuses = {
+        "a": {"orderStatus": "Filled", "cumExecQty": "5"},
+        "b": {"orderStatus": "Cancelled", "cumExecQty": "1"},
+    }
+
+    async def fake_status(api_key, api_secret, order_id, symbol):
+        return {"success": True, "data": statuses[order_id]}
+
+    monkeypatch.setattr(tpl, "get_order_status", fake_status)
+    trade = types.SimpleNamespace(symbol="BTCUSDT", tp_orders=[
+        {"i": 0, "target": 1.1, "qty": 5.0, "id": "a", "status": "open"},
+        {"i": 1, "target": 1.2, "qty": 3.0, "id": "b", "status": "open"},
+        {"i": 2, "target": 1.3, "qty": 2.0, "id": "c", "status": "open"},
+    ])
+
+    events = asyncio.run(tpl.reconcile_tp_orders(trade, "k", "s", open_order_ids={"c"}))
+    assert [(e["i"], e["status"], e["qty"]) for e in events] == [(0, "filled", 5.0), (1, "cancelled", 1.0)]
+    assert tpl.covered_indices(trade) == {2}
+
+
+class FakeSession:
+    def __init__(self):
+        self.payloads = []
+
+    def place_order(self, **payload):
+        self.payloads.append(payload)
+        return {"retCode": 0, "result": {"orderId": f"o{len(self.payloads)}"}}
+
+
+def test_perna_abaixo_do_minimo_fica_coberta_pela_seguinte(monkeypatch):
+    async def fake_rules(symbol):
+        return {"success": True, "tickSize": Decimal("0.1"), "qtyStep": Decimal("0.1"), "minOrderQty": Decimal("1")}
+
+    session = FakeSession()
+    monkeypatch.setattr(bs, "get_instrument_info", fake_rules)
+    monkeypatch.setattr(bs, "get_session", lambda k, s: session)
+    monkeypatch.setattr(bs, "_resolve_position_index", lambda *a: {"mode": "oneway"})
+
+    legs = [{"i": 0, "target": 1.1, "qty": 0.5}, {"i": 1, "target": 1.2, "qty": 0.6}, {"i": 2, "target": 1.3, "qty": 2.0}]
+    res = asyncio.run(bs.place_tp_ladder("k", "s", "BTCUSDT", "LONG", legs))
+    assert [(o["i"], o["qty"], o["covers"]) for o in res["orders"]] == [(1, 1.1, [0, 1]), (2, 2.0, [2])]
+
+    trade = types.SimpleNamespace(symbol="BTCUSDT", tp_orders=res["orders"])
+    # O alvo 0 está na ordem do alvo 1: o acompanhamento por preço não pode fechá-lo de novo
+    assert tpl.covered_indices(trade) == {0, 1, 2}
+
+    async def fake_status(api_key, api_secret, order_id, symbol):
+        return {"success": True, "data": {"orderStatus": "Filled", "cumExecQty": "1.1"}}
+
+    monkeypatch.setattr(tpl, "get_order_status", fake_status)
+    events = asyncio.run(tpl.reconcile_tp_orders(trade, "k", "s", open_order_ids={"o2"}))
+    assert [(e["i"], e["qty"], e["covers"]) for e in events] == [(1, 1.1, [0, 1])]
+    assert tpl.covered_indices(trade) == {2}
@@ -0,0 +1,46 @@
+import asyncio
+import json
+import time
+
+import utils.tracing as tr
+
+
+def test_spans_atravessam_fanout_e_threads(tmp_path, monkeypatch):
+    out = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tr, "_TRACE_FILE", str(out))
+    tr._RECENT.clear()
+
+    def sync_exchange_call():
+        with tr.span("place_order"):
+            time.sleep(0.01)
+
+    async def per_user(uid):
+        with tr.span("filters", user=uid):
+            await asyncio.sleep(0.01)
+        await asyncio.to_thread(sync_exchange_call)
+
+    async def _run():
+        trace = tr.start_trace("telegram:1", 10)
+        token = tr.activate(trace)
+        try:
+            with tr.span("fanout", users=3):
+                await asyncio.gather(*(per_user(u) for u in (1, 2, 3)))
+        finally:
+            tr.deactivate(token)
+        return tr.finish_trace(trace, symbol="BTCUSDT")
+
+    record = asyncio.run(_run())
+    names = sorted(s["name"] for s in record["spans"])
+    assert names == ["fanout"] + ["filters"] * 3 + ["place_order"] * 3
+    assert {s["user"] for s in record["spans"] if s["name"] == "filters"} == {1, 2, 3}
+    assert json.loads(out.read_text().strip())["attrs"] == {"symbol": "BTCUSDT"}
+
+    summary = tr.latency_summary(10)
+    assert summary["filters"]["n"] == 3 and summary["total"]["n"] == 1
+    assert summary["place_order"]["p95"] >= 0.01
+
+
+def test_span_sem_trace_e_noop():
+    with tr.span("x"):
+        pass
+    assert tr.current_trace() is None
@@ -37,6 +37,21 @@ sys.modules.setdefault("telegram", telegram)
 sys.modules.setdefault("telegram.ext", telegram_ext)
 sys.modules.setdefault("telegram.constants", telegram_constants)
 
+# telegram.error stub (usado pelo despachante de saída)
+telegram_error = types.ModuleType("telegram.error")
+class TelegramError(Exception): pass
+class NetworkError(TelegramError): pass
+class BadRequest(NetworkError): pass
+class TimedOut(NetworkError): pass
+class RetryAfter(TelegramError):
+    def __init__(self, retry_after):
+        super().__init__(f"Flood control exceeded. Retry in {retry_after} seconds")
+        self.retry_after = retry_after
+for _cls in (TelegramError, NetworkError, BadRequest, TimedOut, RetryAfter):
+    setattr(telegram_error, _cls.__name__, _cls)
+telegram.error = telegram_error
+sys.modules.setdefault("telegram.error", telegram_error)
+
 # bot.keyboards stub (para satisfazer "from bot.keyboards import signal_approval_keyboard")
 bot_pkg = types.ModuleType("bot")
 bot_keyboards = types.ModuleType("bot.keyboards")
@@ -204,7 +219,7 @@ async def test_market_flow_calls_place_order(monkeypatch):
 
     monkeypatch.setattr(tm, "place_order", fake_place_order)
     monkeypatch.setattr(tm, "get_account_info", fake_get_account_info)
-    monkeypatch.setattr(tm, "decrypt_data", fake_decrypt)
+    monkeypatch.setattr(tm, "get_user_credentials", lambda u: (fake_decrypt(u.api_key_encrypted), fake_decrypt(u.api_secret_encrypted)))
     monkeypatch.setattr(tm, "Trade", DummyTrade)
 
     await tm.execute_signal_for_all_users(parsed, app, db, source_name="TEST-CHANNEL")
@@ -258,7 +273,7 @@ async def test_limit_short_creates_pending_and_uses_upper_bound(monkeypatch):
     monkeypatch.setattr(tm, "place_order", fake_place_order)  # não deve ser chamado
     monkeypatch.setattr(tm, "place_limit_order", fake_place_limit_order)
     monkeypatch.setattr(tm, "get_account_info", fake_get_account_info)
-    monkeypatch.setattr(tm, "decrypt_data", fake_decrypt)
+    monkeypatch.setattr(tm, "get_user_credentials", lambda u: (fake_decrypt(u.api_key_encrypted), fake_decrypt(u.api_secret_encrypted)))
     monkeypatch.setattr(tm, "PendingSignal", DummyPending)
 
     await tm.execute_signal_for_all_users(parsed, app, db, source_name="TEST-CHANNEL")
@@ -301,7 +316,7 @@ async def test_limit_long_uses_lower_bound(monkeypatch):
 
     monkeypatch.setattr(tm, "place_limit_order", fake_place_limit_order)
     monkeypatch.setattr(tm, "get_account_info", fake_get_account_info)
-    monkeypatch.setattr(tm, "decrypt_data", fake_decrypt)
+    monkeypatch.setattr(tm, "get_user_credentials", lambda u: (fake_decrypt(u.api_key_encrypted), fake_decrypt(u.api_secret_encrypted)))
     monkeypatch.setattr(tm, "PendingSignal", DummyPending)
 
     await tm.execute_signal_for_all_users(parsed, app, db, source_name="TEST-CHANNEL")
@@ -339,7 +354,7 @@ async def test_limit_skips_when_existing_pending(monkeypatch):
     async def fake_get_account_info(api_key, api_secret): return {"success": True, "data": [{"totalEquity": "10"}]}
 
     monkeypatch.setattr(tm, "place_limit_order", fake_place_limit_order)
-    monkeypatch.setattr(tm, "decrypt_data", fake_decrypt)
+    monkeypatch.setattr(tm, "get_user_credentials", lambda u: (fake_decrypt(u.api_key_encrypted), fake_decrypt(u.api_secret_encrypted)))
     monkeypatch.setattr(tm, "get_account_info", fake_get_account_info)
 
     await tm.execute_signal_for_all_users(parsed, app, db, source_name="TEST-CHANNEL")
@@ -378,7 +393,7 @@ async def test_cancel_removes_pending_and_notifies(monkeypatch):
 
     monkeypatch.setattr(tm, "SessionLocal", fake_SessionLocal)
     monkeypatch.setattr(tm, "cancel_order", fake_cancel_order)
-    monkeypatch.setattr(tm, "decrypt_data", fake_decrypt)
+    monkeypatch.setattr(tm, "get_user_credentials", lambda u: (fake_decrypt(u.api_key_encrypted), fake_decrypt(u.api_secret_encrypted)))
 
     parsed_cancel = parse_signal(CANCEL_SIGNAL_XRP)
     assert parsed_cancel and parsed_cancel["type"] == SignalType.CANCELAR
@@ -430,7 +445,7 @@ async def test_market_fails_on_balance_fetch(monkeypatch):
         return {"success": True}
 
     monkeypatch.setattr(tm, "get_account_info", fake_get_account_info)
-    monkeypatch.setattr(tm, "decrypt_data", fake_decrypt)
+    monkeypatch.setattr(tm, "get_user_credentials", lambda u: (fake_decrypt(u.api_key_encrypted), fake_decrypt(u.api_secret_encrypted)))
     monkeypatch.setattr(tm, "place_order", fake_place_order)
 
     await tm.execute_signal_for_all_users(parsed, app, db, source_name="TEST-CHANNEL")
@@ -0,0 +1,42 @@
+import asyncio
+
+import services.wallet_cache as wc
+
+
+def test_cache_dedupe_invalidacao_e_stream(monkeypatch):
+    calls = []
+
+    async def fake_account_info(api_key, api_secret):
+        calls.append(api_key)
+        await asyncio.sleep(0.01)
+        return {"success": True, "data": {"available_balance_usdt": 100.0, "total_equity": 120.0}}
+
+    monkeypatch.setattr(wc, "get_account_info", fake_account_info)
+    wc._WALLETS.clear()
+
+    async def _run():
+        first = await asyncio.gather(*(wc.get_cached_account_info(7, "k", "s") for _ in range(5)))
+        again = await wc.get_cached_account_info(7, "k", "s")
+        wc.invalidate_wallet(7)
+        after = await wc.get_cached_account_info(7, "k", "s")
+        return first, again, after
+
+    first, again, after = asyncio.run(_run())
+    assert len(calls) == 2  # 5 concorrentes + 1 em cache = 1 busca; invalidação = +1
+    assert all(r["data"]["available_balance_usdt"] == 100.0 for r in first + [again, after])
+
+    wc.update_from_stream(7, {"accountType": "UNIFIED", "totalEquity": "50", "coin": [
+        {"coin": "USDT", "walletBalance": "40", "totalOrderIM": "5", "totalPositionIM": "10"}]})
+    res = asyncio.run(wc.get_cached_account_info(7, "k", "s"))
+    assert res["data"]["available_balance_usdt"] == 25.0 and res["data"]["total_equity"] == 50.0
+    assert len(calls) == 2
+
+
+def test_falha_nao_fica_em_cache(monkeypatch):
+    async def failing(api_key, api_secret):
+        return {"success": False, "data": {}, "error": "x"}
+
+    monkeypatch.setattr(wc, "get_account_info", failing)
+    wc._WALLETS.clear()
+    assert not asyncio.run(wc.get_cached_account_info(8, "k", "s"))["success"]
+    assert 8 not in wc._WALLETS
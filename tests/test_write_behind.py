@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import core.position_tracker as pt
+from database.models import Trade
+from database.write_behind import WriteBehindBuffer, commit_deferred, commit_durable
+
+
+def _session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'wb.db'}")
+
+    # pysqlite: deixa o SQLAlchemy controlar BEGIN/SAVEPOINT
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_conn, _rec):
+        dbapi_conn.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    Trade.__table__.create(engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    db.add_all([Trade(user_telegram_id=1, order_id=f"o{i}", symbol=s, side="LONG", qty=1.0, remaining_qty=1.0)
+                for i, s in enumerate(["BTCUSDT", "ETHUSDT"])])
+    db.commit()
+    return Session, db
+
+
+def _status(Session, symbol):
+    other = Session()
+    try:
+        return other.query(Trade).filter(Trade.symbol == symbol).one().status
+    finally:
+        other.close()
+
+
+def test_mark_adia_e_flush_grava_em_um_commit(tmp_path):
+    Session, db = _session(tmp_path)
+    buffer = WriteBehindBuffer(db, max_latency_seconds=60).attach()
+    for t in db.query(Trade).all():
+        t.status = "CLOSED"
+        commit_deferred(db, "teste")
+    assert _status(Session, "BTCUSDT") == "ACTIVE"
+    assert buffer.deferred == 2 and buffer.flushes == 0
+
+    assert buffer.flush() is True
+    assert _status(Session, "BTCUSDT") == "CLOSED"
+    assert buffer.flush() is False  # nada pendente
+    assert buffer.flushes == 1
+
+
+def test_latencia_maxima_e_commit_duravel(tmp_path):
+    Session, db = _session(tmp_path)
+    buffer = WriteBehindBuffer(db, max_latency_seconds=0).attach()
+    t = db.query(Trade).filter(Trade.symbol == "BTCUSDT").one()
+    t.status = "CLOSED_PROFIT"
+    commit_deferred(db, "estourou")
+    assert _status(Session, "BTCUSDT") == "CLOSED_PROFIT" and buffer.flushes == 1
+
+    buffer.max_latency = 60
+    t.status = "CLOSED_LOSS"
+    commit_durable(db, "corretora")
+    assert _status(Session, "BTCUSDT") == "CLOSED_LOSS" and buffer.durable_commits == 1
+
+    buffer.detach()
+    t.status = "ACTIVE"
+    commit_deferred(db, "sem buffer")  # fora do buffer: commit direto
+    assert _status(Session, "BTCUSDT") == "ACTIVE"
+
+
+def test_falha_no_fechamento_nao_descarta_mutacoes_adiadas(monkeypatch, tmp_path):
+    Session, db = _session(tmp_path)
+    buffer = WriteBehindBuffer(db, max_latency_seconds=60).attach()
+    btc, eth = (db.query(Trade).filter(Trade.symbol == s).one() for s in ("BTCUSDT", "ETHUSDT"))
+    btc.status = "CLOSED_PROFIT"
+    commit_deferred(db, "adiado")
+
+    def _boom(*a):
+        raise RuntimeError("falha ao agendar")
+    monkeypatch.setattr(pt, "schedule_trade_card_deletion", _boom)
+    forgotten = []
+    monkeypatch.setattr(pt, "forget_trade", forgotten.append)
+    user = SimpleNamespace(telegram_id=1)
+    assert pt._persist_confirmed_close(db, user, eth, {"pnl": 3.0, "exit_type": "TakeProfit"}) is False
+
+    assert eth.status == "ACTIVE"  # só o SAVEPOINT foi desfeito
+    assert forgotten == []  # contadores do breaker seguem com o trade ativo
+    buffer.flush()
+    assert _status(Session, "BTCUSDT") == "CLOSED_PROFIT"
+    assert _status(Session, "ETHUSDT") == "ACTIVE"
@@ -1,3 +1,9 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
 from cryptography.fernet import Fernet
 from .config import ENCRYPTION_KEY
 
@@ -16,4 +22,84 @@ def decrypt_data(encrypted_data: str) -> str:
     if not encrypted_data:
         return None
     decrypted_bytes = cipher_suite.decrypt(encrypted_data.encode())
-    return decrypted_bytes.decode()
\ No newline at end of file
+    return decrypted_bytes.decode()
+
+
+# --- Cache de credenciais descriptografadas ---
+# Chave: (telegram_id, sha256 do texto cifrado). Se o usuário trocar a chave, o
+# hash muda e a entrada antiga nunca mais é usada; invalidate_user_credentials()
+# a remove na hora. Com TF_CREDENTIAL_ZEROIZE=1 os valores ficam em bytearray e
+# são zerados ao sair do cache (as str devolvidas aos chamadores são cópias).
+try:
+    _CRED_CACHE_SIZE = max(1, int(os.getenv("TF_CREDENTIAL_CACHE_SIZE", "1024") or "1024"))
+except Exception:
+    _CRED_CACHE_SIZE = 1024
+_CRED_ZEROIZE = (os.getenv("TF_CREDENTIAL_ZEROIZE", "1") or "1").strip().lower() in ("1", "true", "yes", "on")
+
+_CRED_CACHE: "OrderedDict[Tuple[int, str], bytearray]" = OrderedDict()
+_CRED_LOCK = threading.Lock()
+_CRED_STATS: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _ciphertext_hash(encrypted_data: str) -> str:
+    return hashlib.sha256(encrypted_data.encode()).hexdigest()
+
+
+def _evict(key: Tuple[int, str]) -> None:
+    value = _CRED_CACHE.pop(key, None)
+    if value is None:
+        return
+    _CRED_STATS["evictions"] += 1
+    if _CRED_ZEROIZE:
+        for i in range(len(value)):
+            value[i] = 0
+
+
+def decrypt_cached(owner_id: int, encrypted_data: str) -> Optional[str]:
+    """decrypt_data() com cache por (usuário, hash do texto cifrado)."""
+    if not encrypted_data:
+        return None
+    key = (owner_id, _ciphertext_hash(encrypted_data))
+    with _CRED_LOCK:
+        value = _CRED_CACHE.get(key)
+        if value is not None:
+            _CRED_CACHE.move_to_end(key)
+            _CRED_STATS["hits"] += 1
+            return value.decode()
+
+    plain = decrypt_data(encrypted_data)
+    with _CRED_LOCK:
+        _CRED_STATS["misses"] += 1
+        _CRED_CACHE[key] = bytearray(plain.encode())
+        _CRED_CACHE.move_to_end(key)
+        while len(_CRED_CACHE) > _CRED_CACHE_SIZE:
+            _evict(next(iter(_CRED_CACHE)))
+    return plain
+
+
+def get_user_credentials(user) -> Tuple[Optional[str], Optional[str]]:
+    """Retorna (api_key, api_secret) do usuário, descriptografando só na primeira vez."""
+    owner_id = getattr(user, "telegram_id", None)
+    return (
+        decrypt_cached(owner_id, getattr(user, "api_key_encrypted", None)),
+        decrypt_cached(owner_id, getattr(user, "api_secret_encrypted", None)),
+    )
+
+
+def invalidate_user_credentials(owner_id: int) -> int:
+    """Remove (e zera) as credenciais em cache do usuário. Retorna quantas entradas saíram."""
+    with _CRED_LOCK:
+        keys = [k for k in _CRED_CACHE if k[0] == owner_id]
+        for k in keys:
+            _evict(k)
+    return len(keys)
+
+
+def credential_cache_stats(reset: bool = False) -> Dict[str, int]:
+    """Contadores do cache (hits = decrypts evitados). reset=True zera após ler."""
+    with _CRED_LOCK:
+        snapshot = dict(_CRED_STATS, size=len(_CRED_CACHE))
+        if reset:
+            for k in _CRED_STATS:
+                _CRED_STATS[k] = 0
+    return snapshot
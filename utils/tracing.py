@@ -0,0 +1,149 @@
+"""
+Rastreamento de latência de sinais, da mensagem no Telegram ao ack da Bybit.
+
+Um SignalTrace nasce no signal_listener (com o horário da mensagem), viaja na
+comm_queue junto com o pedido e fica num ContextVar enquanto o sinal é
+processado. As tarefas do fan-out e as chamadas em asyncio.to_thread herdam o
+contexto, então span() funciona em qualquer camada sem mudar assinaturas; sem
+trace ativo, span() não faz nada.
+
+Etapas: telegram (envio -> recebimento), parse, queue, eligibility, prewarm e,
+por usuário, filters, sizing, set_leverage, place_order e fill_confirm.
+Traces finalizados vão para TF_TRACE_FILE (uma linha JSON por sinal) e ficam
+em memória para o resumo p50/p95 do /latency (admin).
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_TRACE_FILE = (os.getenv("TF_TRACE_FILE", "/data/signal_traces.jsonl") or "").strip()
+try:
+    _KEEP = max(1, int(os.getenv("TF_TRACE_KEEP", "200") or "200"))
+except Exception:
+    _KEEP = 200
+
+_RECENT: Deque[Dict[str, Any]] = deque(maxlen=_KEEP)
+_WRITE_LOCK = threading.Lock()
+_write_failed = False
+
+
+class SignalTrace:
+    __slots__ = ("trace_id", "source", "message_id", "started_at", "t0", "spans", "attrs")
+
+    def __init__(self, source: str, message_id: Optional[int] = None, message_date: Optional[datetime] = None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.source = source
+        self.message_id = message_id
+        self.started_at = time.time()
+        self.t0 = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.attrs: Dict[str, Any] = {}
+        if message_date is not None:
+            try:
+                lag = self.started_at - message_date.timestamp()
+                self.spans.append({"name": "telegram", "start": -lag, "dur": lag})
+            except Exception:
+                pass
+
+    def add_span(self, name: str, began: float, ended: float, **attrs) -> None:
+        """began/ended em time.perf_counter()."""
+        span = {"name": name, "start": round(began - self.t0, 6), "dur": round(ended - began, 6)}
+        if attrs:
+            span.update(attrs)
+        self.spans.append(span)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "source": self.source,
+            "message_id": self.message_id,
+            "started_at": self.started_at,
+            "total": round(time.perf_counter() - self.t0, 6),
+            "attrs": self.attrs,
+            "spans": list(self.spans),
+        }
+
+
+_CURRENT: ContextVar[Optional[SignalTrace]] = ContextVar("tf_signal_trace", default=None)
+
+
+def start_trace(source: str, message_id: Optional[int] = None, message_date: Optional[datetime] = None) -> SignalTrace:
+    return SignalTrace(source, message_id, message_date)
+
+
+def activate(trace: Optional[SignalTrace]):
+    return _CURRENT.set(trace)
+
+
+def deactivate(token) -> None:
+    _CURRENT.reset(token)
+
+
+def current_trace() -> Optional[SignalTrace]:
+    return _CURRENT.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Mede o bloco e registra no trace ativo (no-op sem trace)."""
+    trace = _CURRENT.get()
+    if trace is None:
+        yield
+        return
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, began, time.perf_counter(), **attrs)
+
+
+def finish_trace(trace: Optional[SignalTrace], **attrs) -> Optional[Dict[str, Any]]:
+    """Fecha o trace: guarda no histórico em memória e grava uma linha no JSONL."""
+    global _write_failed
+    if trace is None:
+        return None
+    trace.attrs.update(attrs)
+    record = trace.to_dict()
+    _RECENT.append(record)
+    if _TRACE_FILE and not _write_failed:
+        try:
+            with _WRITE_LOCK, open(_TRACE_FILE, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            _write_failed = True  # avisa uma vez; o histórico em memória continua
+            logger.warning("[trace] não foi possível gravar %s: %s", _TRACE_FILE, e)
+    return record
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def latency_summary(last_n: Optional[int] = None) -> Dict[str, Dict[str, float]]:
+    """p50/p95/máx por etapa (segundos) sobre os últimos N sinais; spans por usuário entram todos."""
+    traces = list(_RECENT)[-last_n:] if last_n else list(_RECENT)
+    by_stage: Dict[str, List[float]] = {}
+    for t in traces:
+        for s in t["spans"]:
+            by_stage.setdefault(s["name"], []).append(float(s["dur"]))
+        by_stage.setdefault("total", []).append(float(t["total"]))
+    return {
+        name: {"n": len(v), "p50": _percentile(v, 50), "p95": _percentile(v, 95), "max": max(v)}
+        for name, v in by_stage.items()
+    }
+
+
+def recent_traces_count() -> int:
+    return len(_RECENT)